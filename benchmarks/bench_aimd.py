@@ -0,0 +1,55 @@
+"""Kiểm tra AIMD của BackendPool với request nhiều cỡ khác nhau (không cần server)
+
+Chạy từ thư mục gốc của project:
+
+    python -m benchmarks.bench_aimd
+
+Mô phỏng một endpoint TTS nhận xen kẽ hook ngắn và KB dài, một endpoint Whisper nhận
+audio từ vài giây tới cả chục phút, latency tỉ lệ với kích thước và có nhiễu. Backend
+khỏe thì giới hạn song song phải giữ ở max_concurrency; khi backend thật sự chậm đi
+(cùng cỡ request nhưng latency gấp nhiều lần) thì giới hạn phải giảm.
+"""
+import argparse
+import random
+from common.services.backend_pool import Endpoint
+
+TOLERANCE = 3.0
+
+def _simulate(endpoint: Endpoint, requests, slowdown: float = 1.0):
+    for path, size, latency in requests:
+        endpoint.on_success(latency * slowdown, TOLERANCE, 0, path, size)
+
+def _tts_requests(rng: random.Random, count: int):
+    for _ in range(count):
+        # Hook ~300 byte text, KB 5-40 KB text; khoảng 1s overhead + 2ms mỗi byte
+        size = rng.randint(200, 400) if rng.random() < 0.5 else rng.randint(5000, 40000)
+        yield "/tts", size, (1 + 0.002 * size) * rng.uniform(0.8, 1.3)
+
+def _whisper_requests(rng: random.Random, count: int):
+    for _ in range(count):
+        # WAV 24 kHz mono 16-bit: 48 KB mỗi giây audio, 5s tới 15 phút
+        seconds = rng.uniform(5, 900)
+        yield "/to_srt/", int(seconds * 48000), (2 + 0.15 * seconds) * rng.uniform(0.8, 1.3)
+
+def main():
+    parser = argparse.ArgumentParser(description="AIMD check with mixed request sizes")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for name, generate in (("tts", _tts_requests), ("whisper", _whisper_requests)):
+        endpoint = Endpoint(f"http://{name}", limit=4)
+        _simulate(endpoint, generate(rng, args.requests))
+        assert endpoint.capacity == endpoint.max_limit, \
+            f"{name}: healthy mixed-size traffic collapsed limit to {endpoint.capacity}"
+
+        _simulate(endpoint, generate(rng, 50), slowdown=5.0)
+        assert endpoint.capacity < endpoint.max_limit, f"{name}: 5x slowdown did not reduce the limit"
+        print(f"{name}: limit {endpoint.max_limit} under mixed sizes, "
+              f"{endpoint.capacity} after 5x slowdown, {len(endpoint.latency)} latency baselines")
+
+    print("aimd mixed-size check: ok")
+
+if __name__ == "__main__":
+    main()
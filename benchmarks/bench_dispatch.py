@@ -0,0 +1,198 @@
+"""Đo độ trễ dispatch của JobManager khi bảng jobs đã có nhiều job cũ
+
+Chạy từ thư mục gốc của project:
+
+    python -m benchmarks.bench_dispatch --history 100000 --jobs 500
+    python -m benchmarks.bench_dispatch --compare
+
+--compare chạy lần lượt: SQLite mặc định không index, SQLite mặc định có index,
+profile tuned (WAL + pragma + pool) có index, mỗi lần một process riêng vì
+engine được tạo lúc import common.database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PROFILES = [
+    ("default, no indexes", {"SQLITE_TUNING": "0"}, ["--no-indexes"]),
+    ("default + indexes", {"SQLITE_TUNING": "0"}, []),
+    ("tuned + indexes", {"SQLITE_TUNING": "1"}, []),
+]
+
+def _percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+def _summary(values):
+    return {
+        "p50_ms": round(_percentile(values, 50) * 1000, 3),
+        "p95_ms": round(_percentile(values, 95) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+        "mean_ms": round(statistics.mean(values) * 1000, 3) if values else 0.0
+    }
+
+def _seed_history(engine, Job, JobStatus, count: int, channels: int):
+    """Insert nhanh các job đã COMPLETED/ERROR để giả lập DB chạy lâu ngày"""
+    now = datetime.utcnow()
+    batch = []
+    with engine.begin() as conn:
+        for i in range(count):
+            created = now - timedelta(seconds=count - i)
+            batch.append({
+                "workflow_name": f"workflow{i % 3 + 1}",
+                "file_path": f"/history/{i}.txt",
+                "channel_name": f"C{i % channels}",
+                "status": JobStatus.ERROR if i % 50 == 0 else JobStatus.COMPLETED,
+                "priority": 1,
+                "created_at": created,
+                "started_at": created,
+                "completed_at": created + timedelta(seconds=5),
+                "processing_order": created.timestamp() - 10000,
+                "attempts": 0
+            })
+            if len(batch) >= 10000:
+                conn.execute(Job.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(Job.__table__.insert(), batch)
+
+async def _run(args) -> dict:
+    from sqlalchemy import text
+    from common.database import engine, init_db, run_db
+    from common.models.job import Job, JobStatus
+    from common.services.job_manager import JobManager
+
+    init_db()
+    if args.no_indexes:
+        with engine.begin() as conn:
+            for index in Job.__table__.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    started = time.perf_counter()
+    _seed_history(engine, Job, JobStatus, args.history, args.channels)
+    seed_time = time.perf_counter() - started
+
+    manager = await JobManager.get_instance()
+    manager.configure(
+        num_workers=args.workers,
+        default_workflow_concurrency=args.workers,
+        default_channel_concurrency=args.workers,
+        reap_interval=0
+    )
+
+    submitted = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def handler(file_path: str, channel_name: str):
+        latencies.append(time.perf_counter() - submitted[file_path])
+        if len(latencies) >= args.jobs:
+            done.set()
+        return {}
+
+    manager.register_workflow_handler("bench", handler)
+
+    started = time.perf_counter()
+    await manager.start()
+    startup_time = time.perf_counter() - started
+
+    add_times = []
+    started = time.perf_counter()
+    for i in range(args.jobs):
+        file_path = f"/bench/{i}.txt"
+        submitted[file_path] = time.perf_counter()
+        await manager.add_job("bench", file_path, f"C{random.randrange(args.channels)}")
+        add_times.append(time.perf_counter() - submitted[file_path])
+    await asyncio.wait_for(done.wait(), timeout=600)
+    total_time = time.perf_counter() - started
+
+    status_times = []
+    for _ in range(200):
+        t0 = time.perf_counter()
+        await manager.get_job_status(random.randint(1, args.history + args.jobs))
+        status_times.append(time.perf_counter() - t0)
+
+    reap_times = []
+    for _ in range(20):
+        t0 = time.perf_counter()
+        await run_db(manager._reap_expired_leases)
+        reap_times.append(time.perf_counter() - t0)
+
+    await manager.stop()
+    journal_mode = engine.execute(text("PRAGMA journal_mode")).scalar()
+
+    return {
+        "history": args.history,
+        "jobs": args.jobs,
+        "journal_mode": journal_mode,
+        "indexes": not args.no_indexes,
+        "seed_s": round(seed_time, 2),
+        "startup_ms": round(startup_time * 1000, 2),
+        "jobs_per_s": round(args.jobs / total_time, 1),
+        "add_job": _summary(add_times),
+        "dispatch": _summary(latencies),
+        "get_job_status": _summary(status_times),
+        "reap_scan": _summary(reap_times)
+    }
+
+def _compare(args):
+    for name, env, extra in PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            cmd = [
+                sys.executable, "-m", "benchmarks.bench_dispatch", "--json",
+                "--history", str(args.history), "--jobs", str(args.jobs),
+                "--workers", str(args.workers), "--channels", str(args.channels),
+                "--db", os.path.join(tmp, "bench.db")
+            ] + extra
+            output = subprocess.run(
+                cmd, env={**os.environ, **env}, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{name:22} journal={result['journal_mode']:7} startup={result['startup_ms']:8.1f}ms "
+                f"dispatch p50={result['dispatch']['p50_ms']:7.2f}ms p95={result['dispatch']['p95_ms']:7.2f}ms "
+                f"status p95={result['get_job_status']['p95_ms']:6.2f}ms "
+                f"reap p95={result['reap_scan']['p95_ms']:7.2f}ms {result['jobs_per_s']:7.1f} jobs/s"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description="JobManager dispatch latency benchmark")
+    parser.add_argument("--history", type=int, default=100000, help="số job cũ có sẵn trong bảng")
+    parser.add_argument("--jobs", type=int, default=500, help="số job mới được dispatch")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--db", help="file SQLite dùng cho benchmark (mặc định file tạm)")
+    parser.add_argument("--no-indexes", action="store_true", help="bỏ các index của bảng jobs")
+    parser.add_argument("--compare", action="store_true", help="so sánh các profile SQLite")
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        _compare(args)
+        return
+
+    tmp = None
+    if not args.db:
+        tmp = tempfile.TemporaryDirectory()
+        args.db = os.path.join(tmp.name, "bench.db")
+    # DATABASE_URL phải được set trước khi import common.database
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+
+    result = asyncio.run(_run(args))
+    print(json.dumps(result) if args.json else json.dumps(result, indent=2))
+    if tmp:
+        tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
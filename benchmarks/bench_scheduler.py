@@ -0,0 +1,213 @@
+"""Mô phỏng scheduler của JobManager trên các trace job tổng hợp (không cần DB)
+
+Chạy từ thư mục gốc của project:
+
+    python -m benchmarks.bench_scheduler
+    python -m benchmarks.bench_scheduler --trace high_burst --hours 12 --seed 7
+
+Mỗi trace sinh job theo quá trình Poisson với tỉ lệ priority, channel và deadline
+khác nhau; mô phỏng sự kiện rời rạc dùng đúng JobQueue và giới hạn lane như
+JobManager rồi so sánh thời gian chờ theo priority, deadline bị trễ và phần
+throughput của từng channel giữa các scheduler.
+"""
+import argparse
+import heapq
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from common.services.job_queue import JobQueue, QueuedJob
+from common.services.scheduler import AgingScheduler, Scheduler, StaticScheduler, naive_utc, utc_timestamp
+
+PRIORITY_NAMES = {0: "LOW", 1: "NORMAL", 2: "HIGH"}
+
+# name -> danh sách phase (thời lượng giây, job/giờ, tỉ lệ LOW/NORMAL/HIGH, tỉ lệ job có deadline)
+TRACES = {
+    "steady": [
+        (1.0, 40, (0.3, 0.5, 0.2), 0.1),
+    ],
+    "high_burst": [
+        (0.25, 30, (0.3, 0.6, 0.1), 0.1),
+        (0.5, 60, (0.05, 0.05, 0.9), 0.0),   # HIGH liên tục vượt quá năng lực xử lý
+        (0.25, 30, (0.3, 0.6, 0.1), 0.1),
+    ],
+    "deadlines": [
+        (1.0, 45, (0.2, 0.6, 0.2), 0.4),
+    ],
+}
+
+def generate_trace(name: str, hours: float, channels: List[str], seed: int,
+                   channel_skew: float) -> List[Dict]:
+    """Sinh danh sách job (arrival, priority, channel, service, deadline)"""
+    rng = random.Random(seed)
+    # Channel đầu tiên gửi nhiều job hơn các channel khác (channel_skew lần)
+    channel_weights = [channel_skew] + [1.0] * (len(channels) - 1)
+    jobs = []
+    start = 0.0
+    for share, per_hour, mix, deadline_ratio in TRACES[name]:
+        end = start + share * hours * 3600
+        t = start
+        while True:
+            t += rng.expovariate(per_hour / 3600)
+            if t >= end:
+                break
+            priority = rng.choices([0, 1, 2], weights=mix)[0]
+            service = rng.uniform(60, 300)
+            deadline = None
+            if rng.random() < deadline_ratio:
+                deadline = t + rng.uniform(1800, 4 * 3600)
+            jobs.append({
+                "id": len(jobs) + 1,
+                "arrival": t,
+                "priority": priority,
+                "channel": rng.choices(channels, weights=channel_weights)[0],
+                "service": service,
+                "deadline": deadline
+            })
+        start = end
+    return jobs
+
+def simulate(scheduler: Scheduler, jobs: List[Dict], workers: int,
+             channel_limit: int) -> Dict:
+    """Mô phỏng sự kiện rời rạc: job đến, worker rảnh thì claim theo scheduler"""
+    queue = JobQueue()
+    running: Dict[Tuple[str, str], int] = defaultdict(int)
+    free_workers = workers
+    completions: List[Tuple[float, int, Tuple[str, str]]] = []
+    results = {}
+    by_id = {job["id"]: job for job in jobs}
+    arrivals = sorted(jobs, key=lambda job: job["arrival"])
+    next_arrival = 0
+    now = 0.0
+
+    def lane_available(workflow_name: str, channel_name: str) -> bool:
+        return running[(workflow_name, channel_name)] < channel_limit
+
+    def dispatch():
+        nonlocal free_workers
+        while free_workers:
+            entry = queue.pop_next(lane_available, lambda heads: scheduler.select(heads, now))
+            if not entry:
+                return
+            job = by_id[entry.id]
+            free_workers -= 1
+            running[entry.lane] += 1
+            results[entry.id] = {"start": now, "end": now + job["service"]}
+            heapq.heappush(completions, (now + job["service"], entry.id, entry.lane))
+
+    while next_arrival < len(arrivals) or completions:
+        arrival_time = arrivals[next_arrival]["arrival"] if next_arrival < len(arrivals) else float("inf")
+        completion_time = completions[0][0] if completions else float("inf")
+
+        if completion_time <= arrival_time:
+            now, _, lane = heapq.heappop(completions)
+            running[lane] -= 1
+            free_workers += 1
+        else:
+            job = arrivals[next_arrival]
+            next_arrival += 1
+            now = job["arrival"]
+            queue.push(QueuedJob(
+                job["id"],
+                scheduler.order_key(job["arrival"], job["priority"], job["deadline"]),
+                "bench", job["channel"], f"{job['id']}.txt"
+            ))
+        dispatch()
+
+    return results
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def report(name: str, jobs: List[Dict], results: Dict):
+    waits = defaultdict(list)
+    per_channel = defaultdict(int)
+    late = with_deadline = 0
+    horizon = max(job["arrival"] for job in jobs)
+    for job in jobs:
+        result = results[job["id"]]
+        waits[job["priority"]].append((result["start"] - job["arrival"]) / 60)
+        if result["end"] <= horizon:
+            per_channel[job["channel"]] += 1
+        if job["deadline"] is not None:
+            with_deadline += 1
+            late += result["end"] > job["deadline"]
+
+    print(f"  {name}")
+    for priority in sorted(waits):
+        values = waits[priority]
+        print(
+            f"    {PRIORITY_NAMES[priority]:6} n={len(values):4} wait min: "
+            f"mean={sum(values) / len(values):7.1f} p95={_percentile(values, 95):7.1f} "
+            f"max={max(values):7.1f}"
+        )
+    if with_deadline:
+        print(f"    deadline missed: {late}/{with_deadline} ({100 * late / with_deadline:.1f}%)")
+    total = sum(per_channel.values()) or 1
+    shares = ", ".join(f"{ch}={100 * n / total:.0f}%" for ch, n in sorted(per_channel.items()))
+    print(f"    completed share before last arrival: {shares}")
+
+def check_deadline_timezones():
+    """Deadline có timezone (từ API) và deadline naive UTC tương đương phải cho cùng processing_order,
+    kể cả khi máy không chạy ở UTC (kiểm tra với TZ UTC+7 nếu đổi được)"""
+    old_tz = os.environ.get("TZ")
+    if hasattr(time, "tzset"):
+        os.environ["TZ"] = "ICT-7"  # UTC+7, dạng POSIX không cần tzdata
+        time.tzset()
+    try:
+        scheduler = AgingScheduler()
+        created = utc_timestamp()
+        naive = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0) + timedelta(hours=2)
+        aware = naive.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=7)))
+        assert naive_utc(aware) == naive
+        assert scheduler.order_key(created, 1, naive_utc(aware)) == scheduler.order_key(created, 1, naive)
+        assert scheduler.order_key(created, 1, aware) == scheduler.order_key(created, 1, naive)
+        # "now" phải là epoch thật, không lệch theo timezone của máy
+        assert abs(utc_timestamp() - time.time()) < 1
+    finally:
+        if hasattr(time, "tzset"):
+            if old_tz is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = old_tz
+            time.tzset()
+    print("deadline timezone check: ok")
+
+def main():
+    parser = argparse.ArgumentParser(description="JobManager scheduler simulation")
+    parser.add_argument("--trace", choices=sorted(TRACES) + ["all"], default="all")
+    parser.add_argument("--hours", type=float, default=8)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--channel-skew", type=float, default=3.0,
+                        help="channel C0 gửi nhiều job gấp bao nhiêu lần channel khác")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--channel-limit", type=int, default=1)
+    parser.add_argument("--priority-boost", type=float, default=1800)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    check_deadline_timezones()
+    channels = [f"C{i}" for i in range(args.channels)]
+    schedulers = [
+        ("static (created - priority*10000)", StaticScheduler()),
+        (f"aging (boost={args.priority_boost:g}s)", AgingScheduler(priority_boost=args.priority_boost)),
+        ("aging + weight C0=0.5", AgingScheduler(
+            priority_boost=args.priority_boost, channel_weights={"C0": 0.5}
+        )),
+    ]
+
+    traces = sorted(TRACES) if args.trace == "all" else [args.trace]
+    for trace in traces:
+        jobs = generate_trace(trace, args.hours, channels, args.seed, args.channel_skew)
+        print(f"trace={trace} jobs={len(jobs)} hours={args.hours:g} workers={args.workers}")
+        for name, scheduler in schedulers:
+            report(name, jobs, simulate(scheduler, jobs, args.workers, args.channel_limit))
+        print()
+
+if __name__ == "__main__":
+    main()
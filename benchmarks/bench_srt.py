@@ -0,0 +1,151 @@
+"""So sánh tạo SRT từ script (srt_mode "aligned") với Whisper trên audio giả lập TTS
+
+Chạy từ thư mục gốc của project:
+
+    python -m benchmarks.bench_srt --minutes 20
+    python -m benchmarks.bench_srt --minutes 5 --whisper-url http://localhost:5004
+
+Audio được sinh với word timing đã biết (mỗi từ một đoạn tiếng dài theo số ký tự,
+nghỉ theo dấu câu) và chia chunk giống TTS theo chunk. Đo thời gian chạy và sai
+số thời điểm bắt đầu từ so với ground truth. Có --whisper-url thì gửi cùng file
+tới /to_srt/ (words_per_segment=1) để so sánh; Whisper server phải đọc được file
+trong thư mục tạm.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import wave
+from typing import Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+from common.utils.aligned_srt import align_script
+from common.utils.srt_builder import build_cues, words_from_srt
+from common.utils.wav_utils import split_text, stitch_wavs
+
+SAMPLE_RATE = 24000
+VOCABULARY = ("the market opened higher today as investors weighed new data on inflation "
+              "and jobs while central banks signalled patience about future rate cuts").split()
+PAUSES = {",": 0.22, ".": 0.45, "?": 0.45}
+
+def generate_script(words: int, seed: int) -> str:
+    """Script giả gồm nhiều đoạn, câu 8-18 từ, có dấu phẩy"""
+    rng = random.Random(seed)
+    paragraphs, sentences, sentence = [], [], []
+    target = rng.randint(8, 18)
+    for index in range(words):
+        word = rng.choice(VOCABULARY)
+        if len(sentence) == target // 2 and rng.random() < 0.5:
+            word += ","
+        sentence.append(word)
+        if len(sentence) >= target or index == words - 1:
+            sentence[-1] = sentence[-1].rstrip(",") + rng.choice(".....?")
+            sentences.append(" ".join(sentence).capitalize())
+            sentence, target = [], rng.randint(8, 18)
+            if len(sentences) >= rng.randint(3, 6):
+                paragraphs.append(" ".join(sentences))
+                sentences = []
+    if sentences:
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+def render_chunk(text: str, path: str, rng: random.Random) -> List[Dict]:
+    """Sinh WAV cho một chunk: tone + nhiễu cho mỗi từ, im lặng giữa từ/câu; trả về word timing thật"""
+    pieces, truth, position = [], [], 0.0
+    for word in text.split():
+        duration = 0.06 * len(word.strip(",.?")) + rng.uniform(0.05, 0.12)
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        tone = 0.3 * np.sin(2 * np.pi * rng.uniform(120, 260) * t) + 0.05 * np.random.randn(len(t))
+        pieces.append(tone)
+        truth.append({"word": word, "start": position, "end": position + duration})
+        position += duration
+        gap = PAUSES.get(word[-1], rng.uniform(0.02, 0.06))
+        pieces.append(0.002 * np.random.randn(int(gap * SAMPLE_RATE)))
+        position += gap
+    samples = np.clip(np.concatenate(pieces), -1, 1)
+    with wave.open(path, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        out.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return truth
+
+def build_audio(script: str, work_dir: str, chunk_chars: int, silence_ms: int, seed: int) -> Tuple[str, List[Dict], List[Dict]]:
+    """Audio đã nối theo chunk, timing chunk và word timing thật trên toàn file"""
+    rng = random.Random(seed)
+    np.random.seed(seed)
+    chunk_texts = split_text(script, chunk_chars)
+    chunk_files, chunk_truths = [], []
+    for index, text in enumerate(chunk_texts):
+        path = os.path.join(work_dir, f"chunk_{index:04d}.wav")
+        chunk_truths.append(render_chunk(text, path, rng))
+        chunk_files.append(path)
+
+    wav_file = os.path.join(work_dir, "audio.wav")
+    offsets = stitch_wavs(chunk_files, wav_file, silence_ms)
+    chunks = [{"index": i, "text": t, "start": s, "end": e} for i, (t, (s, e)) in enumerate(zip(chunk_texts, offsets))]
+    truth = [
+        {**word, "start": word["start"] + start, "end": word["end"] + start}
+        for (start, _), words in zip(offsets, chunk_truths) for word in words
+    ]
+    return wav_file, chunks, truth
+
+def start_errors(words: List[Dict], truth: List[Dict]) -> List[float]:
+    """Sai số (ms) thời điểm bắt đầu từng từ, chỉ so khi số từ khớp"""
+    if len(words) != len(truth):
+        raise ValueError(f"word count differs: {len(words)} vs {len(truth)}")
+    return [abs(w["start"] - t["start"]) * 1000 for w, t in zip(words, truth)]
+
+def report(name: str, seconds: float, errors: List[float], cues: int):
+    errors = sorted(errors)
+    print(f"  {name:8} time={seconds * 1000:9.1f}ms cues={cues:5} start error ms: "
+          f"mean={statistics.mean(errors):6.1f} p95={errors[int(len(errors) * 0.95)]:6.1f} max={errors[-1]:6.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Aligned SRT vs Whisper benchmark")
+    parser.add_argument("--minutes", type=float, default=20, help="độ dài audio xấp xỉ")
+    parser.add_argument("--chunk-chars", type=int, default=1500)
+    parser.add_argument("--silence-ms", type=int, default=250)
+    parser.add_argument("--words-per-segment", type=int, default=2)
+    parser.add_argument("--max-chars", type=int, default=80)
+    parser.add_argument("--whisper-url", default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    script = generate_script(int(args.minutes * 150), args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        wav_file, chunks, truth = build_audio(script, work_dir, args.chunk_chars, args.silence_ms, args.seed)
+        print(f"audio={truth[-1]['end'] / 60:.1f}min words={len(truth)} chunks={len(chunks)}")
+
+        started = time.perf_counter()
+        words = align_script(wav_file, script, chunks)
+        cues = build_cues(words, args.words_per_segment, args.max_chars)
+        report("aligned", time.perf_counter() - started, start_errors(words, truth), len(cues))
+
+        started = time.perf_counter()
+        words = align_script(wav_file, script)
+        cues = build_cues(words, args.words_per_segment, args.max_chars)
+        report("no-chunk", time.perf_counter() - started, start_errors(words, truth), len(cues))
+
+        if args.whisper_url:
+            started = time.perf_counter()
+            response = httpx.post(f"{args.whisper_url}/to_srt/", json={
+                "file_path": wav_file, "output_path": work_dir, "filename": "whisper",
+                "words_per_segment": 1, "max_chars": 1000
+            }, timeout=3600)
+            response.raise_for_status()
+            with open(os.path.join(work_dir, "whisper.srt"), 'r', encoding='utf-8') as f:
+                words = words_from_srt(f.read())
+            cues = build_cues(words, args.words_per_segment, args.max_chars)
+            elapsed = time.perf_counter() - started
+            try:
+                report("whisper", elapsed, start_errors(words, truth), len(cues))
+            except ValueError as e:
+                print(f"  whisper  time={elapsed * 1000:9.1f}ms cues={len(cues):5} ({e})")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import json
 from typing import Dict, List
 from pathlib import Path
+from common.config.settings import CONFIG_PATH, load_config
 
 class BasePathConfig:
     """Base configuration for paths that all workflows will inherit from"""
@@ -13,14 +14,12 @@ class BasePathConfig:
         
     def _load_config(self):
         """Load config from config.json"""
-        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config.json')
-        
-        if not os.path.exists(config_path):
-            raise ValueError(f"Config file not found at {config_path}")
-            
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            
+        if not os.path.exists(CONFIG_PATH):
+            raise ValueError(f"Config file not found at {CONFIG_PATH}")
+
+        config = load_config()
+        self.config = config
+
         self.ROOT_PATH = config['root_path']
         self.api_urls = config['api_urls']
         
@@ -0,0 +1,20 @@
+import os
+import json
+from typing import Dict, Any
+
+# config.json nằm ở thư mục gốc của project
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config.json')
+
+def load_config() -> Dict[str, Any]:
+    """Load toàn bộ config.json, trả về dict rỗng nếu chưa có file"""
+    if not os.path.exists(CONFIG_PATH):
+        return {}
+
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_section(name: str, defaults: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Lấy một section trong config.json, merge với giá trị mặc định"""
+    section = dict(defaults or {})
+    section.update(load_config().get(name, {}) or {})
+    return section
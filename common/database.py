@@ -1,18 +1,99 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./workflow.db")
-engine = create_engine(DATABASE_URL)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Profile cho SQLite, tắt bằng SQLITE_TUNING=0 để quay về mặc định của driver
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1") != "0"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
+def _create_engine():
+    if not IS_SQLITE or not SQLITE_TUNING or ":memory:" in DATABASE_URL:
+        return create_engine(DATABASE_URL)
+
+    # SQLAlchemy 1.4 mặc định NullPool cho SQLite file (mở connection mới mỗi lần),
+    # giữ lại connection để pragma và mmap không phải thiết lập lại
+    sqlite_engine = create_engine(
+        DATABASE_URL,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_SIZE,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000
+        }
+    )
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL: reader không chặn writer, nhiều process dùng chung file DB
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    return sqlite_engine
+
+engine = _create_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+T = TypeVar("T")
+
+# Mọi truy vấn từ code async chạy trên thread riêng để không chặn event loop.
+# SQLite chỉ cho một writer nên mặc định một thread; DB khác có thể tăng qua DB_EXECUTOR_WORKERS
+DB_EXECUTOR_WORKERS = int(os.getenv(
+    "DB_EXECUTOR_WORKERS", "1" if IS_SQLITE else "4"
+))
+_db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def _call_with_session(fn: Callable[[Session], T]) -> T:
+    db = SessionLocal()
+    try:
+        return fn(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_db(fn: Callable[[Session], T]) -> T:
+    """Chạy fn(session) trên DB executor thread và await kết quả
+
+    Session được tạo và đóng ngay trong thread đó, fn cần tự commit.
+    Object ORM trả về đã detach, chỉ đọc được các thuộc tính đã load.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, _call_with_session, fn)
+
+def init_db():
+    """Tạo các bảng còn thiếu và chạy các migration chưa áp dụng"""
+    # Import models để đăng ký bảng vào Base.metadata
+    import common.models.job  # noqa: F401
+    from common.migrations import run_migrations
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
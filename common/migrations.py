@@ -0,0 +1,88 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from datetime import datetime
+from typing import Callable, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bảng lưu các version schema đã áp dụng
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow)
+)
+
+def _add_columns(conn: Connection, table: str, columns: List[Tuple[str, str]]):
+    """ALTER TABLE thêm các cột (tên, kiểu SQL) còn thiếu, bỏ qua nếu bảng chưa có
+    (create_all đã tạo bảng mới với đủ cột)"""
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return
+    existing = {col["name"] for col in inspector.get_columns(table)}
+    for name, col_type in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}"))
+
+def _add_job_lease_columns(conn: Connection):
+    """Cột owner/lease/heartbeat/attempts cho claim và lease của job
+
+    Danh sách cố định theo version 1, cột thêm sau này phải có migration riêng.
+    """
+    _add_columns(conn, "jobs", [
+        ("owner", "VARCHAR"),
+        ("lease_expires_at", "DATETIME"),
+        ("heartbeat_at", "DATETIME"),
+        ("attempts", "INTEGER"),
+    ])
+
+def _create_job_indexes(conn: Connection):
+    """Index cho dispatcher (status, processing_order) và thống kê theo lane (workflow, channel)"""
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_status_order ON jobs (status, processing_order, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_lane ON jobs (workflow_name, channel_name, status)"))
+
+def _add_job_deadline(conn: Connection):
+    """Cột deadline cho scheduler aging"""
+    _add_columns(conn, "jobs", [("deadline", "DATETIME")])
+
+# (version, mô tả, hàm migrate), chỉ thêm vào cuối, không sửa migration đã phát hành
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add lease/owner/attempts columns to jobs", _add_job_lease_columns),
+    (2, "add jobs(status, processing_order) and jobs(workflow_name, channel_name) indexes",
+     _create_job_indexes),
+    (3, "add jobs.deadline", _add_job_deadline),
+]
+
+def current_version(conn: Connection) -> int:
+    """Version schema hiện tại, 0 nếu chưa chạy migration nào"""
+    row = conn.execute(text("SELECT MAX(version) FROM schema_version")).first()
+    return (row[0] or 0) if row else 0
+
+def run_migrations(engine: Engine) -> int:
+    """Áp dụng lần lượt các migration chưa chạy, mỗi migration một transaction
+
+    Returns:
+        int: version schema sau khi migrate
+    """
+    _metadata.create_all(bind=engine)
+
+    with engine.connect() as conn:
+        version = current_version(conn)
+
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        with engine.begin() as conn:
+            # Process khác có thể vừa migrate xong
+            if current_version(conn) >= target:
+                continue
+            migrate(conn)
+            conn.execute(schema_version.insert().values(
+                version=target, description=description, applied_at=datetime.utcnow()
+            ))
+        logger.info(f"Applied schema migration {target}: {description}")
+        version = target
+
+    return version
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum as SQLEnum, DateTime, Float
+from sqlalchemy import Column, Integer, String, Enum as SQLEnum, DateTime, Float, Index
 import enum
 from datetime import datetime
 from common.database import Base
@@ -16,6 +16,12 @@ class JobPriority(int, enum.Enum):
 
 class Job(Base):
     __tablename__ = "jobs"
+    __table_args__ = (
+        # Dispatcher đọc job PENDING theo processing_order, reaper lọc job PROCESSING
+        Index("ix_jobs_status_order", "status", "processing_order", "id"),
+        # Thống kê / lọc job theo lane (workflow, channel)
+        Index("ix_jobs_lane", "workflow_name", "channel_name", "status"),
+    )
 
     id = Column(Integer, primary_key=True)
     workflow_name = Column(String, nullable=False)
@@ -29,6 +35,11 @@ class Job(Base):
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     processing_order = Column(Float, nullable=True)  # Để sắp xếp thứ tự xử lý
+    owner = Column(String, nullable=True)  # Worker (node/process) đang giữ job
+    lease_expires_at = Column(DateTime, nullable=True)  # Hết hạn lease thì job được trả lại queue
+    heartbeat_at = Column(DateTime, nullable=True)  # Lần cuối worker báo còn sống
+    attempts = Column(Integer, nullable=True, default=0)  # Số lần job bị trả lại queue do mất lease
+    deadline = Column(DateTime, nullable=True)  # Hạn hoàn thành (UTC), scheduler aging ưu tiên khi gần hạn
 
     def to_dict(self):
         return {
@@ -39,6 +50,10 @@ class Job(Base):
             "channel_name": self.channel_name,
             "status": self.status,
             "priority": self.priority,
+            "owner": self.owner,
+            "attempts": self.attempts or 0,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "started_at": self.started_at.isoformat() if self.started_at else None,
             "completed_at": self.completed_at.isoformat() if self.completed_at else None
@@ -0,0 +1,399 @@
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from common.config.settings import get_section
+from common.utils.http_client import get_client
+from common.utils.stage_gate import pipeline_config, stage_gate
+
+logger = logging.getLogger(__name__)
+
+# Mặc định cho mỗi service trong section "backends" của config.json, vd:
+#   "backends": {"tts": {"endpoints": ["http://gpu1:5006", {"url": "http://gpu2:5006", "max_concurrency": 4}]}}
+# Service không khai báo endpoints thì dùng URL cũ của workflow (api_urls / workflow_paths)
+DEFAULT_BACKEND_CONFIG = {
+    "endpoints": [],
+    "max_concurrency": 2,      # Số request đồng thời tối đa mỗi endpoint (trần của AIMD)
+    "health_path": "/",        # Active health check: GET path này, status < 500 là còn sống
+    "health_interval": 30,     # Giây giữa các lần check endpoint đang lỗi, 0 để tắt
+    "fail_threshold": 3,       # Số lỗi liên tiếp (kết nối/5xx) thì mở circuit của endpoint
+    "cooldown": 60,            # Giây circuit mở trước khi cho một request thử (half-open)
+    "max_cooldown": 600,       # Cooldown nhân đôi mỗi lần thử lại vẫn lỗi, tối đa chừng này
+    "adaptive": True,          # AIMD: tăng dần giới hạn khi ổn, giảm một nửa khi lỗi hoặc chậm
+    "latency_tolerance": 3.0,  # Chậm hơn latency nền bao nhiêu lần thì coi là quá tải, 0 để bỏ qua
+    "decrease_interval": 5     # Giây tối thiểu giữa hai lần giảm giới hạn
+}
+
+def size_class(size: float) -> int:
+    """Lớp kích thước của request: k với 2^k <= size < 2^(k+1)"""
+    return int(math.log2(max(1.0, float(size))))
+
+class BackendUnavailable(Exception):
+    """Circuit của mọi endpoint trong pool đang mở, request bị từ chối ngay"""
+
+class Endpoint:
+    """Một backend trong pool: circuit breaker và giới hạn song song thích ứng (AIMD)
+
+    Circuit: closed -> open sau fail_threshold lỗi liên tiếp -> half-open khi hết cooldown
+    (chỉ một request thử) -> closed nếu thành công, open lại với cooldown gấp đôi nếu lỗi.
+    """
+
+    def __init__(self, url: str, limit: int, adaptive: bool = True):
+        self.url = url.rstrip('/')
+        self.max_limit = max(1, int(limit))
+        self.limit = float(self.max_limit)
+        self.adaptive = adaptive
+        self.outstanding = 0
+        self.total = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.cooldown = 0.0
+        # Latency nền theo (path, lớp kích thước request), bám theo giá trị nhỏ
+        self.latency: Dict[Tuple[str, int], float] = {}
+        self._last_decrease = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return max(1, int(self.limit))
+
+    def state(self, now: float) -> str:
+        if self.down_until > now:
+            return "open"
+        return "half_open" if self.down_until else "closed"
+
+    def available(self, now: float) -> bool:
+        state = self.state(now)
+        if state == "open":
+            return False
+        if state == "half_open":
+            return self.outstanding == 0
+        return self.outstanding < self.capacity
+
+    def on_success(self, latency: Optional[float], tolerance: float, decrease_interval: float,
+                   path: str = "", size: Optional[float] = None):
+        """Ghi nhận request thành công
+
+        Latency chỉ so với request cùng path và cùng lớp kích thước (size trong khoảng [2^k, 2^(k+1)),
+        vd số byte text TTS hoặc audio Whisper): TTS KB dài hay Whisper audio dài không bị coi là
+        quá tải so với hook ngắn. Không có size thì không dùng latency cho AIMD.
+        """
+        self.failures = 0
+        self.down_until = 0.0
+        self.cooldown = 0.0
+        if not self.adaptive:
+            return
+        if latency is not None and size:
+            key = (path, size_class(size))
+            baseline = self.latency.get(key)
+            if baseline is None or latency < baseline:
+                self.latency[key] = latency
+            else:
+                self.latency[key] = baseline + 0.05 * (latency - baseline)
+            if tolerance and baseline is not None and latency > baseline * tolerance:
+                self._decrease(decrease_interval, f"latency {latency:.1f}s on {path} (baseline {baseline:.1f}s)")
+                return
+        # Additive increase: thêm khoảng một slot sau mỗi `limit` request thành công
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_failure(self, fail_threshold: int, cooldown: float, max_cooldown: float,
+                   decrease_interval: float) -> bool:
+        """Ghi nhận lỗi, trả về True nếu circuit vừa mở"""
+        now = time.monotonic()
+        half_open = self.state(now) == "half_open"
+        self.failures += 1
+        if self.adaptive:
+            self._decrease(decrease_interval, "error")
+        if half_open or self.failures >= fail_threshold:
+            self.cooldown = min(max_cooldown, self.cooldown * 2 if half_open else cooldown)
+            self.down_until = now + self.cooldown
+            return True
+        return False
+
+    def _decrease(self, interval: float, reason: str):
+        """Multiplicative decrease, tối đa một lần mỗi interval giây"""
+        now = time.monotonic()
+        if now - self._last_decrease < interval or self.limit <= 1:
+            return
+        self._last_decrease = now
+        self.limit = max(1.0, self.limit / 2)
+        logger.info(f"Backend {self.url}: concurrency limit -> {self.capacity} ({reason})")
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "state": self.state(time.monotonic()),
+            "outstanding": self.outstanding,
+            "limit": self.capacity,
+            "max_limit": self.max_limit,
+            "total": self.total,
+            "failures": self.failures,
+            "latency": {f"{path}#{size}": value for (path, size), value in self.latency.items()}
+        }
+
+class BackendPool:
+    """Chia request của một service (tts, whisper, video...) cho nhiều endpoint
+
+    Chọn endpoint đang ít request nhất (theo tỉ lệ với giới hạn hiện tại của nó). Mỗi
+    endpoint có circuit breaker (passive: lỗi kết nối/5xx; active: health check định kỳ
+    đưa endpoint trở lại sớm) và giới hạn song song AIMD theo latency và lỗi. Khi circuit
+    của mọi endpoint đều mở, request bị từ chối ngay (BackendUnavailable) và các stage
+    cần service này tạm dừng nhận pair mới.
+    """
+
+    def __init__(self, name: str, endpoints: List[Tuple[str, int]], health_path: str = "/",
+                 health_interval: float = 30, fail_threshold: int = 3, cooldown: float = 60,
+                 max_cooldown: float = 600, adaptive: bool = True, latency_tolerance: float = 3.0,
+                 decrease_interval: float = 5):
+        if not endpoints:
+            raise ValueError(f"Backend pool {name} has no endpoints")
+        self.name = name
+        self.endpoints = [Endpoint(url, limit, adaptive) for url, limit in endpoints]
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.fail_threshold = max(1, int(fail_threshold))
+        self.cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.decrease_interval = decrease_interval
+        self._changed = asyncio.Event()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    @property
+    def max_capacity(self) -> int:
+        """Tổng max_concurrency của các endpoint (trần AIMD)"""
+        return sum(endpoint.max_limit for endpoint in self.endpoints)
+
+    @property
+    def is_open(self) -> bool:
+        """Circuit của mọi endpoint đều đang mở"""
+        now = time.monotonic()
+        return all(endpoint.state(now) == "open" for endpoint in self.endpoints)
+
+    def _endpoint(self, url: str) -> Optional[Endpoint]:
+        url = url.rstrip('/')
+        return next((endpoint for endpoint in self.endpoints if endpoint.url == url), None)
+
+    def _pick(self, url: Optional[str]) -> Optional[Endpoint]:
+        now = time.monotonic()
+        if url:
+            # Task đã chạy trên endpoint này (vd poll video) thì phải quay lại đúng endpoint, kể cả khi circuit mở
+            endpoint = self._endpoint(url)
+            if endpoint is None:
+                endpoint = Endpoint(url, 1, self.adaptive)
+                self.endpoints.append(endpoint)
+                logger.warning(f"Backend {self.name}: {url} is not configured, added with limit 1")
+            return endpoint if endpoint.outstanding < endpoint.capacity else None
+
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: (e.outstanding / e.capacity, e.outstanding, e.total))
+
+    async def acquire(self, url: Optional[str] = None) -> Endpoint:
+        """Chờ tới khi có endpoint còn slot (hoặc endpoint url chỉ định) và giữ một slot
+
+        Raises:
+            BackendUnavailable: Circuit của mọi endpoint đang mở (không áp dụng khi chỉ định url)
+        """
+        self._ensure_health_task()
+        started = time.monotonic()
+        while True:
+            endpoint = self._pick(url)
+            if endpoint:
+                endpoint.outstanding += 1
+                endpoint.total += 1
+                waited = time.monotonic() - started
+                if waited >= 1:
+                    logger.info(f"Backend {self.name}: waited {waited:.1f}s for {endpoint.url}")
+                return endpoint
+            if not url and self.is_open:
+                raise BackendUnavailable(f"Backend {self.name} unavailable: circuit open on {self.urls}")
+            self._changed.clear()
+            try:
+                # Timeout để kiểm tra lại endpoint hết cooldown
+                await asyncio.wait_for(self._changed.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, endpoint: Endpoint, ok: Optional[bool] = None, latency: Optional[float] = None,
+                path: str = "", size: Optional[float] = None):
+        """Trả slot; ok=True/False cập nhật circuit và AIMD (None: lỗi không do backend)"""
+        endpoint.outstanding -= 1
+        if ok:
+            endpoint.on_success(latency, self.latency_tolerance, self.decrease_interval, path, size)
+        elif ok is False:
+            opened = endpoint.on_failure(self.fail_threshold, self.cooldown, self.max_cooldown,
+                                         self.decrease_interval)
+            if opened:
+                logger.warning(f"Backend {self.name}: circuit open for {endpoint.url} "
+                               f"({endpoint.failures} failures), retry in {endpoint.cooldown:.0f}s")
+        self._changed.set()
+
+    async def wait_available(self, label: str = ""):
+        """Chờ tới khi ít nhất một endpoint không còn mở circuit (dùng trước khi nhận việc mới)"""
+        if not self.is_open:
+            return
+        started = time.monotonic()
+        logger.warning(f"Backend {self.name} unavailable, holding {label or 'work'} until it recovers")
+        while self.is_open:
+            self._ensure_health_task()
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+        logger.info(f"Backend {self.name} available again after {time.monotonic() - started:.0f}s")
+
+    @asynccontextmanager
+    async def lease(self, url: Optional[str] = None):
+        """Giữ một slot trên endpoint trong lúc gọi API (vd render video dài),
+        lỗi kết nối/5xx được tính vào circuit; latency không dùng cho AIMD"""
+        endpoint = await self.acquire(url)
+        ok = None
+        try:
+            yield endpoint
+            ok = True
+        except httpx.TransportError:
+            ok = False
+            raise
+        except httpx.HTTPStatusError as e:
+            ok = False if e.response.status_code >= 500 else None
+            raise
+        finally:
+            self.release(endpoint, ok)
+
+    async def request(self, method: str, path: str, retries: int = 0, backoff_factor: float = 1,
+                      status_forcelist: Sequence[int] = (500, 502, 503, 504),
+                      build: Optional[Callable[[], Tuple[Dict, Optional[Callable[[], None]]]]] = None,
+                      size: Optional[float] = None, **kwargs) -> httpx.Response:
+        """Gửi request tới endpoint tốt nhất, retry khi lỗi kết nối hoặc status trong status_forcelist
+
+        Mỗi lần retry chọn lại endpoint (endpoint vừa lỗi có thể đã mở circuit). Thời gian chờ
+        giữa các lần retry giống urllib3 Retry: backoff_factor * 2^(n-1) (1s, 2s, 4s...); khi
+        circuit mọi endpoint đã mở thì dừng retry và raise BackendUnavailable ngay.
+
+        Args:
+            path: Đường dẫn sau URL endpoint, vd "/tts"
+            build: Hàm tạo lại kwargs cho mỗi lần gửi (vd mở lại file upload), trả về
+                (kwargs, cleanup); cleanup được gọi sau mỗi lần gửi
+            size: Kích thước công việc của request (vd byte text/audio), để so latency với
+                request cùng cỡ; None thì latency không dùng để giảm giới hạn song song
+        """
+        client = get_client()
+        for attempt in range(retries + 1):
+            endpoint = await self.acquire()
+            request_kwargs, cleanup = build() if build else ({}, None)
+            started = time.monotonic()
+            ok = None
+            try:
+                response = await client.request(method, f"{endpoint.url}{path}", **kwargs, **request_kwargs)
+                ok = response.status_code < 500
+            except httpx.TransportError as e:
+                ok = False
+                if attempt >= retries:
+                    raise
+                logger.warning(f"{method} {endpoint.url}{path} failed ({e.__class__.__name__}: {e}), "
+                               f"retry {attempt + 1}/{retries}")
+            else:
+                if response.status_code not in status_forcelist or attempt >= retries:
+                    return response
+                logger.warning(f"{method} {endpoint.url}{path} returned {response.status_code}, "
+                               f"retry {attempt + 1}/{retries}")
+            finally:
+                self.release(endpoint, ok, time.monotonic() - started if ok else None, path, size)
+                if cleanup:
+                    cleanup()
+            if self.is_open:
+                raise BackendUnavailable(f"Backend {self.name} unavailable: circuit open on {self.urls}")
+            await asyncio.sleep(backoff_factor * (2 ** attempt))
+
+    def _ensure_health_task(self):
+        if self.health_interval and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def _check(self, endpoint: Endpoint) -> bool:
+        try:
+            response = await get_client().get(f"{endpoint.url}{self.health_path}", timeout=5)
+            return response.status_code < 500
+        except httpx.HTTPError:
+            return False
+
+    async def _health_loop(self):
+        """Check các endpoint đang lỗi, sống lại thì đóng circuit ngay"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for endpoint in self.endpoints:
+                if not endpoint.failures or endpoint.outstanding:
+                    continue
+                if await self._check(endpoint):
+                    if endpoint.down_until:
+                        logger.info(f"Backend {self.name}: {endpoint.url} is healthy again")
+                    endpoint.failures = 0
+                    endpoint.down_until = 0.0
+                    endpoint.cooldown = 0.0
+                    self._changed.set()
+
+    def stats(self) -> Dict:
+        return {"name": self.name, "open": self.is_open, "endpoints": [endpoint.stats() for endpoint in self.endpoints]}
+
+def _parse_endpoints(config: Dict) -> List[Tuple[str, int]]:
+    endpoints = []
+    for item in config.get("endpoints") or []:
+        if isinstance(item, str):
+            endpoints.append((item, config["max_concurrency"]))
+        else:
+            endpoints.append((item["url"], item.get("max_concurrency", config["max_concurrency"])))
+    return endpoints
+
+# Mỗi event loop một pool cho mỗi service (asyncio.Event không dùng chung được giữa các loop)
+_pools: Dict[Tuple[int, str], BackendPool] = {}
+
+def backend_pool(service: str, default_url: str) -> BackendPool:
+    """Pool dùng chung của service trong event loop hiện tại
+
+    Args:
+        service: Tên service trong section "backends" (tts, whisper, video, voice)
+        default_url: URL dùng khi config không khai báo endpoints cho service
+    """
+    key = (id(asyncio.get_running_loop()), service)
+    pool = _pools.get(key)
+    if pool is None:
+        config = {**DEFAULT_BACKEND_CONFIG, **(get_section("backends").get(service) or {})}
+        endpoints = _parse_endpoints(config) or [(str(default_url), config["max_concurrency"])]
+        pool = BackendPool(
+            service, endpoints,
+            health_path=config["health_path"],
+            health_interval=config["health_interval"],
+            fail_threshold=config["fail_threshold"],
+            cooldown=config["cooldown"],
+            max_cooldown=config["max_cooldown"],
+            adaptive=config["adaptive"],
+            latency_tolerance=config["latency_tolerance"],
+            decrease_interval=config["decrease_interval"]
+        )
+        _pools[key] = pool
+        logger.info(f"Backend pool {service}: {pool.urls}")
+
+        # Stage cần service này chờ trước khi nhận pair mới khi circuit mở,
+        # stage "auto" cho số pair song song bằng capacity của pool
+        for stage, stage_service in pipeline_config()["stage_backends"].items():
+            if stage_service == service:
+                gate = stage_gate(stage)
+                gate.add_precondition(pool.wait_available)
+                gate.resize(pool.max_capacity)
+    return pool
+
+def backend_stats() -> List[Dict]:
+    """Trạng thái các pool của event loop hiện tại"""
+    loop_id = id(asyncio.get_running_loop())
+    return [pool.stats() for (pool_loop, _), pool in _pools.items() if pool_loop == loop_id]
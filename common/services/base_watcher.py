@@ -1,44 +1,119 @@
 import os
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import httpx
-from typing import Optional
+from typing import Dict, List, Optional
 
 class BaseWatcherHandler(FileSystemEventHandler):
-    def __init__(self, api_url: str, channel_name: Optional[str] = None):
+    def __init__(self, api_url: str, channel_name: Optional[str] = None,
+                 batch_url: Optional[str] = None, batch_window: float = 0.5,
+                 max_batch: int = 200):
+        """
+        Args:
+            api_url: Endpoint tạo một job
+            channel_name: Channel cố định, mặc định lấy theo thư mục chứa file
+            batch_url: Endpoint tạo nhiều job (ví dụ /jobs/bulk). Có batch_url thì các file
+                tới trong cùng batch_window giây được gom lại gửi một request (kể cả khi
+                chỉ có một file)
+            batch_window: Thời gian gom file (giây)
+            max_batch: Gửi ngay khi đã gom đủ số file này
+        """
         self.api_url = api_url
         self.channel_name = channel_name
-        
+        self.batch_url = batch_url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._pending: List[Dict] = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def _payload(self, file_path: str) -> Dict:
+        return {
+            "file_path": file_path,
+            "channel_name": self.channel_name or os.path.basename(os.path.dirname(file_path))
+        }
+
     async def process_file(self, file_path: str):
         try:
             async with httpx.AsyncClient(timeout=300) as client:
-                payload = {
-                    "file_path": file_path,
-                    "channel_name": self.channel_name or os.path.basename(os.path.dirname(file_path))
-                }
-                response = await client.post(self.api_url, json=payload)
+                response = await client.post(self.api_url, json=self._payload(file_path))
                 response.raise_for_status()
                 return response.json()
         except Exception as e:
             print(f"Error processing file {file_path}: {str(e)}")
             return None
 
+    def submit_files(self, payloads: List[Dict]):
+        """Gửi một nhóm file lên API (chạy trên thread của watchdog/timer)"""
+        if not payloads:
+            return None
+        try:
+            with httpx.Client(timeout=300) as client:
+                if self.batch_url:
+                    response = client.post(self.batch_url, json={"jobs": payloads})
+                    response.raise_for_status()
+                    return response.json()
+
+                results = []
+                for payload in payloads:
+                    response = client.post(self.api_url, json=payload)
+                    response.raise_for_status()
+                    results.append(response.json())
+                return results
+        except Exception as e:
+            files = ", ".join(payload["file_path"] for payload in payloads)
+            print(f"Error submitting files {files}: {str(e)}")
+            return None
+
+    def flush(self):
+        """Gửi ngay các file đang được gom"""
+        with self._pending_lock:
+            payloads, self._pending = self._pending, []
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self.submit_files(payloads)
+
+    def _enqueue(self, file_path: str):
+        if not self.batch_url:
+            self.submit_files([self._payload(file_path)])
+            return
+
+        with self._pending_lock:
+            self._pending.append(self._payload(file_path))
+            full = len(self._pending) >= self.max_batch
+            if not full and not self._flush_timer:
+                # File đầu tiên của burst mở cửa sổ gom, hết cửa sổ thì gửi cả nhóm
+                self._flush_timer = threading.Timer(self.batch_window, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if full:
+            self.flush()
+
     def on_created(self, event):
         if not event.is_directory and event.src_path.endswith('.txt'):
-            import asyncio
-            asyncio.create_task(self.process_file(event.src_path))
+            # watchdog gọi từ thread riêng (không có event loop), gửi request đồng bộ
+            self._enqueue(event.src_path)
 
 class BaseWatcher:
-    def __init__(self, watch_path: str, api_url: str, channel_name: Optional[str] = None):
+    def __init__(self, watch_path: str, api_url: str, channel_name: Optional[str] = None,
+                 batch_url: Optional[str] = None, batch_window: float = 0.5):
         self.watch_path = watch_path
         self.api_url = api_url
         self.channel_name = channel_name
+        self.batch_url = batch_url
+        self.batch_window = batch_window
         self.observer = Observer()
+        self.event_handler: Optional[BaseWatcherHandler] = None
 
     def start(self):
         """Start watching the directory"""
-        event_handler = BaseWatcherHandler(self.api_url, self.channel_name)
-        self.observer.schedule(event_handler, self.watch_path, recursive=False)
+        self.event_handler = BaseWatcherHandler(
+            self.api_url, self.channel_name,
+            batch_url=self.batch_url, batch_window=self.batch_window
+        )
+        self.observer.schedule(self.event_handler, self.watch_path, recursive=False)
         self.observer.start()
         print(f"Started watching {self.watch_path}")
 
@@ -46,4 +121,7 @@ class BaseWatcher:
         """Stop watching the directory"""
         self.observer.stop()
         self.observer.join()
+        if self.event_handler:
+            # Gửi nốt các file còn đang gom
+            self.event_handler.flush()
         print(f"Stopped watching {self.watch_path}")
@@ -1,14 +1,40 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-from typing import Dict, Any, Optional
+import os
+import socket
+import uuid
+from collections import defaultdict
+from typing import Dict, Any, Optional, List, Tuple
+from common.config.settings import get_section
 from common.models.job import Job, JobStatus, JobPriority
-from common.database import get_db
+from common.database import init_db, run_db
+from common.services.job_queue import JobQueue, QueuedJob
+from common.services.scheduler import Scheduler, create_scheduler, naive_utc, utc_timestamp
+
+# Cấu hình mặc định cho worker pool, có thể override bằng section "job_manager" trong config.json
+DEFAULT_JOB_MANAGER_CONFIG = {
+    "num_workers": 4,
+    "default_workflow_concurrency": 2,
+    "default_channel_concurrency": 1,
+    "workflow_concurrency": {},
+    "channel_concurrency": {},
+    "lease_seconds": 600,
+    "heartbeat_interval": 0,
+    "reap_interval": 60,
+    "max_attempts": 3,
+    "sync_interval": 0,
+    "scheduler": {"policy": "static"}
+}
+
+def default_owner_id() -> str:
+    """Định danh worker process: host:pid:random, duy nhất giữa các node dùng chung DB"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
 class JobManager:
     _instance = None
     _lock = asyncio.Lock()
-    _processing = False
     _workflow_handlers: Dict[str, Any] = {}
 
     def __init__(self):
@@ -20,99 +46,454 @@ class JobManager:
             async with cls._lock:
                 if not cls._instance:
                     cls._instance = object.__new__(cls)
-                    cls._instance._workflow_handlers = {}
-                    cls._instance._processing = False
+                    cls._instance._init_state()
         return cls._instance
 
+    def _init_state(self):
+        """Khởi tạo trạng thái của worker pool"""
+        self._workflow_handlers = {}
+        self._workers: List[asyncio.Task] = []
+        self._dispatch_lock = asyncio.Lock()
+        # Worker rảnh chờ trên condition này, không query DB cho đến khi được đánh thức
+        self._wakeup = asyncio.Condition(self._dispatch_lock)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Mirror các job PENDING trong bộ nhớ, dựng lại từ DB khi khởi động
+        self._queue = JobQueue()
+        self._queue_loaded = False
+        self._sync_task: Optional[asyncio.Task] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+        self.owner_id = default_owner_id()
+        self._running_by_workflow: Dict[str, int] = defaultdict(int)
+        self._running_by_channel: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.configure(**get_section("job_manager", DEFAULT_JOB_MANAGER_CONFIG))
+
+    def configure(self, num_workers: int = 4,
+                  default_workflow_concurrency: int = 2,
+                  default_channel_concurrency: int = 1,
+                  workflow_concurrency: Optional[Dict[str, int]] = None,
+                  channel_concurrency: Optional[Dict[str, Dict[str, int]]] = None,
+                  lease_seconds: float = 600,
+                  heartbeat_interval: float = 0,
+                  reap_interval: float = 60,
+                  max_attempts: int = 3,
+                  sync_interval: float = 0,
+                  scheduler: Optional[Any] = None):
+        """Cấu hình số worker và giới hạn chạy song song cho từng workflow / channel
+
+        channel_concurrency có dạng {"workflow2": {"C1": 2}}
+        sync_interval > 0 khi nhiều process/node dùng chung bảng jobs: định kỳ
+        đọc lại các job PENDING do node khác thêm vào
+        heartbeat_interval = 0 thì dùng lease_seconds / 3
+        scheduler là một Scheduler hoặc dict config, ví dụ {"policy": "aging", "priority_boost": 1800}
+        """
+        self.num_workers = max(1, int(num_workers))
+        self.default_workflow_concurrency = max(1, int(default_workflow_concurrency))
+        self.default_channel_concurrency = max(1, int(default_channel_concurrency))
+        self.workflow_concurrency = dict(workflow_concurrency or {})
+        self.channel_concurrency = {
+            workflow: dict(channels) for workflow, channels in (channel_concurrency or {}).items()
+        }
+        self.lease_seconds = float(lease_seconds)
+        self.heartbeat_interval = float(heartbeat_interval or 0) or self.lease_seconds / 3
+        self.reap_interval = float(reap_interval or 0)
+        self.max_attempts = max(1, int(max_attempts))
+        self.sync_interval = float(sync_interval or 0)
+        self.scheduler: Scheduler = (
+            scheduler if isinstance(scheduler, Scheduler) else create_scheduler(scheduler)
+        )
+
     def register_workflow_handler(self, workflow_name: str, handler):
         """Đăng ký handler cho một workflow"""
         self._workflow_handlers[workflow_name] = handler
 
-    async def add_job(self, db: Session, workflow_name: str, file_path: str, 
-                     channel_name: str, priority: int = JobPriority.NORMAL) -> Job:
+    def _workflow_limit(self, workflow_name: str) -> int:
+        return self.workflow_concurrency.get(workflow_name, self.default_workflow_concurrency)
+
+    def _channel_limit(self, workflow_name: str, channel_name: str) -> int:
+        channels = self.channel_concurrency.get(workflow_name, {})
+        return channels.get(channel_name, self.default_channel_concurrency)
+
+    def _lane_available(self, workflow_name: str, channel_name: str) -> bool:
+        """Kiểm tra workflow và channel còn slot để chạy thêm job không"""
+        if self._running_by_workflow[workflow_name] >= self._workflow_limit(workflow_name):
+            return False
+        lane = (workflow_name, channel_name)
+        return self._running_by_channel[lane] < self._channel_limit(workflow_name, channel_name)
+
+    async def add_job(self, workflow_name: str, file_path: str,
+                     channel_name: str, priority: int = JobPriority.NORMAL,
+                     deadline: Optional[datetime] = None) -> Job:
         """Thêm job mới vào queue"""
-        # Tính processing_order dựa trên priority và thời gian
-        processing_order = datetime.utcnow().timestamp() - (priority * 10000)
-        
-        job = Job(
-            workflow_name=workflow_name,
-            file_path=file_path,
-            channel_name=channel_name,
-            priority=priority,
-            processing_order=processing_order
+        jobs = await self.add_jobs(workflow_name, [{
+            "file_path": file_path,
+            "channel_name": channel_name,
+            "priority": priority,
+            "deadline": deadline
+        }])
+        return jobs[0]
+
+    async def add_jobs(self, workflow_name: str, items: List[Dict[str, Any]]) -> List[Job]:
+        """Thêm nhiều job trong một transaction và đánh thức worker một lần
+
+        Args:
+            workflow_name: Tên workflow
+            items: Danh sách dict gồm file_path, channel_name, priority và deadline (tùy chọn)
+
+        Returns:
+            List[Job]: Các job đã tạo, cùng thứ tự với items
+        """
+        if not items:
+            return []
+
+        # processing_order do scheduler tính từ thời gian, priority và deadline,
+        # các job cùng batch có cùng thời điểm nên giữ thứ tự theo id
+        now = utc_timestamp()
+
+        # Bắt đầu các worker nếu chưa chạy (lần đầu sẽ tạo bảng và dựng heap)
+        await self._ensure_workers()
+
+        def insert(db: Session) -> List[Job]:
+            jobs = []
+            for item in items:
+                priority = item.get("priority", JobPriority.NORMAL)
+                # Deadline lưu và tính key theo naive UTC dù API nhận giá trị có timezone
+                deadline = naive_utc(item.get("deadline"))
+                jobs.append(Job(
+                    workflow_name=workflow_name,
+                    file_path=item["file_path"],
+                    channel_name=item["channel_name"],
+                    priority=priority,
+                    deadline=deadline,
+                    processing_order=self.scheduler.order_key(now, priority, deadline)
+                ))
+            db.add_all(jobs)
+            # Giữ nguyên giá trị sau commit để không phải refresh từng job
+            db.expire_on_commit = False
+            db.commit()
+            db.expunge_all()
+            return jobs
+
+        jobs = await run_db(insert)
+
+        # Đưa job vào heap và đánh thức worker đang rảnh
+        for job in jobs:
+            self._queue.push(QueuedJob.from_job(job))
+        await self.notify()
+
+        return jobs
+
+    async def retry_job(self, job_id: int) -> Optional[Job]:
+        """Đưa job bị lỗi trở lại queue
+
+        Retry thủ công bắt đầu lại số lần thử: các lần lease hết hạn trước đó không còn
+        tính vào max_attempts của reaper.
+        """
+        def requeue(db: Session) -> Optional[Job]:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if not job or job.status != JobStatus.ERROR:
+                return None
+
+            job.status = JobStatus.PENDING
+            job.error_message = None
+            job.started_at = None
+            job.completed_at = None
+            job.attempts = 0
+            job.owner = None
+            job.lease_expires_at = None
+            job.heartbeat_at = None
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+            return job
+
+        job = await run_db(requeue)
+        if not job:
+            return None
+
+        await self._ensure_workers()
+        self._queue.push(QueuedJob.from_job(job))
+        await self.notify()
+        return job
+
+    async def notify(self):
+        """Đánh thức các worker đang chờ job mới"""
+        async with self._wakeup:
+            self._wakeup.notify_all()
+
+    def notify_threadsafe(self):
+        """Đánh thức worker từ thread khác (watcher, process insert job từ bên ngoài)"""
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.notify()))
+
+    async def start(self):
+        """Khởi động worker pool"""
+        await self._ensure_workers()
+        await self.notify()
+
+    async def _load_queue(self):
+        """Dựng lại heap từ các job PENDING trong DB"""
+        if not self._queue_loaded:
+            await run_db(lambda db: init_db())
+            # Trả lại queue các job mà process trước đó đang chạy dở lúc crash
+            await run_db(self._reap_expired_leases)
+
+        rows = await run_db(lambda db: (
+            db.query(Job.id, Job.processing_order, Job.workflow_name,
+                     Job.channel_name, Job.file_path)
+            .filter(Job.status == JobStatus.PENDING)
+            .all()
+        ))
+        self._queue.rebuild(QueuedJob(*row) for row in rows)
+        self._queue_loaded = True
+
+    async def stop(self):
+        """Dừng tất cả worker"""
+        tasks = list(self._workers)
+        tasks += [task for task in (self._sync_task, self._reaper_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sync_task = None
+        self._reaper_task = None
+
+    async def _ensure_workers(self):
+        """Đảm bảo worker pool có đủ num_workers worker đang chạy"""
+        self._loop = asyncio.get_running_loop()
+        if not self._queue_loaded:
+            async with self._dispatch_lock:
+                if not self._queue_loaded:
+                    await self._load_queue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        for worker_id in range(len(self._workers), self.num_workers):
+            self._workers.append(asyncio.create_task(self._worker(worker_id)))
+
+        if self.sync_interval > 0 and (not self._sync_task or self._sync_task.done()):
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+        if self.reap_interval > 0 and (not self._reaper_task or self._reaper_task.done()):
+            self._reaper_task = asyncio.create_task(self._reaper_loop())
+
+    def _reap_expired_leases(self, db: Session) -> int:
+        """Trả các job PROCESSING đã hết lease về PENDING, job hết lượt thử thì chuyển ERROR
+
+        Chạy trên DB executor thread (qua run_db).
+
+        Returns:
+            int: số job được trả lại queue
+        """
+        now = datetime.utcnow()
+        # Job chạy từ trước khi có lease (lease_expires_at NULL) coi như hết hạn sau lease_seconds
+        expired = (
+            (Job.status == JobStatus.PROCESSING) &
+            (
+                (Job.lease_expires_at < now) |
+                (Job.lease_expires_at.is_(None) &
+                 (Job.started_at < now - timedelta(seconds=self.lease_seconds)))
+            )
+        )
+        attempts = func.coalesce(Job.attempts, 0) + 1
+
+        failed = (
+            db.query(Job)
+            .filter(expired, attempts >= self.max_attempts)
+            .update({
+                Job.status: JobStatus.ERROR,
+                Job.error_message: "Lease expired too many times (worker crashed or hung)",
+                Job.completed_at: now,
+                Job.owner: None,
+                Job.lease_expires_at: None,
+                Job.attempts: attempts
+            }, synchronize_session=False)
+        )
+        requeued = (
+            db.query(Job)
+            .filter(expired)
+            .update({
+                Job.status: JobStatus.PENDING,
+                Job.started_at: None,
+                Job.owner: None,
+                Job.lease_expires_at: None,
+                Job.attempts: attempts
+            }, synchronize_session=False)
         )
-        db.add(job)
         db.commit()
 
-        # Bắt đầu xử lý queue nếu chưa chạy
-        if not self._processing:
-            asyncio.create_task(self._process_queue())
+        if failed or requeued:
+            print(f"Lease reaper: requeued {requeued} job(s), failed {failed} job(s)")
+        return requeued
 
-        return job
+    async def _reaper_loop(self):
+        """Định kỳ tìm job hết lease (worker crash hoặc treo) và đưa lại vào queue"""
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                async with self._wakeup:
+                    if await run_db(self._reap_expired_leases):
+                        await self._load_queue()
+                        self._wakeup.notify_all()
+            except Exception as e:
+                print(f"Error reaping expired jobs: {str(e)}")
 
-    async def _process_queue(self):
-        """Xử lý các job trong queue theo thứ tự"""
-        if self._processing:
-            return
+    async def _sync_loop(self):
+        """Đồng bộ heap với các job do process/node khác thêm vào bảng jobs"""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                async with self._wakeup:
+                    await self._load_queue()
+                    self._wakeup.notify_all()
+            except Exception as e:
+                print(f"Error syncing job queue: {str(e)}")
 
-        self._processing = True
-        try:
-            while True:
-                # Lấy DB session
-                db = next(get_db())
-                
-                try:
-                    # Lấy job tiếp theo cần xử lý
-                    next_job = (
-                        db.query(Job)
-                        .filter(Job.status == JobStatus.PENDING)
-                        .order_by(Job.processing_order)
-                        .first()
-                    )
-
-                    if not next_job:
-                        self._processing = False
-                        return
-
-                    # Cập nhật trạng thái job
-                    next_job.status = JobStatus.PROCESSING
-                    next_job.started_at = datetime.utcnow()
-                    db.commit()
-
-                    try:
-                        # Lấy handler tương ứng với workflow
-                        handler = self._workflow_handlers.get(next_job.workflow_name)
-                        if not handler:
-                            raise ValueError(f"No handler for workflow {next_job.workflow_name}")
-
-                        # Xử lý job
-                        result = await handler(next_job.file_path, next_job.channel_name)
-                        
-                        # Cập nhật kết quả
-                        next_job.status = JobStatus.COMPLETED
-                        next_job.completed_at = datetime.utcnow()
-                        next_job.workflow_task_id = result.get("task_id")
-                        db.commit()
-
-                    except Exception as e:
-                        next_job.status = JobStatus.ERROR
-                        next_job.error_message = str(e)
-                        next_job.completed_at = datetime.utcnow()
-                        db.commit()
-                        print(f"Error processing job {next_job.id}: {str(e)}")
-
-                finally:
-                    db.close()
-
-                # Đợi một chút trước khi xử lý job tiếp theo
+    async def _claim_next_job(self) -> Optional[QueuedJob]:
+        """Claim job được scheduler chọn trong các lane (workflow, channel) còn slot
+
+        Claim là một UPDATE có điều kiện status = PENDING, nên khi nhiều process
+        cùng trỏ vào một DATABASE_URL chỉ một process claim được mỗi job.
+        """
+        while True:
+            entry = self._queue.pop_next(self._lane_available, self._select)
+            if not entry:
+                return None
+
+            try:
+                claimed = await run_db(lambda db: self._claim_job(db, entry.id))
+            except Exception:
+                # Lỗi DB thì trả job lại heap để lần sau claim tiếp
+                self._queue.push(entry)
+                raise
+            if claimed:
+                break
+            # Job đã được node khác claim (hoặc bị xóa), bỏ qua
+
+        self._running_by_workflow[entry.workflow_name] += 1
+        self._running_by_channel[entry.lane] += 1
+        return entry
+
+    def _select(self, heads: List[QueuedJob]) -> QueuedJob:
+        return self.scheduler.select(heads, utc_timestamp())
+
+    def _claim_job(self, db: Session, job_id: int) -> bool:
+        """UPDATE ... WHERE status = PENDING, trả về True nếu process này claim được job"""
+        now = datetime.utcnow()
+        claimed = (
+            db.query(Job)
+            .filter(Job.id == job_id, Job.status == JobStatus.PENDING)
+            .update({
+                Job.status: JobStatus.PROCESSING,
+                Job.owner: self.owner_id,
+                Job.started_at: now,
+                Job.heartbeat_at: now,
+                Job.lease_expires_at: now + timedelta(seconds=self.lease_seconds)
+            }, synchronize_session=False)
+        )
+        db.commit()
+        return bool(claimed)
+
+    async def _worker(self, worker_id: int):
+        """Worker lấy job từ queue và xử lý, song song với các worker khác"""
+        while True:
+            try:
+                async with self._wakeup:
+                    next_job = await self._claim_next_job()
+                    while not next_job:
+                        # Queue rỗng hoặc các lane còn job đều đang đầy: chờ được đánh thức
+                        await self._wakeup.wait()
+                        next_job = await self._claim_next_job()
+
+                await self._run_job(next_job)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in job worker {worker_id}: {str(e)}")
+                # Tránh vòng lặp lỗi liên tục (ví dụ mất kết nối DB)
                 await asyncio.sleep(1)
 
+    async def _run_job(self, job: QueuedJob):
+        """Chạy handler của workflow cho một job đã được claim"""
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            # Lấy handler tương ứng với workflow
+            handler = self._workflow_handlers.get(job.workflow_name)
+            if not handler:
+                raise ValueError(f"No handler for workflow {job.workflow_name}")
+
+            # Xử lý job
+            result = await handler(job.file_path, job.channel_name)
+
         except Exception as e:
-            print(f"Error in job queue processing: {str(e)}")
+            await self._finish_job(job, {
+                Job.status: JobStatus.ERROR,
+                Job.error_message: str(e),
+                Job.completed_at: datetime.utcnow()
+            })
+            print(f"Error processing job {job.id}: {str(e)}")
+
+        else:
+            # Cập nhật kết quả. Handler đã chạy xong nên lỗi ghi DB không đánh dấu job ERROR:
+            # lease vẫn còn, hết hạn thì reaper trả job lại queue để chạy lại (checkpoint bỏ qua stage đã xong)
+            try:
+                await self._finish_job(job, {
+                    Job.status: JobStatus.COMPLETED,
+                    Job.completed_at: datetime.utcnow(),
+                    Job.workflow_task_id: (result or {}).get("task_id")
+                })
+            except Exception as e:
+                print(f"Error recording completion of job {job.id}, leaving it to the lease reaper: {str(e)}")
+
         finally:
-            self._processing = False
+            heartbeat.cancel()
+            self._running_by_workflow[job.workflow_name] -= 1
+            self._running_by_channel[job.lane] -= 1
+            # Lane vừa có slot trống, đánh thức worker đang chờ
+            await self.notify()
 
-    async def get_job_status(self, db: Session, job_id: int) -> Optional[Dict]:
+    async def _heartbeat(self, job: QueuedJob):
+        """Gia hạn lease định kỳ trong khi handler đang chạy"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                if not await run_db(lambda db: self._renew_lease(db, job.id)):
+                    print(f"Lost lease on job {job.id}, it may be picked up by another worker")
+            except Exception as e:
+                print(f"Error renewing lease for job {job.id}: {str(e)}")
+
+    def _renew_lease(self, db: Session, job_id: int) -> bool:
+        now = datetime.utcnow()
+        renewed = (
+            db.query(Job)
+            .filter(Job.id == job_id, Job.owner == self.owner_id)
+            .update({
+                Job.heartbeat_at: now,
+                Job.lease_expires_at: now + timedelta(seconds=self.lease_seconds)
+            }, synchronize_session=False)
+        )
+        db.commit()
+        return bool(renewed)
+
+    async def _finish_job(self, job: QueuedJob, values: Dict):
+        """Ghi kết quả job vào DB và bỏ job khỏi heap, chỉ khi process này còn giữ job"""
+        self._queue.remove(job.id)
+        values = {**values, Job.owner: None, Job.lease_expires_at: None}
+
+        def update(db: Session) -> int:
+            updated = (
+                db.query(Job)
+                .filter(Job.id == job.id, Job.owner == self.owner_id)
+                .update(values, synchronize_session=False)
+            )
+            db.commit()
+            return updated
+
+        if not await run_db(update):
+            print(f"Job {job.id} is no longer owned by {self.owner_id}, result discarded")
+
+    async def get_job_status(self, job_id: int) -> Optional[Dict]:
         """Lấy trạng thái của một job"""
-        job = db.query(Job).filter(Job.id == job_id).first()
-        return job.to_dict() if job else None
+        def load(db: Session) -> Optional[Dict]:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            return job.to_dict() if job else None
+
+        return await run_db(load)
@@ -0,0 +1,104 @@
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+class QueuedJob:
+    """Thông tin tối thiểu của một job PENDING để dispatch mà không cần đọc lại DB"""
+    __slots__ = ("id", "processing_order", "workflow_name", "channel_name", "file_path")
+
+    def __init__(self, id: int, processing_order: float, workflow_name: str,
+                 channel_name: str, file_path: str):
+        self.id = id
+        self.processing_order = processing_order
+        self.workflow_name = workflow_name
+        self.channel_name = channel_name
+        self.file_path = file_path
+
+    @property
+    def lane(self) -> Tuple[str, str]:
+        return (self.workflow_name, self.channel_name)
+
+    def sort_key(self) -> Tuple[float, int]:
+        return (self.processing_order, self.id)
+
+    def __lt__(self, other: "QueuedJob") -> bool:
+        return self.sort_key() < other.sort_key()
+
+    @classmethod
+    def from_job(cls, job) -> "QueuedJob":
+        return cls(job.id, job.processing_order or 0.0, job.workflow_name,
+                   job.channel_name, job.file_path)
+
+class JobQueue:
+    """Heap trong bộ nhớ mirror các job PENDING của bảng jobs
+
+    Mỗi lane (workflow, channel) có một heap riêng theo (processing_order, id),
+    chọn job tiếp theo chỉ cần so sánh đầu heap của các lane còn slot.
+    Job bị xóa được đánh dấu và bỏ qua khi lên đầu heap (lazy deletion).
+    """
+
+    def __init__(self):
+        self._lanes: Dict[Tuple[str, str], List[QueuedJob]] = {}
+        self._entries: Dict[int, QueuedJob] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, job_id: int) -> bool:
+        return job_id in self._entries
+
+    def clear(self):
+        self._lanes.clear()
+        self._entries.clear()
+
+    def rebuild(self, jobs: Iterable[QueuedJob]):
+        """Dựng lại toàn bộ heap, dùng khi khởi động"""
+        self.clear()
+        for entry in jobs:
+            self._entries[entry.id] = entry
+            self._lanes.setdefault(entry.lane, []).append(entry)
+        for heap in self._lanes.values():
+            heapq.heapify(heap)
+
+    def push(self, entry: QueuedJob):
+        """Thêm (hoặc thay thế) một job vào queue"""
+        self._entries[entry.id] = entry
+        heapq.heappush(self._lanes.setdefault(entry.lane, []), entry)
+
+    def remove(self, job_id: int) -> Optional[QueuedJob]:
+        """Bỏ job khỏi queue, entry còn trong heap sẽ bị bỏ qua sau"""
+        return self._entries.pop(job_id, None)
+
+    def _head(self, lane: Tuple[str, str]) -> Optional[QueuedJob]:
+        heap = self._lanes.get(lane)
+        while heap:
+            entry = heap[0]
+            if self._entries.get(entry.id) is entry:
+                return entry
+            heapq.heappop(heap)
+        if heap is not None:
+            del self._lanes[lane]
+        return None
+
+    def peek_heads(self, lane_available: Callable[[str, str], bool]) -> List[QueuedJob]:
+        """Lấy job đầu tiên của mỗi lane còn slot"""
+        heads = []
+        for lane in list(self._lanes):
+            head = self._head(lane)
+            if head and lane_available(*lane):
+                heads.append(head)
+        return heads
+
+    def pop_next(self, lane_available: Callable[[str, str], bool],
+                 select: Callable[[List[QueuedJob]], QueuedJob] = min) -> Optional[QueuedJob]:
+        """Lấy job tiếp theo trong các lane còn slot
+
+        Mặc định chọn (processing_order, id) nhỏ nhất, scheduler có thể truyền select riêng
+        """
+        heads = self.peek_heads(lane_available)
+        if not heads:
+            return None
+
+        entry = select(heads)
+        heapq.heappop(self._lanes[entry.lane])
+        del self._entries[entry.id]
+        return entry
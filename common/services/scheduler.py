@@ -0,0 +1,106 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from common.services.job_queue import QueuedJob
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Đổi datetime có timezone (ví dụ deadline "...Z" / "+07:00" từ API) về naive UTC như các cột DateTime"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def utc_timestamp(value: Optional[datetime] = None) -> float:
+    """Timestamp của datetime (naive được hiểu là UTC, cùng quy ước với created_at / processing_order),
+    không phụ thuộc timezone của máy"""
+    if value is None:
+        return datetime.now(timezone.utc).timestamp()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class Scheduler(ABC):
+    """Chính sách chọn job tiếp theo cho JobManager
+
+    order_key() tính processing_order lúc thêm job, giá trị này được lưu vào DB
+    và dùng làm key của heap trong mỗi lane (workflow, channel), nên không được
+    phụ thuộc vào thời điểm hiện tại. select() chọn một job trong các đầu lane
+    còn slot, có thể dùng thời điểm hiện tại (ví dụ trọng số theo thời gian chờ).
+    """
+    name = "base"
+
+    @abstractmethod
+    def order_key(self, created_ts: float, priority: int,
+                  deadline: Optional[datetime] = None) -> float:
+        """processing_order của job, nhỏ hơn thì chạy trước"""
+
+    def select(self, heads: List[QueuedJob], now: Optional[float] = None) -> QueuedJob:
+        return min(heads)
+
+class StaticScheduler(Scheduler):
+    """Công thức cũ: processing_order = created - priority * 10000 (mỗi mức priority đi trước ~2.7h)"""
+    name = "static"
+
+    def __init__(self, priority_step: float = 10000, **kwargs):
+        self.priority_step = float(priority_step)
+
+    def order_key(self, created_ts: float, priority: int,
+                  deadline: Optional[datetime] = None) -> float:
+        return created_ts - int(priority) * self.priority_step
+
+class AgingScheduler(Scheduler):
+    """Aging theo thời gian chờ, trọng số công bằng theo channel và deadline
+
+    Mỗi job có một "thời điểm đến ảo" (order_key):
+        min(created - priority * priority_boost, deadline - deadline_lead - deadline_boost)
+    Điểm của job tại thời điểm now là weight(channel) * (now - order_key), tức là
+    điểm tăng tuyến tính theo thời gian chờ: job LOW chỉ phải nhường job HIGH mới
+    đến tối đa 2 * priority_boost giây thay vì bị đói vô hạn khi HIGH đến liên tục.
+    Job có deadline được đẩy lên khi còn deadline_lead giây trước hạn.
+
+    Trong cùng một lane weight như nhau nên thứ tự theo order_key không đổi theo
+    thời gian (heap vẫn đúng); giữa các lane select() so sánh điểm tại now.
+    """
+    name = "aging"
+
+    def __init__(self, priority_boost: float = 1800, deadline_lead: float = 600,
+                 deadline_boost: float = 3600, channel_weights: Optional[Dict[str, float]] = None,
+                 **kwargs):
+        self.priority_boost = float(priority_boost)
+        self.deadline_lead = float(deadline_lead)
+        self.deadline_boost = float(deadline_boost)
+        self.channel_weights = {k: float(v) for k, v in (channel_weights or {}).items()}
+
+    def order_key(self, created_ts: float, priority: int,
+                  deadline: Optional[datetime] = None) -> float:
+        key = created_ts - int(priority) * self.priority_boost
+        if deadline is not None:
+            deadline_ts = utc_timestamp(deadline) if isinstance(deadline, datetime) else float(deadline)
+            key = min(key, deadline_ts - self.deadline_lead - self.deadline_boost)
+        return key
+
+    def weight(self, channel_name: str) -> float:
+        return self.channel_weights.get(channel_name, 1.0)
+
+    def select(self, heads: List[QueuedJob], now: Optional[float] = None) -> QueuedJob:
+        if now is None:
+            now = utc_timestamp()
+
+        def score(entry: QueuedJob):
+            # Cùng điểm thì job có order_key nhỏ hơn (đến sớm hơn) đi trước
+            waited = max(0.0, now - entry.processing_order)
+            return (-self.weight(entry.channel_name) * waited, entry.sort_key())
+
+        return min(heads, key=score)
+
+SCHEDULERS = {
+    StaticScheduler.name: StaticScheduler,
+    AgingScheduler.name: AgingScheduler,
+}
+
+def create_scheduler(config: Optional[Dict[str, Any]] = None) -> Scheduler:
+    """Tạo scheduler từ config, ví dụ {"policy": "aging", "priority_boost": 1800}"""
+    config = dict(config or {})
+    policy = config.pop("policy", StaticScheduler.name)
+    if policy not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler policy: {policy}")
+    return SCHEDULERS[policy](**config)
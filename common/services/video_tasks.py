@@ -0,0 +1,281 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from pydantic import BaseModel
+from common.config.settings import get_section
+from common.utils.http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+# Override bằng section "video_status" trong config.json
+DEFAULT_VIDEO_STATUS_CONFIG = {
+    # URL gốc của app workflow mà video server gọi lại khi task xong, theo tên workflow
+    # (ví dụ {"workflow2": "http://localhost:8010"}); để trống thì chỉ poll
+    "callback_urls": {},
+    # "host:port" của server nhận callback chạy cùng process với watcher (main.py), vd "0.0.0.0:8010";
+    # để trống thì không mở (Workflow1 chạy bằng FastAPI app đã có route callback)
+    "callback_listen": "",
+    "min_interval": 5,       # Giây chờ tối thiểu giữa hai lần poll
+    "max_interval": 120,     # Giây chờ tối đa giữa hai lần poll
+    "backoff": 1.5,          # Hệ số tăng khoảng poll khi server không báo progress/ETA
+    "jitter": 0.2,           # Lệch ngẫu nhiên ±20% để các task không poll cùng lúc
+    "max_poll_errors": 5,    # Số lần poll lỗi liên tiếp trước khi bỏ
+    "max_concurrent_polls": 8,  # Số request status song song tới một video server mỗi lượt
+    # Đường dẫn poll nhiều task một lần theo tên workflow, POST {"task_ids": [...]} -> {"tasks": [{"task_id", "status", ...}]}
+    "batch_status_paths": {}
+}
+
+CALLBACK_PATH = "/video/callback"
+TERMINAL_STATUSES = ("completed", "failed")
+
+def video_status_config() -> Dict:
+    """Config poll trạng thái video trong config.json, merge với giá trị mặc định"""
+    return get_section("video_status", DEFAULT_VIDEO_STATUS_CONFIG)
+
+def callback_url(workflow_name: str) -> Optional[str]:
+    """URL callback gửi kèm khi submit task video, None nếu workflow chưa cấu hình"""
+    base_url = video_status_config().get("callback_urls", {}).get(workflow_name)
+    return f"{base_url.rstrip('/')}{CALLBACK_PATH}" if base_url else None
+
+def _remaining_seconds(status: Dict[str, Any], elapsed: float) -> Optional[float]:
+    """Thời gian render còn lại theo ETA hoặc progress (0-1 hoặc 0-100) server báo về"""
+    eta = status.get("eta")
+    if isinstance(eta, (int, float)) and eta >= 0:
+        return float(eta)
+    progress = status.get("progress")
+    if isinstance(progress, (int, float)) and progress > 0:
+        fraction = progress / 100 if progress > 1 else progress
+        if fraction < 1:
+            return elapsed * (1 - fraction) / fraction
+    return None
+
+def next_poll_interval(status: Dict[str, Any], elapsed: float, previous: float, config: Dict) -> float:
+    """Khoảng chờ trước lần poll sau
+
+    Có ETA/progress thì poll lại khoảng nửa thời gian còn lại (càng gần xong càng poll dày),
+    không có thì tăng dần theo backoff. Luôn nằm trong [min_interval, max_interval], có jitter.
+    """
+    low, high = float(config["min_interval"]), float(config["max_interval"])
+    remaining = _remaining_seconds(status, elapsed)
+    if remaining is not None:
+        interval = remaining / 2
+    else:
+        interval = previous * float(config["backoff"]) if previous else low
+    interval = min(max(interval, low), high)
+    jitter = float(config["jitter"])
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+class _PolledTask:
+    """Một task video đang được theo dõi: future kết quả và lịch poll của riêng task"""
+
+    def __init__(self, task_id: str, label: str, loop: asyncio.AbstractEventLoop):
+        self.task_id = task_id
+        self.label = label
+        self.future: asyncio.Future = loop.create_future()
+        self.started = time.monotonic()
+        self.due = self.started
+        self.interval = 0.0
+        self.errors = 0
+        self.waiters = 0
+
+class VideoStatusPoller:
+    """Poll trạng thái mọi task đang render trên một video server bằng một vòng lặp duy nhất
+
+    Mỗi task có lịch poll riêng (next_poll_interval), các task đến hạn cùng lúc được hỏi
+    chung một lượt qua client dùng chung của event loop: một request batch nếu server có
+    batch_path, không thì song song tối đa max_concurrent_polls request. Khi task xong,
+    future của task được resolve cho mọi coroutine đang chờ.
+    """
+
+    def __init__(self, api_url: str, status_path: str, batch_path: Optional[str] = None):
+        self.api_url = api_url.rstrip('/')
+        self.status_path = status_path
+        self.batch_path = batch_path
+        self.config = video_status_config()
+        self.loop = asyncio.get_running_loop()
+        self.tasks: Dict[str, _PolledTask] = {}
+        self._wake = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._poll_slots = asyncio.Semaphore(int(self.config["max_concurrent_polls"]))
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None,
+                   label: Optional[str] = None) -> Dict[str, Any]:
+        """Chờ task tới trạng thái completed/failed, trả về status cuối
+
+        Raises:
+            asyncio.TimeoutError: Quá timeout giây mà task chưa xong
+            httpx.HTTPError: Poll lỗi (hoặc trả về không phải JSON) liên tiếp quá max_poll_errors lần
+        """
+        task_id = str(task_id)
+        task = self.tasks.get(task_id)
+        if task is None:
+            task = _PolledTask(task_id, label or task_id, self.loop)
+            self.tasks[task_id] = task
+        task.waiters += 1
+        self._wake.set()
+        if self._runner is None or self._runner.done():
+            self._runner = self.loop.create_task(self._run())
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task.future), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"Video task {task.label} not finished after {timeout}s")
+        finally:
+            task.waiters -= 1
+            if task.waiters == 0 and self.tasks.get(task_id) is task:
+                del self.tasks[task_id]
+
+    def poke(self, task_id: str):
+        """Poll task ngay ở lượt tới (video server vừa gọi callback)"""
+        task = self.tasks.get(str(task_id))
+        if task is not None and not task.future.done():
+            task.due = 0
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            pending = [task for task in self.tasks.values() if not task.future.done()]
+            if not pending:
+                return
+            now = time.monotonic()
+            due = [task for task in pending if task.due <= now]
+            if due:
+                try:
+                    await self._poll(due)
+                except Exception as e:
+                    # Lỗi không lường trước: báo cho các task đang chờ thay vì để chúng chờ mãi
+                    logger.error(f"Video status poller for {self.api_url} failed: {str(e)}")
+                    for task in due:
+                        if not task.future.done():
+                            task.future.set_exception(e)
+                continue
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=min(task.due for task in pending) - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, due: List[_PolledTask]):
+        client = get_client()
+        if self.batch_path:
+            try:
+                response = await client.post(f"{self.api_url}{self.batch_path}",
+                                             json={"task_ids": [task.task_id for task in due]}, timeout=60)
+                response.raise_for_status()
+                statuses = {str(item.get("task_id")): item for item in response.json().get("tasks", [])}
+                results = [(task, statuses.get(task.task_id, {}), None) for task in due]
+            except (httpx.HTTPError, ValueError) as e:
+                results = [(task, None, e) for task in due]
+        else:
+            async def fetch(task: _PolledTask):
+                async with self._poll_slots:
+                    try:
+                        response = await client.get(
+                            f"{self.api_url}{self.status_path.format(task_id=task.task_id)}", timeout=60
+                        )
+                        response.raise_for_status()
+                        return task, response.json(), None
+                    except (httpx.HTTPError, ValueError) as e:
+                        return task, None, e
+
+            results = await asyncio.gather(*(fetch(task) for task in due))
+
+        logger.debug(f"Polled {len(due)} video tasks on {self.api_url} ({len(self.tasks)} in flight)")
+        for task, status, error in results:
+            self._update(task, status, error)
+
+    def _update(self, task: _PolledTask, status: Optional[Dict[str, Any]], error: Optional[Exception]):
+        if task.future.done():
+            return
+        now = time.monotonic()
+        if error is not None:
+            task.errors += 1
+            if task.errors >= int(self.config["max_poll_errors"]):
+                task.future.set_exception(error)
+                return
+            logger.warning(f"Video task {task.label} status poll failed "
+                           f"({task.errors}/{self.config['max_poll_errors']}): {str(error)}")
+            status = {}
+        else:
+            task.errors = 0
+
+        if status.get("status") in TERMINAL_STATUSES:
+            logger.info(f"Video task {task.label} {status['status']} after {now - task.started:.0f}s")
+            task.future.set_result(status)
+            return
+
+        task.interval = next_poll_interval(status, now - task.started, task.interval, self.config)
+        task.due = now + task.interval
+        logger.info(f"Video task {task.label} {status.get('status', 'unknown')} "
+                    f"(progress: {status.get('progress')}, eta: {status.get('eta')}), next poll in {task.interval:.0f}s")
+
+# Mỗi (event loop, video server, kiểu status) một poller; callback đến từ loop của FastAPI
+_pollers: Dict[Tuple[int, str, str], VideoStatusPoller] = {}
+_pollers_lock = threading.Lock()
+
+def status_poller(api_url: str, status_path: str, workflow_name: Optional[str] = None) -> VideoStatusPoller:
+    """Poller dùng chung cho mọi task trên video server api_url của event loop hiện tại
+
+    Args:
+        status_path: Đường dẫn status của một task, có {task_id}
+        workflow_name: Lấy batch_status_paths[workflow_name] trong config nếu server hỗ trợ poll batch
+    """
+    key = (id(asyncio.get_running_loop()), api_url.rstrip('/'), status_path)
+    with _pollers_lock:
+        poller = _pollers.get(key)
+        if poller is None:
+            batch_path = video_status_config().get("batch_status_paths", {}).get(workflow_name) if workflow_name else None
+            poller = VideoStatusPoller(api_url, status_path, batch_path)
+            _pollers[key] = poller
+        return poller
+
+def notify_task(task_id: str) -> bool:
+    """Báo các poller đang theo dõi task_id poll lại ngay (gọi từ bất kỳ thread/loop nào)"""
+    with _pollers_lock:
+        pollers = [poller for poller in _pollers.values() if str(task_id) in poller.tasks]
+    for poller in pollers:
+        poller.loop.call_soon_threadsafe(poller.poke, task_id)
+    return bool(pollers)
+
+class VideoCallback(BaseModel):
+    task_id: str
+    status: Optional[str] = None
+
+router = APIRouter()
+
+@router.post(CALLBACK_PATH)
+async def video_callback(payload: VideoCallback):
+    """Video server gọi khi task đổi trạng thái (xong/lỗi), đánh thức job đang chờ task đó"""
+    waiting = notify_task(payload.task_id)
+    logger.info(f"Video callback for task {payload.task_id} (status: {payload.status}, waiting: {waiting})")
+    return {"task_id": payload.task_id, "waiting": waiting}
+
+def start_callback_server(listen: Optional[str] = None) -> Optional[threading.Thread]:
+    """Mở server nhận callback của video server trên thread riêng (process chạy watcher không có FastAPI app)
+
+    Callback đánh thức poller của loop watcher qua notify_task (call_soon_threadsafe).
+
+    Args:
+        listen: "host:port", mặc định video_status.callback_listen; rỗng thì không mở
+    """
+    listen = listen if listen is not None else video_status_config().get("callback_listen")
+    if not listen:
+        return None
+    import uvicorn
+
+    host, _, port = listen.rpartition(':')
+    app = FastAPI()
+    app.include_router(router)
+    # Server chạy ngoài main thread nên uvicorn không cài signal handler, Ctrl+C vẫn tới watcher
+    server = uvicorn.Server(uvicorn.Config(app, host=host or "0.0.0.0", port=int(port), log_level="warning"))
+    thread = threading.Thread(target=server.run, name="video-callback-server", daemon=True)
+    thread.start()
+    logger.info(f"Video callback server listening on {listen}{CALLBACK_PATH}")
+    return thread
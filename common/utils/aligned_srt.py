@@ -0,0 +1,175 @@
+import mmap
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from common.utils.wav_utils import read_wav_info
+
+FRAME_MS = 10               # Độ dài một frame khi tính năng lượng
+SILENCE_DB = -40.0          # Frame có RMS dưới ngưỡng này (dBFS) là im lặng
+MIN_SILENCE_MS = 120        # Khoảng im lặng ngắn hơn được coi là một phần của từ
+PAUSE_CHARS = (',', ';', ':', '.', '!', '?', '…')  # Chỗ TTS thường ngắt nghỉ
+SKIP_COST = 0.6             # Giây, chi phí bỏ qua một chỗ ngắt/khoảng im lặng khi ghép
+
+DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+def frame_levels(wav_file: str, frame_ms: int = FRAME_MS) -> Tuple[np.ndarray, float]:
+    """RMS (dBFS) của từng frame trong file WAV, đọc sample qua mmap
+
+    Returns:
+        (levels, frame_seconds)
+    """
+    info = read_wav_info(wav_file)
+    dtype = DTYPES.get(info.sample_width)
+    if dtype is None:
+        raise ValueError(f"Unsupported sample width {info.sample_width} in {wav_file}")
+
+    frame_len = max(1, int(info.sample_rate * frame_ms / 1000))
+    with open(wav_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        count = info.data_size // info.sample_width
+        samples = np.frombuffer(mapped, dtype=dtype, count=count, offset=info.data_offset)
+        samples = samples[:len(samples) - len(samples) % info.channels].reshape(-1, info.channels)
+        frames = len(samples) // frame_len
+        data = samples[:frames * frame_len].astype(np.float32)
+        del samples
+
+    if info.sample_width == 1:
+        data = data - 128.0
+    full_scale = float(2 ** (8 * info.sample_width - 1))
+    data = data.mean(axis=1).reshape(frames, frame_len) / full_scale
+    rms = np.sqrt(np.mean(data * data, axis=1))
+    levels = 20 * np.log10(np.maximum(rms, 1e-9))
+    return levels, frame_len / float(info.sample_rate)
+
+def speech_spans(levels: np.ndarray, frame_seconds: float, start: float, end: float,
+                 silence_db: float = SILENCE_DB, min_silence_ms: int = MIN_SILENCE_MS) -> List[Tuple[float, float]]:
+    """Các đoạn có tiếng trong [start, end], bỏ khoảng im lặng dài hơn min_silence_ms"""
+    first = int(start / frame_seconds)
+    last = min(len(levels), int(np.ceil(end / frame_seconds)))
+    if last <= first:
+        return [(start, end)]
+
+    voiced = levels[first:last] > silence_db
+    min_gap = max(1, int(min_silence_ms / 1000 / frame_seconds))
+
+    spans: List[Tuple[int, int]] = []
+    index = 0
+    while index < len(voiced):
+        if not voiced[index]:
+            index += 1
+            continue
+        span_start = index
+        gap = 0
+        while index < len(voiced) and gap < min_gap:
+            gap = 0 if voiced[index] else gap + 1
+            index += 1
+        spans.append((span_start, index - gap))
+
+    if not spans:
+        return [(start, end)]
+    return [
+        (round((first + a) * frame_seconds, 3), round((first + b) * frame_seconds, 3))
+        for a, b in spans
+    ]
+
+def _word_weight(word: str) -> float:
+    """Thời lượng tương đối của một từ theo số ký tự (khoảng nghỉ đã bị bỏ khỏi trục thời gian)"""
+    return len(word.strip('"\'()[]')) + 1
+
+def _match_pauses(expected: List[float], gaps: List[float], skip_cost: float) -> List[Tuple[float, float]]:
+    """Ghép các chỗ ngắt theo dấu câu (vị trí dự kiến) với các khoảng im lặng tìm được
+
+    Alignment đơn điệu (như edit distance): ghép một cặp tốn |dự kiến - thực tế|, bỏ qua một
+    chỗ ngắt (đọc liền) hoặc một khoảng im lặng (ngắt giữa câu) tốn skip_cost.
+
+    Returns:
+        List[(dự kiến, thực tế)] của các cặp được ghép, theo thứ tự
+    """
+    m, n = len(expected), len(gaps)
+    cost = np.full((m + 1, n + 1), np.inf)
+    step = np.zeros((m + 1, n + 1), dtype=np.int8)  # 1 ghép, 2 bỏ chỗ ngắt, 3 bỏ khoảng im lặng
+    cost[0, 0] = 0
+    for i in range(m + 1):
+        for j in range(n + 1):
+            current = cost[i, j]
+            if i < m and j < n and current + abs(expected[i] - gaps[j]) < cost[i + 1, j + 1]:
+                cost[i + 1, j + 1] = current + abs(expected[i] - gaps[j])
+                step[i + 1, j + 1] = 1
+            if i < m and current + skip_cost < cost[i + 1, j]:
+                cost[i + 1, j] = current + skip_cost
+                step[i + 1, j] = 2
+            if j < n and current + skip_cost < cost[i, j + 1]:
+                cost[i, j + 1] = current + skip_cost
+                step[i, j + 1] = 3
+
+    pairs = []
+    i, j = m, n
+    while i or j:
+        move = step[i, j]
+        if move == 1:
+            pairs.append((expected[i - 1], gaps[j - 1]))
+            i, j = i - 1, j - 1
+        elif move == 2:
+            i -= 1
+        else:
+            j -= 1
+    return pairs[::-1]
+
+def distribute_words(text: str, spans: List[Tuple[float, float]], skip_cost: float = SKIP_COST) -> List[Dict]:
+    """Chia các từ của text vào phần có tiếng của spans
+
+    Từ được chia theo độ dài trên trục thời gian chỉ có tiếng (bỏ khoảng im lặng); các chỗ
+    ngắt theo dấu câu được kéo về khoảng im lặng gần nhất để sai số không dồn tới cuối chunk.
+    """
+    words = text.split()
+    if not words:
+        return []
+    weights = np.array([_word_weight(word) for word in words], dtype=float)
+    lengths = [b - a for a, b in spans]
+    speech = sum(lengths)
+    bounds = np.concatenate(([0.0], np.cumsum(weights) / weights.sum() * speech))
+
+    # Vị trí dự kiến sau mỗi từ có dấu câu và vị trí thật của mỗi khoảng im lặng (trên trục có tiếng)
+    pause_index = [k for k, word in enumerate(words[:-1], 1) if word[-1] in PAUSE_CHARS]
+    gaps = list(np.cumsum(lengths)[:-1])
+    anchors = _match_pauses([bounds[k] for k in pause_index], gaps, skip_cost)
+    src = [0.0] + [e for e, _ in anchors] + [speech]
+    dst = [0.0] + [o for _, o in anchors] + [speech]
+    warped = np.interp(bounds, src, dst)
+
+    def to_time(offset: float, end: bool) -> float:
+        """Vị trí trên trục thời gian chỉ có tiếng -> thời gian thật
+        (điểm đúng ranh giới span: đầu span sau nếu là start, cuối span trước nếu là end)"""
+        for length, (a, b) in zip(lengths, spans):
+            if offset < length or (end and offset <= length):
+                return a + offset
+            offset -= length
+        return spans[-1][1]
+
+    return [
+        {"word": word, "start": round(to_time(warped[k], False), 3), "end": round(to_time(warped[k + 1], True), 3)}
+        for k, word in enumerate(words)
+    ]
+
+def align_script(wav_file: str, text: str, chunks: Optional[List[Dict]] = None,
+                 silence_db: float = SILENCE_DB, min_silence_ms: int = MIN_SILENCE_MS) -> List[Dict]:
+    """Word timestamps cho audio TTS từ script đã biết, không cần Whisper
+
+    Mỗi chunk (timing lưu khi TTS theo chunk) được xử lý riêng, không có chunk thì
+    cả file là một chunk. Trong chunk, từ được chia theo độ dài vào các đoạn có tiếng
+    tìm bằng phát hiện im lặng trên sample.
+
+    Returns:
+        List[Dict]: [{word, start, end}], dùng được với srt_builder.build_cues
+    """
+    levels, frame_seconds = frame_levels(wav_file)
+    duration = len(levels) * frame_seconds
+    if not chunks:
+        chunks = [{"text": text, "start": 0.0, "end": duration}]
+
+    words: List[Dict] = []
+    for chunk in chunks:
+        spans = speech_spans(levels, frame_seconds, chunk["start"], min(chunk["end"], duration),
+                             silence_db, min_silence_ms)
+        words.extend(distribute_words(chunk["text"], spans))
+    return words
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional
+from common.utils.file_transfer import move_file
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIRNAME = ".manifests"
+
+class ArtifactManifest:
+    """Danh sách file một job (một prefix) đã tạo ra hoặc dùng, lưu ra file JSON
+
+    Mỗi stage ghi lại đúng file nó tạo (script, wav, srt, thumbnail...), khi hoàn thành
+    hoặc lỗi chỉ chuyển các file đó, không quét thư mục theo prefix (prefix "12" không
+    lấy nhầm file của "123").
+    """
+    _instances: Dict[str, "ArtifactManifest"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict] = {"files": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                logger.warning(f"Invalid manifest {path}, starting fresh: {str(e)}")
+
+    @classmethod
+    def open(cls, path: str) -> "ArtifactManifest":
+        """Lấy manifest dùng chung trong process cho một file"""
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @classmethod
+    def for_prefix(cls, channel_dir: str, prefix: str) -> "ArtifactManifest":
+        """Manifest của một prefix, nằm trong {channel_dir}/.manifests"""
+        return cls.open(os.path.join(str(channel_dir), MANIFEST_DIRNAME, f"{prefix}.json"))
+
+    def add(self, path: str, kind: str = "file"):
+        """Ghi một file của job (đường dẫn tuyệt đối) và flush ra đĩa"""
+        if not path:
+            return
+        path = os.path.abspath(str(path))
+        with self._lock:
+            if self._data["files"].get(path, {}).get("kind") == kind:
+                return
+            self._data["files"][path] = {"kind": kind, "added_at": time.time()}
+            self._flush()
+
+    def files(self, kinds: Optional[Iterable[str]] = None, exclude: Iterable[str] = ()) -> List[str]:
+        """Các file đã ghi và còn tồn tại, lọc theo kind"""
+        kinds = set(kinds) if kinds is not None else None
+        exclude = set(exclude)
+        with self._lock:
+            entries = list(self._data["files"].items())
+        return [
+            path for path, entry in entries
+            if (kinds is None or entry.get("kind") in kinds)
+            and entry.get("kind") not in exclude
+            and os.path.exists(path)
+        ]
+
+    def move_to(self, target_dir: str, kinds: Optional[Iterable[str]] = None) -> List[str]:
+        """Chuyển các file của job vào target_dir (giữ tên file), trả về đường dẫn mới"""
+        moved = []
+        for path in self.files(kinds):
+            target = os.path.join(str(target_dir), os.path.basename(path))
+            logger.info(f"Moving {path} to {target}")
+            move_file(path, target)
+            moved.append(target)
+        return moved
+
+    def clear(self):
+        """Xóa manifest khi job đã xong (file đã được chuyển đi)"""
+        with self._lock:
+            self._data = {"files": {}}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        with self._instances_lock:
+            self._instances.pop(self.path, None)
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+def job_manifest(context, channel_dir: str, prefix: str) -> ArtifactManifest:
+    """Manifest của job trong context, mở theo prefix nếu context chưa có"""
+    manifest = context.get_state('manifest')
+    if manifest is None:
+        manifest = ArtifactManifest.for_prefix(channel_dir, prefix)
+        context.update_state('manifest', manifest)
+    return manifest
@@ -1,8 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import os
-import shutil
 import logging
+from common.utils.file_transfer import move_file
 
 class WorkflowContext:
     """Context object passed between workflow steps"""
@@ -22,7 +22,28 @@ class WorkflowContext:
     def get_state(self, key: str) -> Optional[Any]:
         """Get value from workflow state"""
         return self._state.get(key)
-        
+
+    def state_keys(self) -> List[str]:
+        """Các key đã có giá trị trong state"""
+        return [key for key, value in self._state.items() if value is not None]
+
+    def for_file(self, file_path: str) -> "WorkflowContext":
+        """Context cho một file khác của cùng job (ví dụ hook và KB của một pair),
+        dùng chung state và results"""
+        child = WorkflowContext(self.workflow_name, file_path, self.channel_name)
+        child._state = self._state
+        if not hasattr(self, 'results'):
+            self.results = {}
+        child.results = self.results
+        return child
+
+    def register_artifact(self, path: str, kind: str = "file"):
+        """Ghi file job tạo ra vào manifest của job (state 'manifest') để finalize/lỗi
+        chuyển đúng các file này"""
+        manifest = self.get_state('manifest')
+        if manifest is not None:
+            manifest.add(path, kind)
+
     def move_to_working(self, source_path: str, filename: str = None) -> str:
         """Move file to working directory"""
         if filename is None:
@@ -78,8 +99,7 @@ class WorkflowContext:
     def _move_file(self, source: str, target: str):
         """Move file with logging"""
         try:
-            os.makedirs(os.path.dirname(target), exist_ok=True)
-            shutil.move(source, target)
+            move_file(source, target)
             self.logger.info(f"Moved file from {source} to {target}")
         except Exception as e:
             self.logger.error(f"Failed to move file from {source} to {target}: {str(e)}")
@@ -87,6 +107,11 @@ class WorkflowContext:
 
 class BaseService(ABC):
     """Base class for all workflow services"""
+
+    # Các key trong context state mà service cần và tạo ra, để BaseWorkflow
+    # chạy các service độc lập song song (để trống thì chạy sau service trước đó)
+    consumes: Tuple[str, ...] = ()
+    produces: Tuple[str, ...] = ()
     
     def __init__(self, config: Dict = None):
         self.config = config or {}
@@ -2,6 +2,7 @@ import asyncio
 from typing import List
 from common.models.job import Job
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.dag import DagStep, run_dag
 
 class BaseWorkflow:
     """Base class cho các workflow"""
@@ -13,15 +14,24 @@ class BaseWorkflow:
     def add_service(self, service: BaseService):
         """Thêm một service vào workflow"""
         self.services.append(service)
+
+    def build_steps(self) -> List[DagStep]:
+        """Tạo DAG từ các service theo consumes/produces
+
+        Service không khai báo consumes/produces chạy sau service đứng trước nó
+        (giữ thứ tự tuần tự như cũ).
+        """
+        steps = []
+        for service in self.services:
+            name = service.__class__.__name__
+            declared = service.consumes or service.produces
+            after = () if declared or not steps else (steps[-1].name,)
+            steps.append(DagStep(
+                name, service.process,
+                consumes=service.consumes, produces=service.produces, after=after
+            ))
+        return steps
         
     async def process(self, context: WorkflowContext):
-        """Process một context qua tất cả các service"""
-        for service in self.services:
-            # Gọi service và lưu kết quả vào context
-            result = await service.process(context)
-            if result:
-                if not hasattr(context, 'results'):
-                    context.results = {}
-                context.results[service.__class__.__name__] = result
-                
-        return context.results
+        """Process một context qua các service, service độc lập chạy song song"""
+        return await run_dag(self.build_steps(), context)
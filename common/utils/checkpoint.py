@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+from common.utils.file_transfer import move_file
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIRNAME = ".checkpoints"
+
+def file_digest(path: str) -> str:
+    """SHA1 của nội dung file, dùng làm tham số cho stage (script thay đổi thì chạy lại)"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+class StageCheckpoint:
+    """Lưu kết quả từng stage của một job (một prefix) ra file JSON
+
+    Mỗi stage lưu status, tham số đã dùng, các file output và dữ liệu phụ
+    (ví dụ task_id của video). Khi job chạy lại, stage đã xong với cùng tham số
+    và file output còn tồn tại sẽ được bỏ qua.
+    """
+    _instances: Dict[str, "StageCheckpoint"] = {}
+    _instances_lock = threading.Lock()
+
+    DONE = "done"
+    RUNNING = "running"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {"stages": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except Exception as e:
+                logger.warning(f"Invalid checkpoint {path}, starting fresh: {str(e)}")
+
+    @classmethod
+    def open(cls, path: str) -> "StageCheckpoint":
+        """Lấy checkpoint dùng chung trong process cho một file"""
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @classmethod
+    def for_prefix(cls, channel_dir: str, prefix: str) -> "StageCheckpoint":
+        """Checkpoint của một prefix, nằm trong {channel_dir}/.checkpoints"""
+        return cls.open(os.path.join(channel_dir, CHECKPOINT_DIRNAME, f"{prefix}.json"))
+
+    def _stage(self, stage: str) -> Dict[str, Any]:
+        return self._data["stages"].get(stage, {})
+
+    def load(self, stage: str, params: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+        """Trả về output của stage nếu đã xong, cùng tham số và file output còn tồn tại"""
+        entry = self._stage(stage)
+        if entry.get("status") != self.DONE:
+            return None
+        if params is not None and entry.get("params") != params:
+            logger.info(f"Checkpoint {stage} params changed, stage will run again")
+            return None
+
+        files = entry.get("files", {})
+        missing = [p for p in files.values() if p and not os.path.exists(p)]
+        if missing:
+            logger.info(f"Checkpoint {stage} missing outputs {missing}, stage will run again")
+            return None
+
+        logger.info(f"Resuming from checkpoint: stage {stage} already done")
+        return {**entry.get("data", {}), **files}
+
+    def pending(self, stage: str) -> Optional[Dict[str, Any]]:
+        """Dữ liệu của stage đang chạy dở (ví dụ task video đã submit)"""
+        entry = self._stage(stage)
+        if entry.get("status") != self.RUNNING:
+            return None
+        return entry.get("data", {})
+
+    def save(self, stage: str, status: str = DONE, params: Optional[Dict] = None,
+             files: Optional[Dict[str, str]] = None, **data):
+        """Ghi kết quả của stage và flush ra đĩa"""
+        with self._lock:
+            self._data["stages"][stage] = {
+                "status": status,
+                "params": params,
+                "files": {k: str(v) for k, v in (files or {}).items() if v},
+                "data": data,
+                "updated_at": time.time()
+            }
+            self._flush()
+
+    def discard(self, stage: str):
+        """Bỏ checkpoint của một stage"""
+        with self._lock:
+            if self._data["stages"].pop(stage, None) is not None:
+                self._flush()
+
+    def restore(self, error_dir: str):
+        """Đưa các file output đã bị chuyển vào Error về lại vị trí cũ trước khi chạy lại"""
+        for stage in self._data["stages"].values():
+            for path in stage.get("files", {}).values():
+                if not path or os.path.exists(path):
+                    continue
+                moved = os.path.join(error_dir, os.path.basename(path))
+                if os.path.exists(moved):
+                    move_file(moved, path)
+                    logger.info(f"Restored checkpoint output {moved} to {path}")
+
+    def clear(self):
+        """Xóa checkpoint sau khi job hoàn thành"""
+        with self._lock:
+            self._data = {"stages": {}}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        with self._instances_lock:
+            self._instances.pop(self.path, None)
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
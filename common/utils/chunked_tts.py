@@ -0,0 +1,88 @@
+import os
+import shutil
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from common.config.settings import get_section
+from common.utils.dag import gather_or_cancel
+from common.utils.stage_gate import stage_gate
+from common.utils.tts_cache import cache_key
+from common.utils.wav_utils import split_text, stitch_wavs, save_chunk_timings
+
+logger = logging.getLogger(__name__)
+
+# Override bằng section "tts" trong config.json
+DEFAULT_TTS_CONFIG = {
+    "chunking": False,       # Chia script thành chunk và TTS song song
+    "chunk_chars": 1500,     # Độ dài tối đa một chunk (ký tự)
+    "chunk_silence_ms": 250  # Khoảng lặng chèn giữa các chunk khi nối
+}
+
+def tts_config() -> Dict:
+    """Config TTS trong config.json, merge với giá trị mặc định"""
+    return get_section("tts", DEFAULT_TTS_CONFIG)
+
+def use_chunking(text: str, config: Dict) -> bool:
+    """Chỉ chia chunk khi bật chunking và script dài hơn một chunk"""
+    return bool(config.get("chunking")) and len(text) > int(config.get("chunk_chars", 1500))
+
+async def synthesize_chunked(text: str, work_dir: str, output_wav: str,
+                             synthesize: Callable[[str, str, str], Awaitable[str]],
+                             chunk_chars: int = 1500, silence_ms: int = 250,
+                             label: Optional[str] = None, params: Optional[Dict] = None) -> List[Dict]:
+    """TTS từng chunk song song rồi nối thành output_wav
+
+    Mỗi chunk lấy một slot của stage 'voice' (giới hạn số request TTS đồng thời), TTS
+    server cho từng chunk do backend pool 'tts' chọn. Chunk đã có wav với cùng text và cùng
+    params được dùng lại khi chạy lại sau lỗi. Thời điểm từng chunk được lưu vào {output}.chunks.json.
+
+    Args:
+        synthesize: Coroutine (text_file, output_dir, output_filename) -> đường dẫn wav
+        params: Tham số TTS (voice, speed...); khác lần chạy trước thì bỏ hết chunk cũ trong work_dir
+
+    Returns:
+        List[Dict]: [{index, text, start, end}] của các chunk trong output_wav
+    """
+    label = label or os.path.basename(output_wav)
+    chunks = split_text(text, chunk_chars)
+    params_file = os.path.join(work_dir, "params.key")
+    params_key = cache_key(**(params or {}))
+    if os.path.isdir(work_dir):
+        previous = None
+        if os.path.exists(params_file):
+            with open(params_file, 'r', encoding='utf-8') as f:
+                previous = f.read()
+        if previous != params_key:
+            # Chunk của lần chạy trước với voice/speed khác: không trộn giọng cũ và mới
+            logger.info(f"TTS {label}: TTS params changed, discarding previous chunks")
+            shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    with open(params_file, 'w', encoding='utf-8') as f:
+        f.write(params_key)
+    logger.info(f"TTS {label}: {len(chunks)} chunks")
+
+    async def run_chunk(index: int, chunk_text: str) -> str:
+        text_file = os.path.join(work_dir, f"chunk_{index:04d}.txt")
+        wav_name = f"chunk_{index:04d}.wav"
+        wav_file = os.path.join(work_dir, wav_name)
+
+        if os.path.exists(wav_file) and os.path.exists(text_file):
+            with open(text_file, 'r', encoding='utf-8') as f:
+                if f.read() == chunk_text:
+                    return wav_file
+
+        with open(text_file, 'w', encoding='utf-8') as f:
+            f.write(chunk_text)
+        async with stage_gate('voice').slot(f"{label}#{index}"):
+            return await synthesize(text_file, work_dir, wav_name)
+
+    wav_files = await gather_or_cancel(*(run_chunk(i, c) for i, c in enumerate(chunks)))
+    offsets = await asyncio.to_thread(stitch_wavs, wav_files, output_wav, silence_ms)
+
+    timings = [
+        {"index": i, "text": chunk_text, "start": start, "end": end}
+        for i, (chunk_text, (start, end)) in enumerate(zip(chunks, offsets))
+    ]
+    save_chunk_timings(output_wav, timings)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return timings
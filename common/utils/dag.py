@@ -0,0 +1,153 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+class DagStep:
+    """Một bước trong workflow: đọc các key consumes từ context, trả về dict chứa các key produces"""
+
+    def __init__(self, name: str, fn: Callable[[Any], Awaitable[Optional[Dict]]],
+                 consumes: Sequence[str] = (), produces: Sequence[str] = (),
+                 after: Sequence[str] = ()):
+        """
+        Args:
+            name: Tên bước (dùng cho log và timing)
+            fn: Coroutine function nhận context
+            consumes: Các key trong context state cần có trước khi chạy
+            produces: Các key bước này ghi vào context state từ dict kết quả
+            after: Tên các bước phải xong trước dù không trao đổi key (thứ tự thuần)
+        """
+        self.name = name
+        self.fn = fn
+        self.consumes = tuple(consumes)
+        self.produces = tuple(produces)
+        self.after = tuple(after)
+
+    def __repr__(self) -> str:
+        return f"DagStep({self.name}, consumes={self.consumes}, produces={self.produces})"
+
+class DagError(Exception):
+    """DAG không hợp lệ: thiếu input, key bị nhiều bước produce hoặc có vòng"""
+
+def _dependencies(steps: List[DagStep], available: Iterable[str]) -> Dict[str, Set[str]]:
+    """Tính các bước mà mỗi bước phụ thuộc vào, kiểm tra DAG hợp lệ"""
+    available = set(available)
+    producers: Dict[str, str] = {}
+    names = set()
+    for step in steps:
+        if step.name in names:
+            raise DagError(f"Duplicate step name: {step.name}")
+        names.add(step.name)
+        for key in step.produces:
+            if key in producers:
+                raise DagError(f"Key {key} produced by both {producers[key]} and {step.name}")
+            producers[key] = step.name
+
+    deps: Dict[str, Set[str]] = {}
+    for step in steps:
+        step_deps = set(step.after)
+        for key in step.consumes:
+            if key in producers:
+                step_deps.add(producers[key])
+            elif key not in available:
+                raise DagError(f"Step {step.name} consumes {key}, which no step produces")
+        unknown = step_deps - names
+        if unknown:
+            raise DagError(f"Step {step.name} runs after unknown steps {sorted(unknown)}")
+        deps[step.name] = step_deps
+
+    # Kiểm tra vòng bằng topological sort
+    remaining = {name: set(d) for name, d in deps.items()}
+    while remaining:
+        ready = [name for name, d in remaining.items() if not d]
+        if not ready:
+            raise DagError(f"Cycle between steps {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for d in remaining.values():
+            d.difference_update(ready)
+
+    return deps
+
+async def gather_or_cancel(*aws: Awaitable) -> List[Any]:
+    """Như asyncio.gather nhưng một coroutine lỗi thì hủy các coroutine còn lại rồi raise lỗi đó"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def run_dag(steps: List[DagStep], context) -> Dict[str, Any]:
+    """Chạy các bước theo phụ thuộc: bước độc lập chạy song song, bước phụ thuộc
+    chạy ngay khi input sẵn sàng. Một bước lỗi thì hủy các bước đang chạy và raise lỗi đó.
+
+    Kết quả mỗi bước lưu vào context.results[step.name], các key produces lưu vào
+    context state, thời gian từng bước lưu vào state 'step_timings'.
+
+    Returns:
+        Dict: context.results
+    """
+    if not hasattr(context, 'results'):
+        context.results = {}
+    deps = _dependencies(steps, context.state_keys())
+    by_name = {step.name: step for step in steps}
+
+    timings: Dict[str, Dict[str, float]] = context.get_state('step_timings') or {}
+    context.update_state('step_timings', timings)
+    started_at = time.monotonic()
+
+    done: Set[str] = set()
+    running: Dict[asyncio.Task, str] = {}
+
+    async def run_step(step: DagStep):
+        started = time.monotonic()
+        timings[step.name] = {"start": round(started - started_at, 3)}
+        try:
+            result = await step.fn(context)
+        finally:
+            timings[step.name]["duration"] = round(time.monotonic() - started, 3)
+        return result
+
+    def start_ready():
+        for name, step_deps in deps.items():
+            if name in done or name in running.values():
+                continue
+            if step_deps <= done:
+                running[asyncio.create_task(run_step(by_name[name]))] = name
+
+    try:
+        start_ready()
+        while running:
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = running.pop(task)
+                step = by_name[name]
+                result = task.result()  # raise lỗi của bước, các bước khác bị hủy ở finally
+
+                context.results[name] = result
+                for key in step.produces:
+                    if not result or key not in result:
+                        raise DagError(f"Step {name} did not produce {key}")
+                    context.update_state(key, result[key])
+                done.add(name)
+            start_ready()
+    finally:
+        # Lỗi hoặc bị hủy: hủy các bước anh em còn đang chạy
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+        summary = ", ".join(
+            f"{name} {timing['duration']:.1f}s" for name, timing in timings.items() if "duration" in timing
+        )
+        logger.info(f"Workflow steps for {context.file_path}: {summary} "
+                    f"(total {time.monotonic() - started_at:.1f}s)")
+
+    return context.results
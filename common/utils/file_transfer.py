@@ -0,0 +1,131 @@
+import os
+import errno
+import shutil
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mỗi lần gọi copy_file_range/sendfile copy tối đa chừng này byte (kernel tự copy, không qua Python)
+KERNEL_COPY_BLOCK = 64 * 1024 * 1024
+
+class TransferError(OSError):
+    """File đích không khớp file nguồn sau khi copy"""
+
+def _checksum(path: str) -> str:
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _kernel_copy(fsrc, fdst, size: int) -> bool:
+    """Copy bằng copy_file_range (Linux, có thể reflink) rồi sendfile; False nếu không dùng được"""
+    for name in ("copy_file_range", "sendfile"):
+        copy = getattr(os, name, None)
+        if copy is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if name == "copy_file_range":
+                    sent = copy(fsrc.fileno(), fdst.fileno(), min(KERNEL_COPY_BLOCK, size - offset), offset, offset)
+                else:
+                    sent = copy(fdst.fileno(), fsrc.fileno(), offset, min(KERNEL_COPY_BLOCK, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as e:
+            # Kernel/filesystem không hỗ trợ (ổ mạng, kernel cũ, sendfile tới file thường
+            # trên macOS báo ENOTSOCK...) thì thử cách tiếp theo
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                               errno.EBADF, errno.ENOTSOCK):
+                raise
+            fdst.seek(0)
+            fdst.truncate()
+            continue
+        if offset == size:
+            return True
+        fdst.seek(0)
+        fdst.truncate()
+    return False
+
+def _copy_data(source: str, target: str, checksum: bool):
+    """Copy nội dung sang file tạm cạnh target, kiểm tra rồi os.replace (target không bao giờ dở dang)"""
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp_path = f"{target}.part"
+    size = os.path.getsize(source)
+    try:
+        with open(source, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+            if not _kernel_copy(fsrc, fdst, size):
+                fsrc.seek(0)
+                shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        shutil.copystat(source, tmp_path)
+
+        copied = os.path.getsize(tmp_path)
+        if copied != size:
+            raise TransferError(f"Size mismatch copying {source} to {target}: {copied} != {size}")
+        if checksum and _checksum(source) != _checksum(tmp_path):
+            raise TransferError(f"Checksum mismatch copying {source} to {target}")
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _same_file(source: str, target: str) -> bool:
+    try:
+        return os.path.samefile(source, target)
+    except OSError:
+        return False
+
+def move_file(source: str, target: str, checksum: bool = True) -> str:
+    """Chuyển file sang target
+
+    Cùng ổ đĩa thì rename (atomic, không copy dữ liệu); khác ổ thì copy bằng kernel,
+    kiểm tra kích thước (và checksum) rồi mới xóa file nguồn.
+    """
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    try:
+        os.replace(source, target)
+        return target
+    except OSError as e:
+        # Windows báo ERROR_NOT_SAME_DEVICE (17) thay vì EXDEV
+        if e.errno != errno.EXDEV and getattr(e, 'winerror', None) != 17:
+            raise
+
+    _copy_data(source, target, checksum)
+    os.remove(source)
+    logger.debug(f"Moved {source} to {target} across devices")
+    return target
+
+def copy_file(source: str, target: str, link: bool = True, checksum: bool = True) -> str:
+    """Copy file sang target
+
+    link=True thì thử hardlink trước (cùng ổ đĩa, không tốn dung lượng); chỉ dùng khi
+    không ai ghi đè nội dung file tại chỗ. Không link được thì copy bằng kernel và kiểm tra.
+    """
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    if os.path.exists(target):
+        if _same_file(source, target):
+            return target
+        if link:
+            os.remove(target)
+    if link:
+        try:
+            os.link(source, target)
+            return target
+        except OSError:
+            pass
+
+    _copy_data(source, target, checksum)
+    return target
+
+async def move_file_async(source: str, target: str, checksum: bool = True) -> str:
+    """move_file chạy trên thread (không chặn event loop khi phải copy file lớn)"""
+    return await asyncio.to_thread(move_file, source, target, checksum)
+
+async def copy_file_async(source: str, target: str, link: bool = True, checksum: bool = True) -> str:
+    """copy_file chạy trên thread"""
+    return await asyncio.to_thread(copy_file, source, target, link, checksum)
@@ -0,0 +1,90 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+logger = logging.getLogger(__name__)
+
+class _WakeHandler(FileSystemEventHandler):
+    """Đánh thức coroutine đang chờ mỗi khi thư mục có thay đổi (gọi từ thread của watchdog)"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, event: asyncio.Event):
+        self.loop = loop
+        self.event = event
+
+    def on_any_event(self, event):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+def _file_state(path: str) -> Optional[Tuple[int, float]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+async def wait_for_stable_files(paths: List[str], stable_seconds: float = 2.0, timeout: float = 600,
+                                poll_interval: float = 5.0) -> Dict[str, int]:
+    """Chờ tới khi mọi file trong paths tồn tại và không còn bị ghi (size/mtime không đổi
+    trong stable_seconds giây)
+
+    Thư mục chứa file được theo dõi bằng watchdog nên trả về ngay khi file ổn định; vẫn
+    kiểm tra lại mỗi poll_interval giây phòng khi event bị lỡ (ổ mạng).
+
+    Returns:
+        Dict[str, int]: Kích thước từng file
+
+    Raises:
+        TimeoutError: Quá timeout giây mà còn file chưa có hoặc chưa ghi xong
+    """
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    observer = Observer()
+    for directory in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+        os.makedirs(directory, exist_ok=True)
+        observer.schedule(_WakeHandler(loop, wake), directory, recursive=False)
+    observer.start()
+
+    started = time.monotonic()
+    # path -> (trạng thái gần nhất, thời điểm trạng thái đó bắt đầu)
+    seen: Dict[str, Tuple[Optional[Tuple[int, float]], float]] = {}
+    try:
+        while True:
+            now = time.monotonic()
+            pending = []
+            next_check = poll_interval
+            for path in paths:
+                state = _file_state(path)
+                previous = seen.get(path)
+                if previous is None or previous[0] != state:
+                    seen[path] = (state, now)
+                    previous = seen[path]
+                stable_for = now - previous[1]
+                if state is None or stable_for < stable_seconds:
+                    pending.append(path)
+                    if state is not None:
+                        next_check = min(next_check, stable_seconds - stable_for)
+
+            if not pending:
+                logger.info(f"Files ready after {now - started:.1f}s: {paths}")
+                return {path: seen[path][0][0] for path in paths}
+
+            remaining = timeout - (now - started)
+            if remaining <= 0:
+                missing = [path for path in pending if seen[path][0] is None]
+                raise TimeoutError(
+                    f"Timed out after {timeout}s waiting for files "
+                    f"(missing: {missing}, still being written: {[p for p in pending if p not in missing]})"
+                )
+
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=max(0.05, min(next_check, remaining)))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        observer.stop()
+        await asyncio.to_thread(observer.join)
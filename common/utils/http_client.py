@@ -0,0 +1,30 @@
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+# Giới hạn connection của client dùng chung, keep-alive để các request tới cùng server tái dùng connection
+DEFAULT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60)
+DEFAULT_CONNECT_TIMEOUT = 10
+
+# Mỗi event loop một client (watcher của mỗi workflow chạy loop riêng, client không dùng chung được giữa các loop)
+_clients: Dict[int, httpx.AsyncClient] = {}
+
+def get_client() -> httpx.AsyncClient:
+    """AsyncClient dùng chung của event loop hiện tại"""
+    loop_id = id(asyncio.get_running_loop())
+    client = _clients.get(loop_id)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=DEFAULT_LIMITS)
+        _clients[loop_id] = client
+    return client
+
+async def close_client():
+    """Đóng client của event loop hiện tại (gọi khi tắt service)"""
+    client = _clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
+
+def request_timeout(seconds: Optional[float]) -> httpx.Timeout:
+    """Timeout cho request dài (TTS/Whisper): đọc tối đa `seconds`, connect ngắn để phát hiện server chết"""
+    return httpx.Timeout(seconds, connect=min(seconds or DEFAULT_CONNECT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT))
@@ -0,0 +1,103 @@
+import re
+import json
+from typing import Dict, List
+
+TIMESTAMP = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)')
+SENTENCE_END_CHARS = ('.', '!', '?', '…', '。')
+
+def parse_timestamp(value: str) -> float:
+    """'HH:MM:SS,mmm' -> giây"""
+    match = TIMESTAMP.search(value)
+    if not match:
+        raise ValueError(f"Invalid SRT timestamp: {value}")
+    hours, minutes, seconds, millis = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, '0')[:3]) / 1000
+
+def format_timestamp(seconds: float) -> str:
+    """Giây -> 'HH:MM:SS,mmm'"""
+    millis = int(round(max(seconds, 0) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    seconds, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{millis:03d}"
+
+def parse_srt(content: str) -> List[Dict]:
+    """Đọc nội dung SRT thành [{start, end, text}]"""
+    cues = []
+    for block in re.split(r'\r?\n\s*\r?\n', content.strip()):
+        lines = [line.strip() for line in block.strip().splitlines()]
+        timing_index = next((i for i, line in enumerate(lines) if '-->' in line), None)
+        if timing_index is None:
+            continue
+        start, end = lines[timing_index].split('-->')
+        text = " ".join(line for line in lines[timing_index + 1:] if line)
+        if text:
+            cues.append({"start": parse_timestamp(start), "end": parse_timestamp(end), "text": text})
+    return cues
+
+def words_from_srt(content: str) -> List[Dict]:
+    """SRT mỗi cue một từ (words_per_segment=1) -> [{word, start, end}]
+
+    Cue có nhiều từ được chia đều thời gian cho từng từ.
+    """
+    words = []
+    for cue in parse_srt(content):
+        tokens = cue["text"].split()
+        step = (cue["end"] - cue["start"]) / len(tokens)
+        for index, token in enumerate(tokens):
+            words.append({
+                "word": token,
+                "start": round(cue["start"] + index * step, 3),
+                "end": round(cue["start"] + (index + 1) * step, 3)
+            })
+    return words
+
+def build_cues(words: List[Dict], words_per_segment: int = 2, max_chars: int = 80) -> List[Dict]:
+    """Gom các từ thành cue: tối đa words_per_segment từ và max_chars ký tự,
+    luôn ngắt sau từ kết thúc câu"""
+    words_per_segment = max(1, int(words_per_segment))
+    cues: List[Dict] = []
+    current: List[Dict] = []
+
+    def flush():
+        if current:
+            cues.append({
+                "start": current[0]["start"],
+                "end": current[-1]["end"],
+                "text": " ".join(word["word"] for word in current)
+            })
+            current.clear()
+
+    for word in words:
+        if current:
+            length = sum(len(w["word"]) + 1 for w in current) + len(word["word"])
+            if len(current) >= words_per_segment or length > max_chars:
+                flush()
+        current.append(word)
+        if word["word"].endswith(SENTENCE_END_CHARS):
+            flush()
+    flush()
+    return cues
+
+def render_srt(cues: List[Dict]) -> str:
+    """[{start, end, text}] -> nội dung SRT"""
+    blocks = [
+        f"{index}\n{format_timestamp(cue['start'])} --> {format_timestamp(cue['end'])}\n{cue['text']}\n"
+        for index, cue in enumerate(cues, 1)
+    ]
+    return "\n".join(blocks)
+
+def write_srt(cues: List[Dict], path: str) -> str:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(render_srt(cues))
+    return path
+
+def save_words(words: List[Dict], path: str) -> str:
+    """Lưu word timestamps ra JSON để dựng lại SRT mà không cần Whisper"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"words": words}, f, ensure_ascii=False)
+    return path
+
+def load_words(path: str) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["words"]
@@ -0,0 +1,115 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+from common.config.settings import get_section
+
+logger = logging.getLogger(__name__)
+
+# Số pair được chạy đồng thời ở mỗi stage, override bằng section "pipeline" trong config.json
+DEFAULT_PIPELINE_CONFIG = {
+    "max_pairs": 4,
+    "stages": {
+        # Số request TTS cùng lúc tới TTS server: hook và KB của một pair chạy song song
+        "voice": 2,
+        "thumbnail": 2,
+        # "auto": bằng tổng max_concurrency các endpoint của backend trong stage_backends,
+        # để stage không chặn dưới số request pool nhận được khi có nhiều server
+        "whisper": "auto",
+        "video": "auto",
+        "finalize": 2
+    },
+    # Backend mà mỗi stage cần: khi circuit của backend mở, stage ngừng nhận pair mới
+    "stage_backends": {
+        "voice": "tts",
+        "whisper": "whisper",
+        "video": "video"
+    }
+}
+
+def pipeline_config() -> Dict:
+    """Config pipeline, merge stages với giá trị mặc định"""
+    config = get_section("pipeline", DEFAULT_PIPELINE_CONFIG)
+    config["stages"] = {**DEFAULT_PIPELINE_CONFIG["stages"], **(config.get("stages") or {})}
+    config["stage_backends"] = {
+        **DEFAULT_PIPELINE_CONFIG["stage_backends"], **(config.get("stage_backends") or {})
+    }
+    return config
+
+class StageGate:
+    """Giới hạn số pair chạy đồng thời trong một stage
+
+    Pair nào tới trước được vào trước (FIFO), nên các prefix liên tiếp đi qua
+    voice -> thumbnail -> whisper -> video -> finalize như một dây chuyền:
+    pair sau chạy TTS trong khi pair trước đang render video.
+    """
+
+    def __init__(self, name: str, limit: Union[int, str]):
+        self.name = name
+        # Limit "auto" bắt đầu từ 1, được nâng khi backend pool của stage được tạo
+        self.auto = limit == "auto"
+        self.limit = 1 if self.auto else max(1, int(limit))
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self.running = 0
+        self.waiting = 0
+        self._preconditions: List[Callable[[str], Awaitable[None]]] = []
+
+    def add_precondition(self, wait: Callable[[str], Awaitable[None]]):
+        """Thêm điều kiện phải chờ trước khi vào hàng (vd backend của stage đang lỗi)"""
+        self._preconditions.append(wait)
+
+    def resize(self, limit: int):
+        """Nâng limit của stage "auto" (chỉ tăng, pair đang chờ được vào ngay)"""
+        limit = max(1, int(limit))
+        if not self.auto or limit <= self.limit:
+            return
+        for _ in range(limit - self.limit):
+            self._semaphore.release()
+        logger.info(f"Stage {self.name}: limit {self.limit} -> {limit} (backend capacity)")
+        self.limit = limit
+
+    @asynccontextmanager
+    async def slot(self, label: str = ""):
+        """Chờ tới lượt rồi chạy stage cho một pair"""
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            # Backend đang mở circuit: pair nằm chờ ở đây thay vì gửi request để rồi lỗi
+            for wait in self._preconditions:
+                await wait(label)
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        if waited >= 1:
+            logger.info(f"Stage {self.name}: {label} waited {waited:.1f}s for a slot")
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {"limit": self.limit, "running": self.running, "waiting": self.waiting}
+
+# Gate dùng chung cho mọi workflow trong process (các workflow dùng chung TTS/video server),
+# tách theo event loop vì asyncio.Semaphore chỉ dùng được trong một loop
+_gates: Dict[Tuple[int, str], StageGate] = {}
+
+def stage_gate(name: str) -> StageGate:
+    """Lấy gate của một stage trong event loop hiện tại"""
+    key = (id(asyncio.get_running_loop()), name)
+    gate = _gates.get(key)
+    if gate is None:
+        limit = pipeline_config()["stages"].get(name, 1)
+        gate = _gates[key] = StageGate(name, limit)
+    return gate
+
+def pipeline_stats() -> Dict[str, Dict]:
+    """Trạng thái các gate của event loop hiện tại"""
+    loop_id = id(asyncio.get_running_loop())
+    return {name: gate.stats() for (gate_loop, name), gate in _gates.items() if gate_loop == loop_id}
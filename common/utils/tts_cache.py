@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+from common.config.settings import get_section, load_config
+from common.utils.file_transfer import copy_file
+
+logger = logging.getLogger(__name__)
+
+# Override bằng section "tts_cache" trong config.json, "dir" rỗng thì dùng {root_path}/.tts_cache
+DEFAULT_TTS_CACHE_CONFIG = {
+    "enabled": True,
+    "dir": "",
+    "max_bytes": 20 * 1024 ** 3,
+    # Tên model/bản cài TTS, Whisper; đổi khi thay model để không lấy audio cũ. Thêm/bớt server
+    # cùng model trong "backends" không đổi cache
+    "namespace": ""
+}
+
+def cache_key(**params) -> str:
+    """Hash của mọi tham số quyết định audio (text, voice, speed, namespace...)"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class TtsCache:
+    """Cache kết quả TTS trên đĩa theo nội dung, giới hạn dung lượng, xóa entry ít dùng nhất trước
+
+    Mỗi entry là một thư mục {root}/{key}/ chứa các file output (wav, srt...) theo tên.
+    Thời điểm dùng gần nhất là mtime của thư mục entry, được cập nhật mỗi lần hit.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._sizes: Optional[Dict[str, int]] = None
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _scan(self) -> Dict[str, int]:
+        """Dung lượng từng entry, quét thư mục cache một lần rồi giữ trong bộ nhớ"""
+        if self._sizes is None:
+            self._sizes = {}
+            for key in os.listdir(self.root):
+                entry = self._entry_dir(key)
+                if os.path.isdir(entry):
+                    self._sizes[key] = sum(
+                        os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry)
+                    )
+        return self._sizes
+
+    def get(self, key: str, targets: Dict[str, str]) -> bool:
+        """Hardlink các file của entry vào targets {tên: đường dẫn}, False nếu chưa có đủ"""
+        entry = self._entry_dir(key)
+        with self._lock:
+            sources = {name: os.path.join(entry, name) for name in targets}
+            if not all(os.path.exists(path) for path in sources.values()):
+                return False
+            for name, target in targets.items():
+                copy_file(sources[name], target)
+            now = time.time()
+            os.utime(entry, (now, now))
+        logger.info(f"TTS cache hit {key[:12]}: {list(targets.values())}")
+        return True
+
+    def put(self, key: str, sources: Dict[str, str]):
+        """Lưu các file output {tên: đường dẫn} vào cache rồi dọn cache nếu vượt dung lượng"""
+        entry = self._entry_dir(key)
+        tmp_entry = f"{entry}.tmp{threading.get_ident()}"
+        with self._lock:
+            try:
+                shutil.rmtree(tmp_entry, ignore_errors=True)
+                os.makedirs(tmp_entry)
+                for name, source in sources.items():
+                    copy_file(source, os.path.join(tmp_entry, name))
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp_entry, entry)
+            except Exception as e:
+                shutil.rmtree(tmp_entry, ignore_errors=True)
+                logger.warning(f"Could not store TTS cache entry {key[:12]}: {str(e)}")
+                return
+
+            sizes = self._scan()
+            sizes[key] = sum(os.path.getsize(path) for path in sources.values())
+            self._evict(keep=key)
+
+    def _evict(self, keep: str):
+        """Xóa entry có mtime cũ nhất tới khi tổng dung lượng <= max_bytes"""
+        sizes = self._scan()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        def last_used(key: str) -> float:
+            try:
+                return os.path.getmtime(self._entry_dir(key))
+            except OSError:
+                return 0
+
+        for key in sorted(sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= sizes.pop(key)
+            logger.info(f"TTS cache evicted {key[:12]}")
+
+_cache: Optional[TtsCache] = None
+_cache_lock = threading.Lock()
+
+def cache_namespace() -> str:
+    """Namespace của cache trong config (tts_cache.namespace)"""
+    return str(get_section("tts_cache", DEFAULT_TTS_CACHE_CONFIG).get("namespace") or "")
+
+def tts_cache() -> Optional[TtsCache]:
+    """Cache TTS dùng chung trong process, None nếu tắt trong config"""
+    global _cache
+    config = get_section("tts_cache", DEFAULT_TTS_CACHE_CONFIG)
+    if not config.get("enabled"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            root = config.get("dir") or os.path.join(load_config().get("root_path", "."), ".tts_cache")
+            _cache = TtsCache(root, config.get("max_bytes", DEFAULT_TTS_CACHE_CONFIG["max_bytes"]))
+        return _cache
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import mmap
+import struct
+from typing import Dict, List, Tuple
+
+COPY_BLOCK = 1024 * 1024
+SENTENCE_END = re.compile(r'(?<=[.!?…。])["\')\]]*\s+')
+
+def split_text(text: str, max_chars: int = 1500) -> List[str]:
+    """Chia script thành các chunk <= max_chars, cắt ở ranh giới đoạn rồi tới câu
+
+    Câu dài hơn max_chars được giữ nguyên một chunk (TTS vẫn đọc được, chỉ chậm hơn).
+    """
+    chunks: List[str] = []
+    current = ""
+
+    def push(piece: str):
+        nonlocal current
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        # Đoạn mới bắt đầu chunk mới nếu chunk hiện tại đã đủ dài một nửa
+        if current and len(current) >= max_chars // 2:
+            chunks.append(current)
+            current = ""
+        if len(paragraph) <= max_chars:
+            push(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            if sentence.strip():
+                push(sentence.strip())
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+class WavInfo:
+    """Thông tin PCM của một file WAV: format và vị trí data chunk"""
+
+    def __init__(self, channels: int, sample_rate: int, sample_width: int, data_offset: int, data_size: int):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.data_offset = data_offset
+        self.data_size = data_size
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.sample_width
+
+    @property
+    def duration(self) -> float:
+        return self.data_size / float(self.block_align * self.sample_rate)
+
+    def same_format(self, other: "WavInfo") -> bool:
+        return (self.channels, self.sample_rate, self.sample_width) == \
+               (other.channels, other.sample_rate, other.sample_width)
+
+def read_wav_info(path: str) -> WavInfo:
+    """Đọc header RIFF/WAVE (chỉ PCM), bỏ qua các chunk phụ như LIST"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path} has data before fmt chunk")
+                audio_format, channels, sample_rate, _, _, bits = fmt
+                if audio_format not in (1, 0xFFFE):
+                    raise ValueError(f"{path} is not PCM (format {audio_format})")
+                data_offset = f.tell()
+                # Một số TTS server ghi size 0/0xFFFFFFFF khi stream, lấy theo kích thước file
+                data_size = min(chunk_size, file_size - data_offset)
+                return WavInfo(channels, sample_rate, bits // 8, data_offset, data_size)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def _wav_header(info: WavInfo, data_size: int) -> bytes:
+    byte_rate = info.sample_rate * info.block_align
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, info.channels, info.sample_rate, byte_rate, info.block_align, info.sample_width * 8,
+        b'data', data_size
+    )
+
+def stitch_wavs(wav_files: List[str], output_path: str, silence_ms: int = 250) -> List[Tuple[float, float]]:
+    """Nối các file WAV cùng format thành một file, chèn silence_ms giữa các chunk
+
+    Data của từng chunk được map bằng mmap và ghi thẳng ra file output, không decode
+    sang sample nên không tốn RAM theo độ dài audio.
+
+    Returns:
+        List[(start, end)]: thời điểm (giây) của từng chunk trong file output
+    """
+    if not wav_files:
+        raise ValueError("No WAV files to stitch")
+
+    infos = [read_wav_info(path) for path in wav_files]
+    base = infos[0]
+    for path, info in zip(wav_files, infos):
+        if not base.same_format(info):
+            raise ValueError(f"{path} format differs from {wav_files[0]}")
+
+    silence_frames = int(base.sample_rate * silence_ms / 1000)
+    silence = b'\x00' * (silence_frames * base.block_align)
+    data_size = sum(info.data_size for info in infos) + len(silence) * (len(infos) - 1)
+
+    offsets: List[Tuple[float, float]] = []
+    position = 0
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as out:
+        out.write(_wav_header(base, data_size))
+        for index, (path, info) in enumerate(zip(wav_files, infos)):
+            if index:
+                out.write(silence)
+                position += len(silence)
+            if info.data_size:
+                with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    end = info.data_offset + info.data_size
+                    for block in range(info.data_offset, end, COPY_BLOCK):
+                        out.write(mapped[block:min(block + COPY_BLOCK, end)])
+            start = position / float(base.block_align * base.sample_rate)
+            position += info.data_size
+            offsets.append((round(start, 3), round(position / float(base.block_align * base.sample_rate), 3)))
+    os.replace(tmp_path, output_path)
+    return offsets
+
+def chunk_timings_path(wav_file: str) -> str:
+    """File JSON chứa thời điểm của từng chunk, nằm cạnh file wav đã nối"""
+    return f"{os.path.splitext(wav_file)[0]}.chunks.json"
+
+def save_chunk_timings(wav_file: str, chunks: List[Dict]) -> str:
+    """Lưu [{index, text, start, end}] của các chunk để stage sau (SRT) dùng lại"""
+    path = chunk_timings_path(wav_file)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"wav_file": wav_file, "chunks": chunks}, f, ensure_ascii=False, indent=2)
+    return path
+
+def load_chunk_timings(wav_file: str) -> List[Dict]:
+    """Đọc thời điểm các chunk của file wav, list rỗng nếu wav không được tạo theo chunk"""
+    path = chunk_timings_path(wav_file)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("chunks", [])
@@ -14,6 +14,7 @@ from workflows.workflow1.config.workflow_paths import Workflow1Paths
 from workflows.workflow1.services.workflow_watcher import Workflow1Watcher
 from workflows.workflow2.services.workflow_watcher import Workflow2Watcher
 from workflows.workflow3.services.workflow_watcher import Workflow3Watcher
+from common.services.video_tasks import start_callback_server
 
 # Set up logging
 logging.basicConfig(
@@ -48,6 +49,9 @@ if __name__ == "__main__":
         workflow3_watcher = Workflow3Watcher()
         workflow3_watcher.start_all_channels()
         logger.info("Workflow3 watcher started successfully")
+
+        # Nhận callback task video xong cho các workflow chạy trong process này (video_status.callback_listen)
+        start_callback_server()
         
         # Run event loop
         try:
@@ -6,6 +6,7 @@ import os
 from pathlib import Path
 from workflows.workflow1.services.workflow_watcher import Workflow1Watcher
 from workflows.workflow2.services.workflow_watcher import Workflow2Watcher
+from common.services.video_tasks import start_callback_server
 
 # Set up logging
 logging.basicConfig(
@@ -47,6 +48,9 @@ if __name__ == "__main__":
         except Exception as e:
             logger.error(f"Error starting watcher: {str(e)}")
 
+    # Nhận callback task video xong (video_status.callback_listen)
+    start_callback_server()
+
     try:
         while True:
             time.sleep(1)
@@ -1,11 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException
+from fastapi import HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
 import logging
-from common.database import get_db
 from common.services.job_manager import JobManager
 from common.models.job import JobPriority
+from common.services.video_tasks import router as video_callback_router
 from .services.workflow_watcher import Workflow1Watcher
 from .workflow import Workflow1
 
@@ -31,6 +33,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Video server gọi /video/callback khi task render xong
+app.include_router(video_callback_router)
+
 # Global watcher
 watcher = None
 
@@ -56,26 +61,56 @@ async def shutdown_event():
         except Exception as e:
             logger.error(f"Error stopping Workflow1 watcher: {str(e)}")
 
+class JobRequest(BaseModel):
+    file_path: str
+    channel_name: str
+    priority: JobPriority = JobPriority.NORMAL
+    deadline: Optional[datetime] = None
+
 @app.post("/jobs/")
 async def create_job(
-    file_path: str,
-    channel_name: str,
+    request: Optional[JobRequest] = None,
+    file_path: Optional[str] = None,
+    channel_name: Optional[str] = None,
     priority: JobPriority = JobPriority.NORMAL,
-    db: Session = Depends(get_db)
+    deadline: Optional[datetime] = None
 ):
+    """Tạo một job từ body JSON (BaseWatcher gửi) hoặc query params như trước"""
+    if request is None:
+        if not file_path or not channel_name:
+            raise HTTPException(status_code=422, detail="file_path and channel_name are required")
+        request = JobRequest(file_path=file_path, channel_name=channel_name,
+                             priority=priority, deadline=deadline)
+    job_manager = await JobManager.get_instance()
+    job = await job_manager.add_job(
+        workflow_name="workflow1",
+        file_path=request.file_path,
+        channel_name=request.channel_name,
+        priority=request.priority,
+        deadline=request.deadline
+    )
+    return job.to_dict()
+
+class BulkJobRequest(BaseModel):
+    jobs: List[JobRequest]
+
+@app.post("/jobs/bulk")
+async def create_jobs(request: BulkJobRequest):
+    """Tạo nhiều job trong một transaction (watcher gom các file tới cùng lúc)"""
     job_manager = await JobManager.get_instance()
-    return await job_manager.create_job(
+    jobs = await job_manager.add_jobs(
         workflow_name="workflow1",
-        file_path=file_path,
-        channel_name=channel_name,
-        priority=priority,
-        db=db
+        items=[job.dict() for job in request.jobs]
     )
+    return [job.to_dict() for job in jobs]
 
 @app.get("/jobs/{job_id}")
-async def get_job_status(job_id: int, db: Session = Depends(get_db)):
+async def get_job_status(job_id: int):
     job_manager = await JobManager.get_instance()
-    return await job_manager.get_job_status(job_id, db)
+    status = await job_manager.get_job_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return status
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,14 +1,19 @@
 import os
 import json
 import random
-import httpx
 import time
 import asyncio
 import uuid
-from typing import Dict, Tuple, Optional
+from typing import Dict, Tuple
 from common.utils.base_service import BaseService, WorkflowContext
+from common.services.backend_pool import backend_pool
+from common.services.video_tasks import callback_url, status_poller
+from common.utils.http_client import get_client
+from common.utils.file_transfer import copy_file, move_file_async
+from common.utils.artifact_manifest import job_manifest
 from ..config.workflow_paths import Workflow1Paths
-import shutil
+
+STATUS_PATH = "/api/v1/api/process/status/{task_id}"
 
 class VideoService(BaseService):
     def __init__(self, paths: Workflow1Paths):
@@ -56,7 +61,7 @@ class VideoService(BaseService):
         new_name = f"{os.path.splitext(video_name)[0]}_overlay.png"
         target_path = os.path.join(final_dir, new_name)
         
-        shutil.copy2(source_path, target_path)  # copy2 giữ nguyên metadata
+        copy_file(source_path, target_path)  # hardlink nếu cùng ổ, overlay gốc vẫn giữ lại
         self.logger.info(f"Đã copy overlay từ {overlay_name} đến {target_path}")
 
     def _get_preset_name(self, channel_name: str) -> str:
@@ -72,64 +77,21 @@ class VideoService(BaseService):
             self.logger.error(f"Error loading preset: {str(e)}")
             return 'default'
 
-    async def _check_task_status(self, task_id: str, client: httpx.AsyncClient) -> Tuple[bool, Optional[str], Optional[str]]:
-        """Kiểm tra trạng thái của task
-        Returns:
-            Tuple[bool, Optional[str], Optional[str]]: (is_completed, error_message, output_path)
-        """
-        try:
-            response = await client.get(
-                f"{self.api_url}/api/v1/api/process/status/{task_id}",
-                timeout=30
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            # Log trạng thái
-            self.logger.debug(f"Task {task_id} status: {data}")
-            
-            if data.get("status") == "completed":
-                return True, None, data.get("output_path")
-            elif data.get("status") == "failed":
-                return True, data.get("error", "Unknown error"), None
-            else:
-                return False, None, None
-                
-        except Exception as e:
-            self.logger.warning(f"Error checking task status: {str(e)}")
-            return False, str(e), None
-
-    def _move_working_files_to_final(self, channel_name: str, prefix: str):
-        """Di chuyển tất cả file trong working có prefix tương ứng vào final"""
-        channel_paths = self.paths.get_channel_paths(channel_name)
-        working_dir = channel_paths["working_dir"]
+    def _move_working_files_to_final(self, context: WorkflowContext, prefix: str):
+        """Di chuyển các file của job đã ghi trong manifest (script, audio, SRT) vào final"""
+        channel_paths = self.paths.get_channel_paths(context.channel_name)
         final_dir = channel_paths["final_dir"]
+        manifest = job_manifest(context, channel_paths["channel_dir"], prefix)
         
         # Đảm bảo thư mục final tồn tại
         os.makedirs(final_dir, exist_ok=True)
         
-        # Lấy danh sách file trong working có prefix tương ứng
-        working_files = [f for f in os.listdir(working_dir) 
-                        if f.startswith(prefix) and os.path.isfile(os.path.join(working_dir, f))]
-        
-        for file_name in working_files:
-            source_path = os.path.join(working_dir, file_name)
-            target_path = os.path.join(final_dir, file_name)
-            
-            try:
-                # Copy file vào final
-                shutil.copy2(source_path, target_path)
-                self.logger.info(f"Đã copy file {file_name} vào final")
-                
-                # Xóa file gốc
-                try:
-                    os.remove(source_path)
-                    self.logger.debug(f"Đã xóa file gốc: {source_path}")
-                except Exception as e:
-                    self.logger.warning(f"Không thể xóa file gốc {source_path}: {str(e)}")
-                    
-            except Exception as e:
-                self.logger.error(f"Không thể copy file {file_name} vào final: {str(e)}")
+        try:
+            moved = manifest.move_to(final_dir)
+            self.logger.info(f"Đã chuyển {len(moved)} file của {prefix} vào final")
+            manifest.clear()
+        except Exception as e:
+            self.logger.error(f"Không thể chuyển file của {prefix} vào final: {str(e)}")
 
     async def process(self, context: WorkflowContext) -> Dict:
         """Process video với timeout 30 minutes"""
@@ -176,12 +138,19 @@ class VideoService(BaseService):
                 "preset_name": preset_name,
                 "output_name": output_name  # API sẽ lưu vào thư mục của nó
             }
-            
-            async with httpx.AsyncClient() as client:
+
+            # Video server gọi lại URL này khi task xong (nếu đã cấu hình)
+            task_callback = callback_url(context.workflow_name)
+            if task_callback:
+                payload["callback_url"] = task_callback
+            
+            # Task được tạo và poll trên cùng video server của pool
+            async with backend_pool('video', self.api_url).lease() as endpoint:
+                client = get_client()
                 # Start task
                 self.logger.debug(f"Starting video task with payload: {payload}")
                 response = await client.post(
-                    f"{self.api_url}/api/v1/api/process/make",
+                    f"{endpoint.url}/api/v1/api/process/make",
                     headers={"accept": "application/json", "Content-Type": "application/x-www-form-urlencoded"},
                     data=payload,
                     timeout=30
@@ -195,30 +164,22 @@ class VideoService(BaseService):
                     
                 self.logger.info(f"Video task started with ID: {task_id}")
                 
-                # Poll task status
-                max_attempts = 180  # 30 minutes (10s interval)
-                attempt = 0
-                api_output_path = None
-                
-                while attempt < max_attempts:
-                    is_completed, error, output_path = await self._check_task_status(task_id, client)
-                    
-                    if error:
-                        raise ValueError(f"Video task failed: {error}")
-                        
-                    if is_completed and output_path:
-                        self.logger.info(f"Video task {task_id} completed, output at: {output_path}")
-                        api_output_path = output_path
-                        break
-                        
-                    attempt += 1
-                    await asyncio.sleep(10)  # Chờ 10s trước khi kiểm tra lại
-                    
-                if attempt >= max_attempts:
+                # Poller dùng chung của video server theo dõi mọi task đang render (tối đa 30 phút),
+                # poll thích ứng theo progress/ETA và poll ngay khi video server gọi callback
+                try:
+                    status_data = await status_poller(endpoint.url, STATUS_PATH, context.workflow_name).wait(
+                        task_id, timeout=1800, label=output_name
+                    )
+                except asyncio.TimeoutError:
                     raise ValueError(f"Video task {task_id} timed out after 30 minutes")
                     
+                if status_data["status"] == "failed":
+                    raise ValueError(f"Video task failed: {status_data.get('error', 'Unknown error')}")
+                    
+                api_output_path = status_data.get("output_path")
                 if not api_output_path:
                     raise ValueError("Video task completed but no output path returned")
+                self.logger.info(f"Video task {task_id} completed, output at: {api_output_path}")
             
             # Copy overlay2 đã sử dụng vào thư mục final của kênh
             move_attempts = 2
@@ -233,33 +194,25 @@ class VideoService(BaseService):
                         self.logger.error("Không thể copy overlay2 sau 2 lần thử")
                     await asyncio.sleep(3)
             
-            # Copy video từ thư mục API về thư mục final của kênh
+            # Chuyển video từ thư mục API về thư mục final của kênh
             move_attempts = 2
             for attempt in range(move_attempts):
                 try:
                     if not os.path.exists(api_output_path):
                         raise ValueError(f"Video file not found at {api_output_path}")
                         
-                    os.makedirs(os.path.dirname(channel_final_path), exist_ok=True)
-                    shutil.copy2(api_output_path, channel_final_path)
-                    self.logger.info(f"Video đã được copy vào kênh thành công: {channel_final_path}")
-                    
-                    # Xóa file gốc sau khi copy thành công
-                    try:
-                        os.remove(api_output_path)
-                        self.logger.debug(f"Đã xóa file từ API: {api_output_path}")
-                    except Exception as e:
-                        self.logger.warning(f"Không thể xóa file từ API {api_output_path}: {str(e)}")
-                    
+                    # Rename nếu cùng ổ, khác ổ thì copy bằng kernel, kiểm tra rồi xóa file của API
+                    await move_file_async(api_output_path, channel_final_path)
+                    self.logger.info(f"Video đã được chuyển vào kênh thành công: {channel_final_path}")
                     break
                 except Exception as e:
-                    self.logger.warning(f"Lần thử copy video {attempt + 1}/{move_attempts} thất bại: {str(e)}")
+                    self.logger.warning(f"Lần thử chuyển video {attempt + 1}/{move_attempts} thất bại: {str(e)}")
                     if attempt == move_attempts - 1:
-                        self.logger.error("Không thể copy video sau 2 lần thử")
+                        self.logger.error("Không thể chuyển video sau 2 lần thử")
                     await asyncio.sleep(3)
             
             # Di chuyển các file working vào final
-            self._move_working_files_to_final(context.channel_name, prefix)
+            await asyncio.to_thread(self._move_working_files_to_final, context, prefix)
             
             return {
                 'video_file': channel_final_path,
@@ -1,13 +1,23 @@
 import os
 import json
-import httpx
-import shutil
 import time
+import asyncio
 from typing import Dict, Optional
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.checkpoint import file_digest
+from common.utils.tts_cache import cache_key, cache_namespace, tts_cache
+from common.services.backend_pool import backend_pool
+from common.utils.http_client import get_client, request_timeout
+from common.utils.file_wait import wait_for_stable_files
+from common.utils.file_transfer import copy_file_async
+from common.utils.artifact_manifest import job_manifest
 from ..config.workflow_paths import Workflow1Paths
 import traceback
 
+# Pandrator ghi final.wav/final.srt sau khi API trả về; file không đổi trong chừng này giây là ghi xong
+SESSION_STABLE_SECONDS = 2
+SESSION_WAIT_TIMEOUT = 1800
+
 class VoiceService(BaseService):
     def __init__(self, paths: Workflow1Paths):
         super().__init__()
@@ -54,6 +64,12 @@ class VoiceService(BaseService):
                 'wav_file': wav_target,
                 'srt_file': srt_target
             }
+
+            # Script trong Working, audio và SRT là các file của job được chuyển sang Final khi xong
+            job_manifest(context, channel_paths["channel_dir"], prefix)
+            context.register_artifact(context.file_path, 'script')
+            context.register_artifact(wav_target, 'audio')
+            context.register_artifact(srt_target, 'subtitle')
             self.logger.debug(f"Initialized voice_result: {voice_result}")
             
             try:
@@ -70,6 +86,18 @@ class VoiceService(BaseService):
                     voice_config = {}
                 else:
                     self.logger.debug(f"Loaded voice config: {voice_config}")
+
+                # Script, preset và namespace cache giống lần trước thì lấy audio/SRT từ cache
+                cache = tts_cache()
+                key = cache_key(kind='pandrator', text=file_digest(context.file_path), voice=voice_config,
+                                namespace=cache_namespace())
+                cache_files = {'audio.wav': wav_target, 'audio.srt': srt_target}
+                for target in cache_files.values():
+                    if os.path.exists(target):
+                        os.remove(target)  # có thể là hardlink tới cache, không ghi đè lên
+                if cache and await asyncio.to_thread(cache.get, key, cache_files):
+                    self.logger.info(f"Voice processing served from cache. Returning: {voice_result}")
+                    return voice_result
                     
                 # Call voice API
                 payload = {
@@ -81,43 +109,48 @@ class VoiceService(BaseService):
                 self.logger.debug(f"API payload: {payload}")
                 
                 self.logger.info(f"Calling voice API with session: {session_name}")
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{self.api_url}/process_with_pandrator",
+                async with backend_pool('voice', self.api_url).lease() as endpoint:
+                    response = await get_client().post(
+                        f"{endpoint.url}/process_with_pandrator",
                         json=payload,
-                        timeout=1800
+                        timeout=request_timeout(1800)
                     )
                     self.logger.debug(f"API response status: {response.status_code}")
                     self.logger.debug(f"API response content: {response.text[:1000]}")  # Log first 1000 chars
+                    # Lỗi API thì không chờ file session (Pandrator sẽ không ghi)
+                    response.raise_for_status()
 
-                self.logger.info("API call successful, waiting 10 seconds for files...")
-                time.sleep(10)
-                
-                # Copy files from session to working dir
-                pandrator_session = os.path.join(self.paths.PANDORA_DIR, "sessions", session_name)
-                wav_source = os.path.join(pandrator_session, "final.wav")
-                srt_source = os.path.join(pandrator_session, "final.srt")
+                # Chờ Pandrator ghi xong final.wav/final.srt (file tồn tại và không còn thay đổi)
+                session_paths = self.paths.get_pandora_session_paths(session_name)
+                wav_source = str(session_paths["wav_file"])
+                srt_source = str(session_paths["srt_file"])
                 self.logger.debug(f"Source paths - WAV: {wav_source}, SRT: {srt_source}")
+                self.logger.info(f"API call successful, waiting for session {session_name} outputs...")
+                try:
+                    await wait_for_stable_files(
+                        [wav_source, srt_source],
+                        stable_seconds=SESSION_STABLE_SECONDS,
+                        timeout=SESSION_WAIT_TIMEOUT
+                    )
+                except TimeoutError:
+                    missing = [path for path in (wav_source, srt_source) if not os.path.exists(path)]
+                    self.logger.error(f"Session {session_name} outputs not ready after {SESSION_WAIT_TIMEOUT}s "
+                                      f"(missing: {missing or 'none, still being written'})")
+                    raise
                 
                 # Đảm bảo thư mục đích tồn tại
                 os.makedirs(os.path.dirname(wav_target), exist_ok=True)
                 os.makedirs(os.path.dirname(srt_target), exist_ok=True)
                 self.logger.debug("Created target directories")
                 
-                # Copy và đổi tên file
-                if os.path.exists(wav_source):
-                    self.logger.debug(f"Found WAV file at {wav_source}")
-                    shutil.copy2(wav_source, wav_target)
-                    self.logger.info(f"Copied WAV file to {wav_target}")
-                else:
-                    self.logger.error(f"WAV file not found at {wav_source}")
-                    
-                if os.path.exists(srt_source):
-                    self.logger.debug(f"Found SRT file at {srt_source}")
-                    shutil.copy2(srt_source, srt_target)
-                    self.logger.info(f"Copied SRT file to {srt_target}")
-                else:
-                    self.logger.error(f"SRT file not found at {srt_source}")
+                # Hardlink (khác ổ thì copy bằng kernel) file của session sang working và đổi tên
+                await copy_file_async(wav_source, wav_target)
+                self.logger.info(f"Copied WAV file to {wav_target}")
+                await copy_file_async(srt_source, srt_target)
+                self.logger.info(f"Copied SRT file to {srt_target}")
+
+                if cache and all(os.path.exists(target) for target in cache_files.values()):
+                    await asyncio.to_thread(cache.put, key, cache_files)
                 
             except Exception as e:
                 self.logger.error(f"Error during voice processing: {str(e)}")
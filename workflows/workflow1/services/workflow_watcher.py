@@ -2,13 +2,13 @@ import os
 import time
 import logging
 import asyncio
-import shutil
 import json
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from typing import Dict, Optional
 from common.utils.base_workflow import BaseWorkflow
 from common.utils.base_service import WorkflowContext
+from common.utils.file_transfer import copy_file
 from common.models.job import Job
 from ..config.workflow_paths import Workflow1Paths
 
@@ -50,7 +50,7 @@ class ScriptEventHandler(FileSystemEventHandler):
             # Di chuyển vào working directory
             channel_paths = self.workflow.paths.get_channel_paths(self.channel_name)
             working_file = os.path.join(channel_paths["working_dir"], os.path.basename(file_path))
-            shutil.copy2(file_path, working_file)
+            copy_file(file_path, working_file, link=False)
             context.file_path = working_file
             
             # Process file
@@ -7,6 +7,11 @@ from typing import Dict, Optional, List
 from pathlib import Path
 from fastapi import FastAPI, BackgroundTasks
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.checkpoint import StageCheckpoint, file_digest
+from common.utils.artifact_manifest import job_manifest
+from common.utils.stage_gate import stage_gate
+from common.utils.dag import DagStep, gather_or_cancel, run_dag
+from common.services.video_tasks import router as video_callback_router
 
 # Add root path to sys.path
 ROOT_PATH = str(Path(__file__).parent.parent.parent)
@@ -25,18 +30,46 @@ class Workflow2(BaseService):
         self.paths = Workflow2Paths()
         self.voice_service = VoiceService(self.paths)
         self.video_service = VideoService(self.paths)
+
+    def _open_checkpoint(self, context: WorkflowContext, prefix: str) -> StageCheckpoint:
+        """Mở checkpoint và manifest của prefix, đưa output cũ từ Error về Working nếu job đang chạy lại"""
+        checkpoint = context.get_state('checkpoint')
+        if checkpoint is None:
+            channel_paths = self.paths.get_channel_paths(context.channel_name)
+            checkpoint = StageCheckpoint.for_prefix(channel_paths["channel_dir"], prefix)
+            checkpoint.restore(channel_paths["error_dir"])
+            context.update_state('checkpoint', checkpoint)
+            job_manifest(context, channel_paths["channel_dir"], prefix)
+        context.register_artifact(context.file_path, 'script')
+        return checkpoint
         
     async def process_hook(self, context: WorkflowContext) -> Dict:
         """Process hook file"""
         try:
-            # Lấy kết quả từ voice service
-            voice_result = await self.voice_service.process_hook(context)
+            script_name = os.path.splitext(os.path.basename(context.file_path))[0]
+            self._open_checkpoint(context, script_name.split('_Hook')[0])
+
+            # TTS hook và thumbnail không phụ thuộc nhau, chạy song song (một bên lỗi thì hủy bên kia)
+            voice_result, thumbnail = await gather_or_cancel(
+                self.voice_service.process_hook(context),
+                self.make_thumbnail(context)
+            )
             context.results['VoiceService'] = voice_result
+            return {**thumbnail, "wav_file": voice_result["wav_file"]}
             
-            # Tạo thumbnail và overlay
-            channel_paths = self.paths.get_channel_paths(context.channel_name)
+        except Exception as e:
+            logger.error(f"Error processing hook file: {str(e)}")
+            raise
+
+    async def make_thumbnail(self, context: WorkflowContext) -> Dict:
+        """Tạo thumbnail và overlay từ file hook"""
+        try:
             script_name = os.path.splitext(os.path.basename(context.file_path))[0]
             prefix = script_name.split('_Hook')[0]
+            checkpoint = self._open_checkpoint(context, prefix)
+
+            # Tạo thumbnail và overlay
+            channel_paths = self.paths.get_channel_paths(context.channel_name)
             
             # Lấy font và base image từ thư mục Assets
             assets_dir = channel_paths["assets_dir"]
@@ -48,6 +81,21 @@ class Workflow2(BaseService):
                 
             font_path = os.path.join(assets_dir, font_files[0])
             base_image = os.path.join(assets_dir, image_files[0])
+
+            # Bỏ qua ThumbMaker nếu checkpoint đã có thumbnail cho cùng nội dung hook
+            thumb_params = {
+                'text': file_digest(context.file_path),
+                'font_path': font_path,
+                'base_image': base_image
+            }
+            thumbnail = checkpoint.load('thumbnail', thumb_params)
+            if thumbnail:
+                context.register_artifact(thumbnail["thumbnail_path"], 'image')
+                context.register_artifact(thumbnail["overlay_path"], 'image')
+                return {
+                    "thumbnail_path": thumbnail["thumbnail_path"],
+                    "overlay_path": thumbnail["overlay_path"]
+                }
             
             # Sử dụng đường dẫn tuyệt đối cho ThumbMaker.py
             thumbmaker_path = Path("D:/AutomateWorkFlow/WorkflowFile/WorkflowS/ThumbMaker.py")
@@ -63,7 +111,8 @@ class Workflow2(BaseService):
             ]
             
             logger.info(f"Running ThumbMaker with command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            async with stage_gate('thumbnail').slot(prefix):
+                result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True)
             
             if result.returncode != 0:
                 raise Exception(f"ThumbMaker failed: {result.stderr}")
@@ -74,20 +123,82 @@ class Workflow2(BaseService):
             
             if not os.path.exists(thumbnail_path) or not os.path.exists(overlay_path):
                 raise FileNotFoundError(f"ThumbMaker did not generate expected output files")
+
+            checkpoint.save('thumbnail', params=thumb_params, files={
+                "thumbnail_path": thumbnail_path,
+                "overlay_path": overlay_path
+            })
+            context.register_artifact(thumbnail_path, 'image')
+            context.register_artifact(overlay_path, 'image')
             
             return {
                 "thumbnail_path": thumbnail_path,
-                "overlay_path": overlay_path,
-                "wav_file": voice_result["wav_file"]
+                "overlay_path": overlay_path
             }
             
         except Exception as e:
-            logger.error(f"Error processing hook file: {str(e)}")
+            logger.error(f"Error creating thumbnail: {str(e)}")
             raise
             
+    def build_pair_steps(self) -> List[DagStep]:
+        """DAG xử lý một pair: TTS hook, TTS KB và thumbnail chạy song song,
+        Whisper chạy khi có audio KB, video chạy khi đủ audio, SRT và thumbnail"""
+        return [
+            DagStep("hook_tts", self._step_hook_tts, consumes=["hook_file"], produces=["hook_wav"]),
+            DagStep("kb_tts", self._step_kb_tts, consumes=["kb_file"], produces=["kb_wav"]),
+            DagStep("thumbnail", self._step_thumbnail, consumes=["hook_file"],
+                    produces=["thumbnail_path", "overlay_path"]),
+            DagStep("whisper", self._step_whisper, consumes=["kb_file", "kb_wav"], produces=["srt_file"]),
+            DagStep("video", self._step_video,
+                    consumes=["kb_file", "hook_wav", "kb_wav", "srt_file", "thumbnail_path", "overlay_path"],
+                    produces=["video_path"]),
+        ]
+
+    async def process_pair(self, hook_file: str, kb_file: str, channel_name: str) -> Dict:
+        """Xử lý một cặp hook/KB theo DAG, trả về context.results (có 'video')"""
+        context = WorkflowContext(
+            workflow_name="workflow2",
+            file_path=kb_file,
+            channel_name=channel_name
+        )
+        context.results = {}
+        context.update_state('hook_file', hook_file)
+        context.update_state('kb_file', kb_file)
+
+        script_name = os.path.splitext(os.path.basename(hook_file))[0]
+        self._open_checkpoint(context, script_name.split('_Hook')[0])
+        context.register_artifact(hook_file, 'script')
+        return await run_dag(self.build_pair_steps(), context)
+
+    async def _step_hook_tts(self, context: WorkflowContext) -> Dict:
+        hook_context = context.for_file(context.get_state('hook_file'))
+        return {"hook_wav": await self.voice_service.synthesize(hook_context)}
+
+    async def _step_kb_tts(self, context: WorkflowContext) -> Dict:
+        kb_context = context.for_file(context.get_state('kb_file'))
+        return {"kb_wav": await self.voice_service.synthesize(kb_context)}
+
+    async def _step_thumbnail(self, context: WorkflowContext) -> Dict:
+        return await self.make_thumbnail(context.for_file(context.get_state('hook_file')))
+
+    async def _step_whisper(self, context: WorkflowContext) -> Dict:
+        kb_context = context.for_file(context.get_state('kb_file'))
+        return {"srt_file": await self.voice_service.transcribe(kb_context, context.get_state('kb_wav'))}
+
+    async def _step_video(self, context: WorkflowContext) -> Dict:
+        kb_context = context.for_file(context.get_state('kb_file'))
+        context.results['VoiceService'] = {
+            'wav_file': context.get_state('kb_wav'),
+            'srt_file': context.get_state('srt_file')
+        }
+        return await self.video_service.process(kb_context)
+
     async def process_kb(self, context: WorkflowContext) -> Dict:
         """Process KB file"""
         try:
+            script_name = os.path.splitext(os.path.basename(context.file_path))[0]
+            self._open_checkpoint(context, script_name.split('_KB')[0])
+
             # Lấy kết quả từ voice service
             voice_result = await self.voice_service.process(context)
             context.results['VoiceService'] = voice_result
@@ -119,6 +230,8 @@ class Workflow2(BaseService):
             raise
 
 app = FastAPI()
+# Video server gọi /video/callback khi task render xong
+app.include_router(video_callback_router)
 workflow = Workflow2()
 
 @app.on_event("startup")
@@ -9,79 +9,44 @@ import subprocess
 import re
 from typing import Dict, Optional
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.stage_gate import stage_gate
+from common.utils.file_transfer import copy_file, move_file
+from common.utils.artifact_manifest import ArtifactManifest, job_manifest
+from common.services.backend_pool import backend_pool
+from common.services.video_tasks import callback_url, status_poller
+from common.utils.http_client import get_client
 from ..config.workflow_paths import Workflow2Paths
 
 logger = logging.getLogger(__name__)
 
+STATUS_PATH = "/api/v1/hook/status/{task_id}"
+
 class VideoService(BaseService):
     def __init__(self, paths: Workflow2Paths):
         super().__init__()
         self.paths = paths
         self.api_url = paths.api_urls["video_api"]
         
-    def _move_files_to_final(self, working_dir: str, final_dir: str, prefix: str):
-        """Di chuyển tất cả file của prefix từ working sang final"""
+    def _move_files_to_final(self, manifest: ArtifactManifest, final_dir: str):
+        """Di chuyển các file đã ghi trong manifest của job (script, audio, srt, thumbnail...) sang final"""
         try:
-            # Lấy danh sách file trong working dir
-            files = os.listdir(working_dir)
-            
-            # Lọc các file có prefix cần di chuyển
-            prefix_files = [f for f in files if f.startswith(prefix)]
-            
-            # Di chuyển từng file
-            for file_name in prefix_files:
-                src = os.path.join(working_dir, file_name)
-                dst = os.path.join(final_dir, file_name)
-                logger.info(f"Moving {src} to {dst}")
-                shutil.move(src, dst)
-                
+            manifest.move_to(final_dir)
         except Exception as e:
             logger.error(f"Error moving files to final: {str(e)}")
             raise
-        
-    def _move_script_files(self, channel_paths: Dict[str, str], prefix: str, target_dir: str):
-        """Di chuyển các file script có prefix vào thư mục target (Completed hoặc Error)"""
-        try:
-            scripts_dir = channel_paths["scripts_dir"]
-            # Lấy danh sách file trong scripts dir
-            files = os.listdir(scripts_dir)
-            
-            # Lọc các file có prefix cần di chuyển
-            prefix_files = [f for f in files if f.startswith(prefix)]
-            
-            # Di chuyển từng file
-            for file_name in prefix_files:
-                src = os.path.join(scripts_dir, file_name)
-                dst = os.path.join(target_dir, file_name)
-                logger.info(f"Moving script {src} to {dst}")
-                shutil.move(src, dst)
-                
-        except Exception as e:
-            logger.error(f"Error moving script files: {str(e)}")
-            raise
 
-    def _handle_error(self, channel_paths: Dict[str, str], prefix: str, error_msg: str):
-        """Xử lý khi có lỗi: di chuyển tất cả file đã tạo vào Error"""
+    def _handle_error(self, channel_paths: Optional[Dict[str, str]], prefix: Optional[str], error_msg: str,
+                      manifest: Optional[ArtifactManifest]):
+        """Xử lý khi có lỗi: di chuyển các file trong manifest của job vào Error"""
+        if channel_paths is None or prefix is None:
+            # Lỗi trước khi xác định được channel/prefix: chưa có file nào của job để chuyển
+            return
         try:
-            # Di chuyển file từ working dir sang error dir
-            working_dir = channel_paths["working_dir"]
             error_dir = channel_paths["error_dir"]
-            
-            # Lấy danh sách file trong working dir
-            files = os.listdir(working_dir)
-            
-            # Lọc các file có prefix cần di chuyển
-            prefix_files = [f for f in files if f.startswith(prefix)]
-            
-            # Di chuyển từng file
-            for file_name in prefix_files:
-                src = os.path.join(working_dir, file_name)
-                dst = os.path.join(error_dir, file_name)
-                logger.info(f"Moving error file {src} to {dst}")
-                shutil.move(src, dst)
-            
-            # Di chuyển các file script vào Error
-            self._move_script_files(channel_paths, prefix, error_dir)
+            if manifest is not None:
+                manifest.move_to(error_dir)
+                # File đã ở Error, lần chạy lại ghi manifest mới (checkpoint đưa output cũ về Working)
+                manifest.clear()
             
             # Ghi log lỗi vào file trong error dir
             error_log = os.path.join(error_dir, f"{prefix}_error.log")
@@ -176,8 +141,118 @@ class VideoService(BaseService):
                     pass
             raise
 
+    async def _resume_task(self, client: httpx.AsyncClient, checkpoint, api_url: str) -> Optional[str]:
+        """Lấy task_id video đã submit ở lần chạy trước nếu task vẫn còn dùng được"""
+        in_flight = checkpoint.pending('video') if checkpoint else None
+        if not in_flight or not in_flight.get('task_id'):
+            return None
+
+        task_id = in_flight['task_id']
+        try:
+            response = await client.get(f"{api_url}{STATUS_PATH.format(task_id=task_id)}", timeout=30)
+            response.raise_for_status()
+            status = response.json().get("status")
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"Cannot re-attach to video task {task_id}, submitting a new one: {str(e)}")
+            checkpoint.discard('video')
+            return None
+
+        if status == "failed":
+            logger.info(f"Previous video task {task_id} failed, submitting a new one")
+            checkpoint.discard('video')
+            return None
+
+        logger.info(f"Re-attaching to in-flight video task {task_id} (status: {status})")
+        return task_id
+
+    def _prepare_input_folder(self, manifest: ArtifactManifest, input_folder: str):
+        """Tạo thư mục input riêng cho prefix bằng hardlink các output trong manifest (không tốn dung lượng)"""
+        shutil.rmtree(input_folder, ignore_errors=True)
+        os.makedirs(input_folder, exist_ok=True)
+        for src in manifest.files(exclude=('script',)):
+            copy_file(src, os.path.join(input_folder, os.path.basename(src)))
+
+    async def _render(self, form: Dict, checkpoint, prefix: str,
+                      manifest: ArtifactManifest, workflow_name: str) -> Dict:
+        """Submit (hoặc gắn lại) task video và poll đến khi render xong
+
+        Video server được chọn từ backend pool 'video' và giữ slot trong suốt lúc render;
+        task đã submit luôn được poll trên đúng server đã nhận nó (api_url trong checkpoint).
+        """
+        in_flight = checkpoint.pending('video') if checkpoint else None
+        pinned_url = in_flight.get('api_url', self.api_url) if in_flight and in_flight.get('task_id') else None
+
+        async with backend_pool('video', self.api_url).lease(pinned_url) as endpoint:
+            client = get_client()
+            api_url = endpoint.url
+            # Nếu lần chạy trước đã submit task video thì gắn lại vào task đó thay vì submit lại
+            task_id = await self._resume_task(client, checkpoint, api_url)
+            if not task_id:
+                logger.info(f"Sending request to {api_url}/api/v1/hook/batch/16_9")
+                self._prepare_input_folder(manifest, form['input_folder'])
+                response = await client.post(
+                    f"{api_url}/api/v1/hook/batch/16_9",
+                    data=form,
+                    headers={'Content-Type': 'application/x-www-form-urlencoded'},
+                    timeout=1800  # 30 phút
+                )
+                response.raise_for_status()
+                task_id = response.json()["task_id"]
+                logger.info(f"Got task_id: {task_id}")
+
+                if checkpoint:
+                    checkpoint.save('video', status=checkpoint.RUNNING, task_id=task_id, api_url=api_url)
+            
+            # Poller dùng chung của video server theo dõi mọi task đang render, poll thích ứng
+            # theo progress/ETA và poll ngay khi video server gọi callback
+            status_data = await status_poller(api_url, STATUS_PATH, workflow_name).wait(task_id, label=prefix)
+            if status_data["status"] == "failed":
+                error_msg = f"Video generation failed: {status_data.get('error', 'Unknown error')}"
+                logger.error(error_msg)
+                # Task lỗi thì lần chạy lại phải submit task mới
+                if checkpoint:
+                    checkpoint.discard('video')
+                shutil.rmtree(form['input_folder'], ignore_errors=True)
+                # process() chuyển file vào Error và ghi log lỗi (một lần)
+                raise Exception(error_msg)
+            return status_data
+
+    def _finalize(self, context: WorkflowContext, channel_paths: Dict[str, str], prefix: str,
+                  status_data: Dict, checkpoint) -> Dict:
+        """Chuyển file của prefix và video sang Final, ghi metadata (chạy trên thread)"""
+        final_dir = channel_paths["final_dir"]
+        manifest = context.get_state('manifest')
+        logger.info("Video processing completed, moving files to final")
+        # Di chuyển script và các file của job (theo manifest) sang final
+        self._move_files_to_final(manifest, final_dir)
+        
+        # Lấy tên video từ output_paths của API
+        if not status_data.get("output_paths"):
+            raise Exception("No output video path in API response")
+        video_name = os.path.basename(status_data["output_paths"][0])
+        final_video_path = os.path.join(self.paths.VIDEO_DIR, "final", video_name)
+        logger.info(f"Final video path: {final_video_path}")
+        
+        # Di chuyển video vào thư mục final của channel
+        channel_video_path = os.path.join(final_dir, video_name)
+        move_file(final_video_path, channel_video_path)
+        logger.info(f"Moved final video to channel's final directory: {channel_video_path}")
+        
+        # Thêm metadata cho video
+        hook_file = os.path.join(channel_paths["final_dir"], f"{prefix}_Hook.txt")
+        self._update_video_metadata(channel_video_path, hook_file, context.channel_name)
+        logger.info(f"Added metadata for video: {channel_video_path}")
+
+        # Job hoàn thành, không cần checkpoint nữa
+        if checkpoint:
+            checkpoint.clear()
+        manifest.clear()
+        
+        return {"video_path": channel_video_path}
+
     async def process(self, context: WorkflowContext) -> Dict:
         """Process video với timeout 30 minutes"""
+        channel_paths = prefix = manifest = None
         try:
             # Lấy kết quả từ voice service
             if not hasattr(context, 'results') or 'VoiceService' not in context.results:
@@ -193,6 +268,7 @@ class VideoService(BaseService):
             
             script_name = os.path.splitext(os.path.basename(context.file_path))[0]
             prefix = script_name.split('_KB')[0]
+            manifest = job_manifest(context, channel_paths["channel_dir"], prefix)
             
             # Load preset từ file
             preset_file = self.paths.get_preset_path(context.channel_name)
@@ -204,7 +280,8 @@ class VideoService(BaseService):
             
             # Chuẩn bị form data
             form = {
-                'input_folder': working_dir,
+                # Mỗi prefix render từ thư mục riêng để file của pair sau (đang TTS trong Working) không lọt vào batch
+                'input_folder': os.path.join(working_dir, f"_video_{prefix}"),
                 # Lấy 'preset_name' từ preset
                 'preset_name': preset_data['video_settings']['preset_name']
             }
@@ -219,71 +296,32 @@ class VideoService(BaseService):
             if bg_path:
                 form['bg_path'] = bg_path
 
-            logger.info(f"Sending request to {self.api_url}/api/v1/hook/batch/16_9")
+            # Video server gọi lại URL này khi task xong (nếu đã cấu hình), không phải chờ tới lần poll sau
+            task_callback = callback_url(context.workflow_name)
+            if task_callback:
+                form['callback_url'] = task_callback
+
             logger.info(f"Form data: {form}")
             
             # Gọi video API (form-urlencoded)
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_url}/api/v1/hook/batch/16_9",
-                    data=form,
-                    headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                    timeout=1800  # 30 phút
+            checkpoint = context.get_state('checkpoint')
+
+            # Chỉ một số video render cùng lúc (stage video), pair sau vẫn chạy TTS trong lúc chờ
+            async with stage_gate('video').slot(prefix):
+                status_data = await self._render(form, checkpoint, prefix, manifest, context.workflow_name)
+
+            # Render xong thì bỏ thư mục input riêng của prefix
+            shutil.rmtree(form['input_folder'], ignore_errors=True)
+
+            async with stage_gate('finalize').slot(prefix):
+                return await asyncio.to_thread(
+                    self._finalize, context, channel_paths, prefix, status_data, checkpoint
                 )
-                response.raise_for_status()
-                task_id = response.json()["task_id"]
-                logger.info(f"Got task_id: {task_id}")
-                
-                # Poll for task completion
-                while True:
-                    status_url = f"{self.api_url}/api/v1/hook/status/{task_id}"
-                    logger.info(f"Checking status at: {status_url}")
-                    status_response = await client.get(status_url, timeout=1800)
-                    status_response.raise_for_status()
-                    status_data = status_response.json()
-                    logger.info(f"Status response: {status_data}")
-                    
-                    if status_data["status"] == "completed":
-                        logger.info("Video processing completed, moving files to final")
-                        # Di chuyển tất cả file của prefix sang final
-                        self._move_files_to_final(working_dir, final_dir, prefix)
-                        
-                        # Di chuyển các file script vào Final
-                        self._move_script_files(channel_paths, prefix, final_dir)
-                        
-                        # Lấy tên video từ output_paths của API
-                        if not status_data.get("output_paths"):
-                            raise Exception("No output video path in API response")
-                        video_name = os.path.basename(status_data["output_paths"][0])
-                        final_video_path = os.path.join(self.paths.VIDEO_DIR, "final", video_name)
-                        logger.info(f"Final video path: {final_video_path}")
-                        
-                        # Di chuyển video vào thư mục final của channel
-                        channel_video_path = os.path.join(final_dir, video_name)
-                        shutil.move(final_video_path, channel_video_path)
-                        logger.info(f"Moved final video to channel's final directory: {channel_video_path}")
-                        
-                        # Thêm metadata cho video
-                        hook_file = os.path.join(channel_paths["final_dir"], f"{prefix}_Hook.txt")
-                        self._update_video_metadata(channel_video_path, hook_file, context.channel_name)
-                        logger.info(f"Added metadata for video: {channel_video_path}")
-                        
-                        return {"video_path": channel_video_path}
-                    
-                    elif status_data["status"] == "failed":
-                        error_msg = f"Video generation failed: {status_data.get('error', 'Unknown error')}"
-                        logger.error(error_msg)
-                        # Xử lý lỗi và di chuyển file vào Error
-                        self._handle_error(channel_paths, prefix, error_msg)
-                        raise Exception(error_msg)
-                        
-                    logger.info("Video still processing, waiting 15 minutes...")
-                    await asyncio.sleep(900)  # Wait 15 minutes before next poll
 
         except Exception as e:
             error_msg = f"Error processing video: {str(e)}"
             logger.error(error_msg)
             # Xử lý lỗi và di chuyển file vào Error
-            self._handle_error(channel_paths, prefix, error_msg)
+            self._handle_error(channel_paths, prefix, error_msg, manifest)
             raise
 
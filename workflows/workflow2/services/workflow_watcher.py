@@ -7,7 +7,6 @@ from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from typing import Dict, Optional, Set
-import shutil
 
 # Add root path to sys.path
 ROOT_PATH = str(Path(__file__).parent.parent.parent.parent)
@@ -15,6 +14,8 @@ if ROOT_PATH not in sys.path:
     sys.path.append(ROOT_PATH)
 
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.stage_gate import pipeline_config
+from common.utils.file_transfer import move_file
 from common.models.job import Job
 from ..config.workflow_paths import Workflow2Paths
 
@@ -115,6 +116,9 @@ class ScriptEventHandler(FileSystemEventHandler):
         self.processing_task = None
         self.processing_prefixes: Set[str] = set()
         self.loop = loop
+        # Số pair cùng lúc trong pipeline, mỗi stage còn có giới hạn riêng (stage_gate)
+        self.pair_slots = asyncio.Semaphore(pipeline_config()["max_pairs"])
+        self.pair_tasks: Set[asyncio.Task] = set()
         
         # Sử dụng loop để tạo task
         self.processing_task = self.loop.create_task(self._process_queue())
@@ -135,71 +139,74 @@ class ScriptEventHandler(FileSystemEventHandler):
         return bool(hook_files and kb_files)
         
     async def _process_queue(self):
-        """Xử lý queue theo thứ tự FIFO"""
+        """Lấy pair theo thứ tự FIFO và đưa vào pipeline"""
         while True:
             try:
                 # Lấy file pair từ queue
                 prefix, hook_file, kb_file = await self.processing_queue.get()
-                
-                try:
-                    # Kiểm tra xem prefix này đã được xử lý chưa
-                    async with self.processing_lock:
-                        if prefix in self.processing_prefixes:
-                            logger.info(f"Prefix {prefix} is already being processed")
-                            continue
-                        self.processing_prefixes.add(prefix)
-                    
-                    # Xử lý hook file trước
-                    hook_context = WorkflowContext(
-                        workflow_name="workflow2",
-                        file_path=hook_file,
-                        channel_name=self.channel_name
-                    )
-                    await self.workflow.process_hook(hook_context)
-                    
-                    # Sau đó xử lý kb file
-                    kb_context = WorkflowContext(
-                        workflow_name="workflow2",
-                        file_path=kb_file,
-                        channel_name=self.channel_name
-                    )
-                    await self.workflow.process(kb_context)
-                    
-                    # Di chuyển file đã xử lý sang thư mục completed
-                    channel_paths = self.workflow.paths.get_channel_paths(self.channel_name)
-                    completed_dir = channel_paths["completed_dir"]
-                    
-                    # Di chuyển hook file
-                    hook_filename = os.path.basename(hook_file)
-                    shutil.move(
-                        hook_file, 
-                        os.path.join(completed_dir, hook_filename)
-                    )
-                    
-                    # Di chuyển kb file
-                    kb_filename = os.path.basename(kb_file)
-                    shutil.move(
-                        kb_file, 
-                        os.path.join(completed_dir, kb_filename)
-                    )
-                    
-                    logger.info(f"Processed file pair: {prefix}")
-                
-                except Exception as e:
-                    logger.error(f"Error processing file pair {prefix}: {str(e)}")
-                
-                finally:
-                    # Luôn đảm bảo prefix được xóa khỏi danh sách
-                    async with self.processing_lock:
-                        self.processing_prefixes.discard(prefix)
-                    
-                    # Đánh dấu task trong queue đã hoàn thành
-                    self.processing_queue.task_done()
-                
+
+                # Chờ slot rồi chạy pair như một task riêng: pair sau vào stage voice
+                # trong khi pair trước đang render video
+                await self.pair_slots.acquire()
+                task = self.loop.create_task(self._run_pair(prefix, hook_file, kb_file))
+                self.pair_tasks.add(task)
+
             except Exception as e:
                 logger.error(f"Error in queue processing: {str(e)}")
                 await asyncio.sleep(1)  # Tránh busy loop
-    
+
+    async def _run_pair(self, prefix: str, hook_file: str, kb_file: str):
+        """Chạy một pair trong pipeline và trả slot khi xong"""
+        try:
+            await self._process_file_pair(prefix, hook_file, kb_file)
+        finally:
+            self.pair_slots.release()
+            self.pair_tasks.discard(asyncio.current_task())
+            # Đánh dấu task trong queue đã hoàn thành
+            self.processing_queue.task_done()
+
+    async def _process_file_pair(self, prefix: str, hook_file: str, kb_file: str):
+        """Xử lý một cặp file hook và kb"""
+        try:
+            # Kiểm tra xem prefix này đã được xử lý chưa
+            async with self.processing_lock:
+                if prefix in self.processing_prefixes:
+                    logger.info(f"Prefix {prefix} is already being processed")
+                    return
+                self.processing_prefixes.add(prefix)
+
+            try:
+                # Hook TTS, KB TTS và thumbnail chạy song song, Whisper rồi video chạy khi đủ input
+                await self.workflow.process_pair(hook_file, kb_file, self.channel_name)
+
+                # Di chuyển file đã xử lý sang thư mục completed
+                channel_paths = self.workflow.paths.get_channel_paths(self.channel_name)
+                completed_dir = channel_paths["completed_dir"]
+
+                # Di chuyển hook file
+                hook_filename = os.path.basename(hook_file)
+                move_file(
+                    hook_file,
+                    os.path.join(completed_dir, hook_filename)
+                )
+
+                # Di chuyển kb file
+                kb_filename = os.path.basename(kb_file)
+                move_file(
+                    kb_file,
+                    os.path.join(completed_dir, kb_filename)
+                )
+
+                logger.info(f"Processed file pair: {prefix}")
+
+            finally:
+                # Luôn đảm bảo prefix được xóa khỏi danh sách
+                async with self.processing_lock:
+                    self.processing_prefixes.discard(prefix)
+
+        except Exception as e:
+            logger.error(f"Error processing file pair {prefix}: {str(e)}")
+
     def on_created(self, event):
         """Xử lý khi có file mới được tạo"""
         if event.is_directory:
@@ -1,20 +1,28 @@
 import os
 import json
-import httpx
 import logging
 import time
 import shutil
 from typing import Dict, Optional
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.checkpoint import file_digest
+from common.utils.stage_gate import stage_gate
 from ..config.workflow_paths import Workflow3Paths
+from common.utils.http_client import request_timeout
+from common.services.backend_pool import backend_pool
+from common.utils.chunked_tts import tts_config, use_chunking, synthesize_chunked
+from common.utils.wav_utils import chunk_timings_path, load_chunk_timings
+from common.utils.aligned_srt import align_script
+from common.utils.tts_cache import cache_key, cache_namespace, tts_cache
+from common.utils.srt_builder import build_cues, load_words, save_words, words_from_srt, write_srt
 import subprocess
-import requests
 import asyncio
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+# max_chars khi lấy word timestamps, đủ lớn để Whisper không cắt giữa một từ
+WORD_SRT_MAX_CHARS = 1000
+
 class VoiceService(BaseService):
     def __init__(self, paths: Workflow3Paths):
         super().__init__()
@@ -23,16 +31,10 @@ class VoiceService(BaseService):
         self.tts_timeout = paths.TTS_API_TIMEOUT
         self.whisper_url = paths.WHISPER_SERVER_URL
         self.whisper_timeout = paths.WHISPER_API_TIMEOUT
-        
-        # Setup session with retry mechanism
-        self.session = requests.Session()
-        retries = Retry(
-            total=5,  # số lần retry tối đa
-            backoff_factor=1,  # thời gian chờ giữa các lần retry (1s, 2s, 4s, 8s, 16s)
-            status_forcelist=[500, 502, 503, 504],  # retry với các status code này
-            allowed_methods=["POST", "GET"]  # cho phép retry với các method này
-        )
-        self.session.mount('http://', HTTPAdapter(max_retries=retries))
+
+        # Retry cho Whisper API qua backend pool (common/services/backend_pool.py)
+        self.whisper_retries = 5  # số lần retry tối đa
+        self.whisper_backoff = 1  # thời gian chờ giữa các lần retry (1s, 2s, 4s, 8s, 16s)
 
     def _load_preset(self, channel_name: str):
         """
@@ -90,11 +92,11 @@ class VoiceService(BaseService):
     async def _generate_tts(self, text_file: str, output_dir: str, output_filename: str, voice_config: Dict) -> str:
         """Generate TTS using new API endpoint"""
         try:
-            # Prepare multipart form data
-            files = {
-                'file': ('input.txt', open(text_file, 'rb'), 'text/plain')
-            }
-            
+            # Prepare multipart form data, file được stream từ đĩa và mở lại cho mỗi lần gửi
+            def build_files():
+                handle = open(text_file, 'rb')
+                return {'files': {'file': ('input.txt', handle, 'text/plain')}}, handle.close
+
             data = {
                 'voice': voice_config.get('voice', 'am_adam'),
                 'speed': voice_config.get('speed', '1'),
@@ -102,12 +104,14 @@ class VoiceService(BaseService):
                 'output_filename': output_filename
             }
 
-            # Call TTS API
-            response = requests.post(
-                f"{self.tts_url}/tts",
-                files=files,
+            # Call TTS API (async) trên TTS server ít request nhất của pool
+            response = await backend_pool('tts', self.tts_url).request(
+                "POST",
+                "/tts",
+                build=build_files,
                 data=data,
-                timeout=self.tts_timeout
+                size=os.path.getsize(text_file),
+                timeout=request_timeout(self.tts_timeout)
             )
             response.raise_for_status()
             
@@ -127,66 +131,96 @@ class VoiceService(BaseService):
             raise
 
     async def _generate_srt(self, wav_file: str, text_content: str, channel_name: str = None) -> str:
-        """Generate SRT using whisper API with configurable options"""
-        max_retries = 3
-        retry_delay = 2  # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                # Get channel config if available
-                whisper_settings = {}
-                if channel_name:
-                    preset = self._load_preset(channel_name)
-                    if preset:
-                        whisper_settings = preset.get('whisper_settings', {})
-
-                # Prepare output directory and filename
-                output_dir = os.path.dirname(wav_file)
-                filename = os.path.splitext(os.path.basename(wav_file))[0]
-
-                # Prepare request data
-                data = {
-                    "file_path": wav_file,
-                    "output_path": output_dir,
-                    "filename": filename,
-                    "words_per_segment": whisper_settings.get('words_per_segment', 2),
-                    "max_chars": whisper_settings.get('max_chars', 80)
-                }
-                
-                logger.info(f"Whisper SRT generation settings: {data}")  # Add logging to verify settings
+        """Generate SRT: word timestamps từ Whisper (cache theo audio) hoặc từ script (srt_mode "aligned"),
+        cắt cue theo whisper_settings tại chỗ"""
+        # Get channel config if available
+        whisper_settings = {}
+        if channel_name:
+            preset = self._load_preset(channel_name)
+            if preset:
+                # _load_preset đã trả về whisper_settings của preset
+                whisper_settings = preset
 
-                # Call whisper API to generate SRT using session with retry
-                response = self.session.post(
-                    f"{self.whisper_url}/to_srt/",
-                    json=data,
-                    timeout=self.whisper_timeout
-                )
-                response.raise_for_status()
-                
-                # Get result
-                result = response.json()
-                if result.get('status') != 'success':
-                    raise Exception(f"Whisper API error: {result.get('message', 'Unknown error')}")
-
-                # Get the SRT file path
-                srt_file = os.path.join(output_dir, f"{filename}.srt")
-                if not os.path.exists(srt_file):
-                    raise FileNotFoundError(f"Generated SRT file not found at {srt_file}")
-
-                return srt_file
-
-            except requests.exceptions.ConnectionError as e:
-                logger.warning(f"Connection error on attempt {attempt + 1}/{max_retries}: {str(e)}")
-                if attempt < max_retries - 1:
-                    logger.info(f"Retrying in {retry_delay} seconds...")
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    logger.error("Max retries exceeded. Please check if Whisper server is running.")
-                    raise
-            except Exception as e:
-                logger.error(f"Error generating SRT: {str(e)}")
-                raise
+        # Prepare output directory and filename
+        output_dir = os.path.dirname(wav_file)
+        filename = os.path.splitext(os.path.basename(wav_file))[0]
+        words_per_segment = whisper_settings.get('words_per_segment', 2)
+        max_chars = whisper_settings.get('max_chars', 80)
+        logger.info(f"SRT segmentation settings for {filename}: "
+                    f"words_per_segment={words_per_segment}, max_chars={max_chars}")
+
+        try:
+            if whisper_settings.get('srt_mode', 'whisper') == 'aligned':
+                # Audio TTS từ script đã biết: chia từ theo timing chunk và khoảng im lặng, không cần Whisper
+                words = await asyncio.to_thread(align_script, wav_file, text_content, load_chunk_timings(wav_file))
+            else:
+                async with stage_gate('whisper').slot(filename):
+                    words_file = await self._transcribe_words(wav_file)
+                words = load_words(words_file)
+            cues = build_cues(words, words_per_segment, max_chars)
+            return write_srt(cues, os.path.join(output_dir, f"{filename}.srt"))
+        except Exception as e:
+            logger.error(f"Error generating SRT: {str(e)}")
+            raise
+
+    async def _transcribe_words(self, wav_file: str) -> str:
+        """Word timestamps của audio qua Whisper (words_per_segment=1), cache theo hash audio
+
+        Returns:
+            str: File {filename}.words.json cạnh file wav
+        """
+        output_dir = os.path.dirname(wav_file)
+        filename = os.path.splitext(os.path.basename(wav_file))[0]
+        words_file = os.path.join(output_dir, f"{filename}.words.json")
+        if os.path.exists(words_file):
+            os.remove(words_file)  # có thể là hardlink tới cache
+
+        cache = tts_cache()
+        whisper_pool = backend_pool('whisper', self.whisper_url)
+        key = cache_key(kind='whisper_words', audio=await asyncio.to_thread(file_digest, wav_file),
+                        namespace=cache_namespace())
+        if cache and await asyncio.to_thread(cache.get, key, {'words.json': words_file}):
+            return words_file
+
+        # Mỗi cue một từ, Whisper ghi ra {filename}.words.srt
+        data = {
+            "file_path": wav_file,
+            "output_path": output_dir,
+            "filename": f"{filename}.words",
+            "words_per_segment": 1,
+            "max_chars": WORD_SRT_MAX_CHARS
+        }
+        logger.info(f"Whisper word timestamps request: {data}")
+
+        # Pool tự retry lỗi kết nối theo whisper_retries/whisper_backoff trên Whisper server
+        # ít request nhất (circuit mở thì raise BackendUnavailable ngay, không retry tiếp)
+        response = await whisper_pool.request(
+            "POST",
+            "/to_srt/",
+            retries=self.whisper_retries,
+            backoff_factor=self.whisper_backoff,
+            json=data,
+            size=os.path.getsize(wav_file),
+            timeout=request_timeout(self.whisper_timeout)
+        )
+        response.raise_for_status()
+
+        # Get result
+        result = response.json()
+        if result.get('status') != 'success':
+            raise Exception(f"Whisper API error: {result.get('message', 'Unknown error')}")
+
+        word_srt = os.path.join(output_dir, f"{filename}.words.srt")
+        if not os.path.exists(word_srt):
+            raise FileNotFoundError(f"Generated SRT file not found at {word_srt}")
+        with open(word_srt, 'r', encoding='utf-8') as f:
+            words = words_from_srt(f.read())
+        os.remove(word_srt)
+
+        save_words(words, words_file)
+        if cache:
+            await asyncio.to_thread(cache.put, key, {'words.json': words_file})
+        return words_file
 
     def _format_timestamp(self, seconds: float) -> str:
         """Format seconds to SRT timestamp format (HH:MM:SS,mmm)"""
@@ -195,43 +229,140 @@ class VoiceService(BaseService):
         seconds = seconds % 60
         return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}".replace('.', ',')
 
+    async def _tts_stage(self, context: WorkflowContext, stage: str, output_dir: str,
+                         output_filename: str, voice_config: Dict) -> str:
+        """Generate TTS, skipped when the checkpoint already has the wav for this script and voice"""
+        checkpoint = context.get_state('checkpoint')
+        params = {
+            'text': file_digest(context.file_path),
+            'voice': voice_config.get('voice', 'am_adam'),
+            'speed': voice_config.get('speed', '1'),
+            'output_filename': output_filename
+        }
+        with open(context.file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        config = tts_config()
+        chunked = use_chunking(text, config)
+        if chunked:
+            params.update({
+                'chunk_chars': config['chunk_chars'],
+                'chunk_silence_ms': config['chunk_silence_ms']
+            })
+
+        done = checkpoint.load(stage, params) if checkpoint else None
+        if done:
+            context.register_artifact(done['wav_file'], 'audio')
+            context.register_artifact(done.get('chunks_file'), 'data')
+            return done['wav_file']
+
+        wav_file = os.path.join(output_dir, output_filename)
+        chunks_file = chunk_timings_path(wav_file)
+        cache = tts_cache()
+        key = cache_key(kind='tts', namespace=cache_namespace(),
+                        **{name: value for name, value in params.items() if name != 'output_filename'})
+        cache_files = {'audio.wav': wav_file, 'chunks.json': chunks_file} if chunked else {'audio.wav': wav_file}
+
+        # Bỏ output của lần chạy trước: timing chunk cũ và hardlink tới cache (TTS ghi đè sẽ làm hỏng cache)
+        for path in (wav_file, chunks_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+        if cache and await asyncio.to_thread(cache.get, key, cache_files):
+            pass
+        elif chunked:
+            # Script dài: TTS từng chunk song song (mỗi chunk một slot voice) rồi nối lại
+            async def synthesize(text_file, chunk_dir, chunk_name):
+                return await self._generate_tts(text_file, chunk_dir, chunk_name, voice_config)
+
+            await synthesize_chunked(
+                text, os.path.join(output_dir, f"_chunks_{os.path.splitext(output_filename)[0]}"), wav_file,
+                synthesize,
+                chunk_chars=int(config['chunk_chars']), silence_ms=int(config['chunk_silence_ms']),
+                label=output_filename, params=voice_config
+            )
+            if cache:
+                await asyncio.to_thread(cache.put, key, cache_files)
+        else:
+            async with stage_gate('voice').slot(output_filename):
+                wav_file = await self._generate_tts(
+                    text_file=context.file_path,
+                    output_dir=output_dir,
+                    output_filename=output_filename,
+                    voice_config=voice_config
+                )
+            if cache:
+                await asyncio.to_thread(cache.put, key, {'audio.wav': wav_file})
+
+        if checkpoint:
+            files = {'wav_file': wav_file, 'chunks_file': chunks_file} if chunked else {'wav_file': wav_file}
+            checkpoint.save(stage, params=params, files=files)
+        context.register_artifact(wav_file, 'audio')
+        if chunked:
+            context.register_artifact(chunks_file, 'data')
+        return wav_file
+
+    async def _srt_stage(self, context: WorkflowContext, wav_file: str, text_content: str) -> str:
+        """Generate SRT, skipped when the checkpoint already has it for this wav and whisper settings"""
+        checkpoint = context.get_state('checkpoint')
+        params = {
+            'wav_file': wav_file,
+            'wav_mtime': os.path.getmtime(wav_file),
+            'whisper_settings': self._load_preset(context.channel_name) or {}
+        }
+        # Word timestamps của Whisper nằm cạnh wav, cũng là file của job
+        words_file = f"{os.path.splitext(wav_file)[0]}.words.json"
+        done = checkpoint.load('whisper', params) if checkpoint else None
+        if done:
+            context.register_artifact(done['srt_file'], 'subtitle')
+            context.register_artifact(words_file, 'data')
+            return done['srt_file']
+
+        srt_file = await self._generate_srt(wav_file, text_content, context.channel_name)
+        if checkpoint:
+            checkpoint.save('whisper', params=params, files={'srt_file': srt_file})
+        context.register_artifact(srt_file, 'subtitle')
+        context.register_artifact(words_file, 'data')
+        return srt_file
+
+    async def synthesize(self, context: WorkflowContext) -> str:
+        """TTS cho file hook ({prefix}_hook.wav) hoặc KB ({prefix}_audio.wav)"""
+        script_name = os.path.splitext(os.path.basename(context.file_path))[0]
+        is_hook = '_Hook' in script_name
+        prefix = script_name.split('_Hook')[0] if is_hook else script_name.split('_KB')[0]
+
+        channel_paths = self.paths.get_channel_paths(context.channel_name)
+        working_dir = str(channel_paths["working_dir"])
+
+        voice_config = self._load_preset(context.channel_name)
+        if not voice_config:
+            logger.warning(f"No preset found for channel {context.channel_name}, using default config")
+            voice_config = {'voice': 'am_adam', 'speed': '1'}
+
+        wav_target = f"{prefix}_hook.wav" if is_hook else f"{prefix}_audio.wav"
+        stage = 'hook_tts' if is_hook else 'kb_tts'
+        return await self._tts_stage(context, stage, working_dir, wav_target, voice_config)
+
+    async def transcribe(self, context: WorkflowContext, wav_file: str) -> str:
+        """Tạo SRT cho audio KB bằng Whisper"""
+        with open(context.file_path, 'r', encoding='utf-8') as f:
+            text_content = f.read()
+        return await self._srt_stage(context, wav_file, text_content)
+
     async def process_hook(self, context: WorkflowContext) -> Dict:
         """Process hook file"""
         try:
-            logger.info(f"Starting voice process for KB file: {context.file_path}")
+            logger.info(f"Starting voice process for hook file: {context.file_path}")
             
             # Initialize results if not exists
             if not hasattr(context, 'results'):
                 context.results = {}
             
-            # Get file paths and configs
-            script_name = os.path.splitext(os.path.basename(context.file_path))[0]
-            prefix = script_name.split('_Hook')[0] if '_Hook' in script_name else script_name.split('_KB')[0]
-            
-            channel_paths = self.paths.get_channel_paths(context.channel_name)
-            working_dir = str(channel_paths["working_dir"])
-            
-            # Load voice config
-            voice_config = self._load_preset(context.channel_name)
-            if not voice_config:
-                logger.warning(f"No preset found for channel {context.channel_name}, using default config")
-                voice_config = {'voice': 'am_adam', 'speed': '1'}
-            
-            # Generate TTS
-            wav_target = f"{prefix}_hook.wav" if '_Hook' in script_name else f"{prefix}_audio.wav"
-            wav_file = await self._generate_tts(
-                text_file=context.file_path,
-                output_dir=working_dir,
-                output_filename=wav_target,
-                voice_config=voice_config
-            )
+            wav_file = await self.synthesize(context)
             
             # Only generate SRT for _audio files, not _hook files
             srt_file = None
-            if '_KB' in script_name:  # Only for main audio files
-                with open(context.file_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                srt_file = await self._generate_srt(wav_file, text_content, context.channel_name)
+            if '_KB' in os.path.basename(context.file_path):  # Only for main audio files
+                srt_file = await self.transcribe(context, wav_file)
 
             return {
                 'wav_file': wav_file,
@@ -239,7 +370,7 @@ class VoiceService(BaseService):
             }
 
         except Exception as e:
-            logger.error(f"Error processing KB file: {str(e)}")
+            logger.error(f"Error processing hook file: {str(e)}")
             raise
 
     async def process(self, context: WorkflowContext) -> Dict:
@@ -249,36 +380,10 @@ class VoiceService(BaseService):
         try:
             if not hasattr(context, 'results'):
                 context.results = {}
-            
-            # Get file paths
-            channel_paths = self.paths.get_channel_paths(context.channel_name)
-            working_dir = str(channel_paths["working_dir"])
-            script_name = os.path.splitext(os.path.basename(context.file_path))[0]
-            prefix = script_name.split('_KB')[0]
-
-            # Define target paths
-            wav_target = f"{prefix}_audio.wav"
-            srt_target = f"{prefix}.srt"
-
-            # Load voice config
-            voice_config = self._load_preset(context.channel_name)
-            if not voice_config:
-                logger.warning(f"No preset found for channel {context.channel_name}, using default config")
-                voice_config = {'voice': 'am_adam', 'speed': '1'}
-
-            # Generate TTS with final filename
-            wav_file = await self._generate_tts(
-                text_file=context.file_path,
-                output_dir=working_dir,
-                output_filename=wav_target,
-                voice_config=voice_config
-            )
 
-            # Generate SRT using whisper
-            with open(context.file_path, 'r', encoding='utf-8') as f:
-                text_content = f.read()
-            
-            srt_file = await self._generate_srt(wav_file, text_content, context.channel_name)
+            # Generate TTS with final filename, then SRT using whisper
+            wav_file = await self.synthesize(context)
+            srt_file = await self.transcribe(context, wav_file)
 
             return {
                 'wav_file': wav_file,
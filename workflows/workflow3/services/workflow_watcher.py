@@ -17,6 +17,7 @@ if ROOT_PATH not in sys.path:
     sys.path.append(ROOT_PATH)
 
 from common.utils.base_service import BaseService, WorkflowContext
+from common.utils.stage_gate import pipeline_config
 from common.models.job import Job
 from ..config.workflow_paths import Workflow3Paths
 
@@ -124,6 +125,9 @@ class ScriptEventHandler(FileSystemEventHandler):
         self.processing_lock = asyncio.Lock()  # Lock để tránh xử lý đồng thời
         self.processing_queue = asyncio.Queue()  # Queue để xử lý theo thứ tự FIFO
         self.processing_task = None  # Task xử lý queue
+        # Số pair cùng lúc trong pipeline, mỗi stage còn có giới hạn riêng (stage_gate)
+        self.pair_slots = asyncio.Semaphore(pipeline_config()["max_pairs"])
+        self.pair_tasks: Set[asyncio.Task] = set()
 
     def on_created(self, event):
         """Xử lý khi có file mới được tạo"""
@@ -240,21 +244,31 @@ class ScriptEventHandler(FileSystemEventHandler):
             while True:
                 # Lấy cặp file tiếp theo từ queue
                 prefix, hook_file, kb_file = await self.processing_queue.get()
-                
-                try:
-                    # Xử lý cặp file
-                    await self._process_file_pair(prefix, hook_file, kb_file)
-                except Exception as e:
-                    logger.error(f"Error processing file pair from queue: {str(e)}")
-                finally:
-                    # Đánh dấu task hoàn thành
-                    self.processing_queue.task_done()
+
+                # Chờ slot rồi chạy pair như một task riêng: pair sau vào stage voice
+                # trong khi pair trước đang render video
+                await self.pair_slots.acquire()
+                task = self.loop.create_task(self._run_pair(prefix, hook_file, kb_file))
+                self.pair_tasks.add(task)
                     
         except asyncio.CancelledError:
             logger.info("Queue processing task cancelled")
         except Exception as e:
             logger.error(f"Error in queue processing loop: {str(e)}")
 
+    async def _run_pair(self, prefix: str, hook_file: str, kb_file: str):
+        """Chạy một pair trong pipeline và trả slot khi xong"""
+        try:
+            # Xử lý cặp file
+            await self._process_file_pair(prefix, hook_file, kb_file)
+        except Exception as e:
+            logger.error(f"Error processing file pair from queue: {str(e)}")
+        finally:
+            self.pair_slots.release()
+            self.pair_tasks.discard(asyncio.current_task())
+            # Đánh dấu task hoàn thành
+            self.processing_queue.task_done()
+
     async def _process_file_pair(self, prefix: str, hook_file: str, kb_file: str):
         """Xử lý cặp file hook và kb"""
         try:
@@ -269,21 +283,8 @@ class ScriptEventHandler(FileSystemEventHandler):
             kb_file = str(kb_file)
             
             if os.path.exists(hook_file) and os.path.exists(kb_file):
-                # Xử lý hook file trước
-                hook_context = WorkflowContext(
-                    workflow_name="workflow3",
-                    file_path=hook_file,
-                    channel_name=self.channel_name
-                )
-                await self.workflow.process_hook(hook_context)
-                
-                # Sau đó xử lý kb file
-                kb_context = WorkflowContext(
-                    workflow_name="workflow3",
-                    file_path=kb_file,
-                    channel_name=self.channel_name
-                )
-                await self.workflow.process_kb(kb_context)  # Gọi process_kb thay vì process
+                # Hook TTS, KB TTS và thumbnail chạy song song, Whisper rồi video chạy khi đủ input
+                await self.workflow.process_pair(hook_file, kb_file, self.channel_name)
                 
                 logger.info(f"Successfully processed file pair with prefix {prefix}")
                 